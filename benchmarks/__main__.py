@@ -0,0 +1,99 @@
+"""Run the offline benchmarks and write the results as JSON.
+
+    $ python -m benchmarks -o before.json
+    $ python -m benchmarks -o after.json --compare before.json
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+
+import dscraper
+
+from . import micro
+
+PARAMS = {
+    'comments': 20000,
+    'maxlimit': 1000,
+    'roll_dates': 40,
+    'protected': 0.01,
+    'title': 0.002,
+    'code': 0.001,
+    'invalid': 0.01,
+    'seed': 0,
+    'targets': 10 ** 7,
+}
+QUICK = {'comments': 3000, 'maxlimit': 500, 'roll_dates': 8, 'targets': 10 ** 5}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--output', metavar='path', help='file to write the results to')
+    parser.add_argument('-c', '--compare', metavar='path', help='results of an earlier run to compare with')
+    parser.add_argument('-k', metavar='name', dest='names', action='append', default=[],
+                        help='run only benchmarks whose names contain this. Can be specified multiple times')
+    parser.add_argument('--repeat', type=int, default=5, help='times each benchmark is run (default: %(default)s)')
+    parser.add_argument('--quick', default=False, action='store_true',
+                        help='use a small CID and 10^5 targets, to check the benchmarks work')
+    for name, default in PARAMS.items():
+        parser.add_argument('--' + name.replace('_', '-'), type=type(default), default=None,
+                            help='default: {}'.format(default))
+    return parser.parse_args()
+
+
+def get_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(params, results, baseline):
+    print('\n{:<16} {:>12} {:>12} {:>8}'.format('benchmark', 'before', 'after', 'change'))
+    for name, result in results.items():
+        before = baseline['results'].get(name, {})
+        if 'per_op_us' not in result or 'per_op_us' not in before:
+            continue
+        print('{:<16} {:>10.2f}us {:>10.2f}us {:>+7.1f}%'.format(
+            name, before['per_op_us'], result['per_op_us'],
+            (result['per_op_us'] / before['per_op_us'] - 1) * 100))
+    if baseline['params'] != params:
+        print('Warning: the parameters differ from those of the baseline')
+
+
+def main():
+    args = parse_args()
+    params = dict(PARAMS)
+    if args.quick:
+        params.update(QUICK)
+    for name in PARAMS:
+        value = getattr(args, name)
+        if value is not None:
+            params[name] = value
+
+    print('dscraper {} ({}), Python {}'.format(dscraper.__version__, get_revision() or 'unknown revision',
+                                               platform.python_version()))
+    results = micro.run(params, args.names, args.repeat)
+    report = {
+        'version': dscraper.__version__,
+        'revision': get_revision(),
+        'python': sys.version,
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'params': params,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as fout:
+            json.dump(report, fout, indent=2)
+    if args.compare:
+        with open(args.compare) as fin:
+            compare(params, results, json.load(fin))
+
+
+if __name__ == '__main__':
+    main()
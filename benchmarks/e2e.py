@@ -0,0 +1,224 @@
+"""Benchmark the whole scraper end to end, from the Scraper down to the exporter,
+against a simulated host on localhost, sweeping the numbers of workers, the
+exporters and whether history is scraped.
+
+    $ python -m benchmarks.e2e -o e2e.json
+    $ python -m benchmarks.e2e --workers 6 12 --exporters jsonl sqlite --rtt 0.1 --rate-limit 50
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import timezone
+
+import dscraper
+from dscraper.tracing import tracer
+
+from .__main__ import get_revision
+from .synthetic import SyntheticCid
+from .upstream import SimulatedHost
+
+EXPORTERS = ('null', 'file', 'jsonl', 'csv', 'sqlite', 'dedup', 'archive', 'columns')
+PARAMS = {
+    'targets': 300,
+    'comments': 1000,
+    'maxlimit': 1000,
+    'roll_dates': 10,
+    'pool': 6,
+    'rtt': 0.02,
+    'bandwidth': None,
+    'error_rate': 0.0,
+    'rate_limit': None,
+    'burst': 10,
+    'missing': 0.1,
+    'interval': 0.0,
+    'export_queue': 32,
+    'retries': 0,  # targets failed are retried after BlockingDistributor.RETRY_BACKOFF
+}
+SWEEP = {'workers': [1, 6, 24], 'exporters': ['null', 'jsonl', 'file'], 'history': [True, False]}
+QUICK = {'targets': 30, 'comments': 300, 'roll_dates': 4}
+QUICK_SWEEP = {'workers': [6], 'exporters': ['null'], 'history': [True]}
+
+
+class _Discard:
+    """A stream to nowhere, for the null exporter to only serialize."""
+
+    def write(self, text):
+        return len(text)
+
+
+def make_exporter(name, path, loop):
+    if name == 'null':
+        return dscraper.StreamExporter(_Discard(), loop=loop)
+    if name == 'file':
+        return dscraper.FileExporter(path, loop=loop)
+    if name == 'jsonl':
+        return dscraper.JsonLinesExporter(path, loop=loop)
+    if name == 'csv':
+        return dscraper.CsvExporter(path, loop=loop)
+    if name == 'sqlite':
+        return dscraper.SqliteExporter(path, loop=loop)
+    if name == 'dedup':
+        return dscraper.DedupExporter(path, loop=loop)
+    if name == 'archive':
+        return dscraper.ArchiveExporter(path, loop=loop)
+    if name == 'columns':
+        return dscraper.ColumnarExporter(path, loop=loop)
+    raise ValueError('unknown exporter: {}'.format(name))
+
+
+def off_peak(interval):
+    """Return a time config of the same interval all day, whose rush hour is half a
+    day away, so that the company does not cut down workers during a run, and the
+    results do not depend on the time of the day.
+    """
+    start = (time.gmtime().tm_hour + 12) % 24
+    return interval, interval, start, (start + 1) % 24, timezone.utc
+
+
+def make_pool(params):
+    """Make CIDs of sizes growing by 2 times around params['comments'], so that
+    about half of them have history with the default maxlimit.
+    """
+    size = params['pool']
+    return [SyntheticCid(i, int(params['comments'] * 2 ** (i - size // 2)), params['maxlimit'],
+                         params['roll_dates'], seed=i) for i in range(size)]
+
+
+def run_one(params, pool, workers, exporter, history):
+    """Scrape params['targets'] CIDs from a new simulated host with a new loop.
+
+    :return dict: the throughput and latency of the run
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    path = tempfile.mkdtemp(prefix='dscraper-e2e-')
+    host = SimulatedHost(pool, params['rtt'], params['bandwidth'], params['error_rate'],
+                         params['rate_limit'], params['burst'], params['missing'], loop=loop)
+    try:
+        loop.run_until_complete(host.start())
+        time_config = off_peak(params['interval'])
+        scraper = dscraper.Scraper(make_exporter(exporter, path, loop), history,
+                                   max_workers=workers, retries=params['retries'],
+                                   export_queue=params['export_queue'],
+                                   trace=True, address=host.address, time_config=time_config,
+                                   loop=loop)
+        scraper.add_range(1, params['targets'])
+        start = time.perf_counter()
+        loop.run_until_complete(scraper.async_run())
+        elapsed = time.perf_counter() - start
+        company = scraper.get_stats()['companies'][0]
+        scrape = tracer.histograms['scrape']
+        return {
+            'elapsed': elapsed,
+            'cids': tracer.counters['cids'],
+            'finished': company['finished'],
+            'failed': company['failed'],
+            'errors': company['errors'],
+            'requests': tracer.counters['requests'],
+            'bytes_in': tracer.counters['bytes_in'],
+            'cids_per_s': company['finished'] / elapsed,
+            'requests_per_s': tracer.counters['requests'] / elapsed,
+            'mb_per_s': tracer.counters['bytes_in'] / elapsed / 2 ** 20,
+            'latency_ms': {'p{}'.format(q): scrape.percentile(q) * 1e3 for q in (50, 95, 99)},
+            'host': dict(host.stats),
+        }
+    finally:
+        loop.run_until_complete(host.close())
+        loop.close()
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def run(params, sweep, log=print):
+    """Run every combination of the sweep. A combination failing is recorded with
+    its error and does not stop the others.
+
+    :return [dict]:
+    """
+    pool = make_pool(params)
+    log('{:>7} {:<8} {:<7} {:>8} {:>9} {:>7} {:>8} {:>8} {:>8} {:>7} {:>6} {:>8}'.format(
+        'workers', 'exporter', 'history', 'CIDs/s', 'req/s', 'MB/s', 'p50 ms', 'p95 ms', 'p99 ms',
+        'dropped', 'failed', 'time'))
+    results = []
+    for workers, exporter, history in itertools.product(sweep['workers'], sweep['exporters'],
+                                                        sweep['history']):
+        result = {'workers': workers, 'exporter': exporter, 'history': history}
+        try:
+            result.update(run_one(params, pool, workers, exporter, history))
+        except Exception as e:
+            result['error'] = '{}: {}'.format(type(e).__name__, e)
+            log('{:>7} {:<8} {!s:<7} failed: {}'.format(workers, exporter, history, result['error']))
+        else:
+            host = result['host']
+            log('{:>7} {:<8} {!s:<7} {:>8.1f} {:>9.1f} {:>7.2f} {:>8.1f} {:>8.1f} {:>8.1f} {:>7} {:>6} {:>7.1f}s'.format(
+                workers, exporter, history, result['cids_per_s'], result['requests_per_s'],
+                result['mb_per_s'], result['latency_ms']['p50'], result['latency_ms']['p95'],
+                result['latency_ms']['p99'], host['dropped'] + host['throttled'], result['failed'],
+                result['elapsed']))
+        results.append(result)
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.e2e', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--output', metavar='path', help='file to write the results to')
+    parser.add_argument('--workers', type=int, nargs='+', default=None,
+                        help='numbers of workers (default: {})'.format(SWEEP['workers']))
+    parser.add_argument('--exporters', nargs='+', choices=EXPORTERS, default=None,
+                        help='default: {}'.format(SWEEP['exporters']))
+    parser.add_argument('--history', choices=['on', 'off', 'both'], default=None,
+                        help='whether scrape history (default: both)')
+    parser.add_argument('--quick', default=False, action='store_true',
+                        help='scrape a few small CIDs once, to check the harness works')
+    parser.add_argument('-v', '--verbose', default=False, action='store_true',
+                        help='show the logs of the scraper')
+    for name, default in PARAMS.items():
+        parser.add_argument('--' + name.replace('_', '-'), type=float if default is None else type(default),
+                            default=None, help='default: {}'.format(default))
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    params, sweep = dict(PARAMS), dict(SWEEP)
+    if args.quick:
+        params.update(QUICK)
+        sweep.update(QUICK_SWEEP)
+    for name in PARAMS:
+        value = getattr(args, name)
+        if value is not None:
+            params[name] = value
+    if args.workers:
+        sweep['workers'] = args.workers
+    if args.exporters:
+        sweep['exporters'] = args.exporters
+    if args.history:
+        sweep['history'] = {'on': [True], 'off': [False], 'both': [True, False]}[args.history]
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+
+    print('dscraper {} ({}), Python {}'.format(dscraper.__version__, get_revision() or 'unknown revision',
+                                               platform.python_version()))
+    results = run(params, sweep)
+    if args.output:
+        with open(args.output, 'w') as fout:
+            json.dump({
+                'version': dscraper.__version__,
+                'revision': get_revision(),
+                'python': sys.version,
+                'platform': platform.platform(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'params': params,
+                'sweep': sweep,
+                'results': results,
+            }, fout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""Benchmarks of the hot paths, run offline on synthetic CIDs.
+
+Each benchmark takes the parameters and returns the number of operations and a
+function doing them once, which is timed.
+"""
+import asyncio
+import time
+from datetime import timezone
+from statistics import median
+
+from dscraper.company import CommentWorker
+from dscraper.dedup import pack
+from dscraper.exceptions import NoMoreItems
+from dscraper.exporter import iter_documents
+from dscraper.scraper import BlockingDistributor
+from dscraper.utils import FrequencyController
+
+from .synthetic import SyntheticCid, SyntheticFetcher, parse
+
+BENCHMARKS = []
+
+
+def benchmark(heavy=False):
+    """Register a benchmark. Heavy ones are run only once."""
+    def decorate(fn):
+        fn.heavy = heavy
+        BENCHMARKS.append(fn)
+        return fn
+    return decorate
+
+
+class Fixture:
+    """A synthetic CID, and its pages and flow as a worker gets them."""
+
+    def __init__(self, params, loop):
+        self.loop = loop
+        self.cid = SyntheticCid(1, params['comments'], params['maxlimit'], params['roll_dates'],
+                                params['protected'], params['title'], params['code'],
+                                params['invalid'], params['seed'])
+        self.pages = [page for _, page in self.cid.pages()]
+        self.worker = make_worker({1: self.cid}, loop)
+        self.flow = loop.run_until_complete(self.worker._next(1))
+
+
+def make_worker(cids, loop):
+    worker = CommentWorker(distributor=None, scavenger=None, exporter=None, history=True,
+                           loop=loop, time_range=(None, None))
+    worker.fetcher = SyntheticFetcher(cids)
+    return worker
+
+
+@benchmark()
+def parse_page(fixture, params):
+    pages = fixture.pages
+    return len(pages), lambda: [parse(page) for page in pages]
+
+
+@benchmark()
+def digest(fixture, params):
+    roots = [parse(page)[0] for page in fixture.pages]
+    digest = CommentWorker._digest
+    return len(roots), lambda: [digest(root) for root in roots]
+
+
+@benchmark()
+def join(fixture, params):
+    # Pools of segments, the latest page first, as the worker collects them
+    pages = [CommentWorker._digest(parse(page)[0]) for page in fixture.pages]
+    pools = [[segments[i] for segments in pages] for i in range(4)]
+    join = CommentWorker._join
+    return 1, lambda: [join(reversed(pool)) for pool in pools]
+
+
+@benchmark()
+def trim(fixture, params):
+    flows = fixture.flow.flows
+    dates = [cmt.attrib['date'] for cmt in flows[0]]
+    start, end = dates[len(dates) // 4], dates[len(dates) * 3 // 4]
+    trim = CommentWorker._trim
+    return sum(map(len, flows)), lambda: [trim(list(flow), start, end) for flow in flows]
+
+
+@benchmark()
+def scrape_cid(fixture, params):
+    """CommentWorker._next() with the pages served from memory, including parsing."""
+    worker, loop = fixture.worker, fixture.loop
+    return 1, lambda: loop.run_until_complete(worker._next(1))
+
+
+@benchmark()
+def get_histories(fixture, params):
+    flow = fixture.flow
+
+    def run():
+        for _, root in flow.get_histories():
+            for _ in root:
+                pass
+    return len(fixture.cid.roll_dates), run
+
+
+@benchmark()
+def serialize_xml(fixture, params):
+    flow = fixture.flow
+    return len(fixture.pages), lambda: list(iter_documents(flow))
+
+
+@benchmark()
+def serialize_dedup(fixture, params):
+    flow = fixture.flow
+    return 1, lambda: pack(flow)
+
+
+@benchmark(heavy=True)
+def distributor(fixture, params):
+    """Post a range of targets and claim all of them."""
+    loop, targets = fixture.loop, params['targets']
+
+    async def claim_all(d):
+        claim = d.claim
+        try:
+            while True:
+                await claim()
+        except NoMoreItems:
+            pass
+
+    def run():
+        d = BlockingDistributor(loop=loop)
+        d.post(range(1, targets + 1))
+        d.set()
+        loop.run_until_complete(claim_all(d))
+    return targets, run
+
+
+@benchmark(heavy=True)
+def controller(fixture, params):
+    """FrequencyController.wait() with no interval, which still checks rush hour."""
+    loop, targets = fixture.loop, params['targets']
+    controller = FrequencyController((0, 0, 18, 22.5, timezone.utc), loop=loop)
+
+    async def wait_all():
+        wait = controller.wait
+        for _ in range(targets):
+            await wait()
+    return targets, lambda: loop.run_until_complete(wait_all())
+
+
+def run(params, names=None, repeat=5, log=print):
+    """Run the benchmarks, or those whose names contain any of names.
+
+    :return {str: dict}: results by the name of the benchmark
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        fixture = Fixture(params, loop)
+        results = {}
+        for fn in BENCHMARKS:
+            name = fn.__name__
+            if names and not any(part in name for part in names):
+                continue
+            try:
+                ops, once = fn(fixture, params)
+                times = []
+                for _ in range(1 if fn.heavy else repeat):
+                    start = time.perf_counter()
+                    once()
+                    times.append(time.perf_counter() - start)
+            except Exception as e:
+                results[name] = {'error': '{}: {}'.format(type(e).__name__, e)}
+                log('{:<16} failed: {}'.format(name, results[name]['error']))
+                continue
+            results[name] = {'ops': ops, 'times': times, 'best': min(times), 'median': median(times),
+                             'per_op_us': min(times) / ops * 1e6}
+            log('{:<16} {:>12.2f}us/op {:>10} ops  best {:.4f}s  median {:.4f}s'.format(
+                name, results[name]['per_op_us'], ops, min(times), median(times)))
+        return results
+    finally:
+        loop.close()
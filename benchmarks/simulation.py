@@ -0,0 +1,501 @@
+"""Simulate scraping in virtual time, with the real CidCompany, BlockingDistributor,
+FrequencyController and Scavenger driving workers against a modeled host, to tune
+the schedule offline before touching the real host.
+
+Sleeping takes no time, but every request still goes through the event loop and
+the real coroutines, at about 12k CIDs a real second with the defaults. A run is
+thus some seconds for a few hundred thousand CIDs, and minutes for a day of millions
+of them, so sweeps are best kept to a few virtual hours.
+
+    $ python -m benchmarks.simulation --hours 2 --targets 300000
+    $ python -m benchmarks.simulation --workers 6 12 --busy-interval 0.5 1 --rate-limit 20
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import math
+import random
+import selectors
+import time
+from datetime import datetime, timedelta
+
+from dscraper.company import BaseWorker, CidCompany
+from dscraper.exceptions import (Scavenger, HostError, NoResponseReadError, ReadTimeout, PageNotFound,
+                                 MultipleErrors, NoMoreItems)
+from dscraper.fetcher import Session, _DEFAULT_TIMEOUT
+from dscraper.scraper import BlockingDistributor
+from dscraper.utils import TIME_CONFIG_CN, aretry
+
+_logger = logging.getLogger(__name__)
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+    """Instead of waiting for a timeout, advances the clock of the loop by it and
+    returns at once, unless there is I/O ready or no timer to wait for, in which
+    case the loop waits for threads or real I/O as usual.
+    """
+
+    def __init__(self, clock):
+        super().__init__()
+        self._clock = clock
+
+    def select(self, timeout=None):
+        events = super().select(0)
+        if events or timeout is not None and timeout <= 0:
+            return events
+        if timeout is None:
+            return super().select()
+        self._clock.advance(timeout)
+        return []
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """An event loop whose clock jumps to the next timer as soon as there is nothing
+    else to run, so that sleeping takes no time. Code running synchronously takes
+    no time either, unless it advances the clock itself.
+
+    :param float start: Unix time the clock of the wall starts from
+    """
+
+    def __init__(self, start=None):
+        self._now = 0.0
+        self.start = time.time() if start is None else start
+        super().__init__(_VirtualSelector(self))
+
+    def time(self):
+        return self._now
+
+    def advance(self, seconds):
+        self._now += seconds
+
+    def wall_time(self):
+        """Return the virtual Unix time."""
+        return self.start + self._now
+
+
+class ModeledHost:
+    """The comment host as the scraper sees it, in virtual time.
+
+    A CID is 404 at a ratio of missing. Otherwise the number of its comments is drawn
+    from a log-normal distribution, and its maxlimit from maxlimits. Both are derived
+    from the CID, so that they are the same however many times it is requested.
+
+    A response takes a round-trip time drawn from a log-normal distribution, longer
+    by busy_factor in the rush hour of the host, plus the time to transfer the page.
+    Requests beyond the rate limit are dropped, and if ban_after of them are dropped
+    within a minute, all requests are dropped for ban_time.
+
+    :param float rtt: median seconds before the first byte
+    :param float rtt_sigma: standard deviation of the logarithm of the RTT
+    :param float bandwidth: bytes per second of a connection
+    :param float error_rate: ratio of requests whose connections are closed without
+        a response
+    :param float timeout_rate: ratio of requests never answered, which time out
+    :param float rate_limit: requests per second accepted, or None if unlimited
+    :param int burst: requests accepted at once under the rate limit
+    :param int ban_after: requests dropped for the rate limit within a minute before
+        a ban, or None if never banned
+    :param float ban_time: seconds a ban lasts
+    :param (float, float) busy_hours: rush hour of the host, in its time zone
+    :param float busy_factor:
+    :param float missing: ratio of CIDs that are 404
+    :param float comments: median number of comments of a CID
+    :param float comments_sigma: standard deviation of the logarithm of the comments
+    :param (int) maxlimits: numbers of comments a page contains at most
+    :param int max_roll_dates: pages of history a CID has at most
+    :param tzinfo tz: time zone of the host
+    :param int seed:
+    """
+    BYTES_PER_COMMENT = 40  # deflated
+    TIMEOUT = _DEFAULT_TIMEOUT[1]
+    BAN_WINDOW = 60
+
+    def __init__(self, rtt=0.05, rtt_sigma=0.5, bandwidth=2 ** 20, error_rate=0.001,
+                 timeout_rate=0.0002, rate_limit=None, burst=20, ban_after=None, ban_time=600,
+                 busy_hours=(18, 22.5), busy_factor=2, missing=0.3, comments=300, comments_sigma=1.5,
+                 maxlimits=(500, 1000, 1000, 1500, 3000), max_roll_dates=60, tz=TIME_CONFIG_CN[4],
+                 seed=0, *, loop):
+        self.loop = loop
+        self.rtt, self.rtt_sigma, self.bandwidth = rtt, rtt_sigma, bandwidth
+        self.error_rate, self.timeout_rate = error_rate, timeout_rate
+        self.rate_limit, self.burst, self.ban_after, self.ban_time = rate_limit, burst, ban_after, ban_time
+        self.busy_hours, self.busy_factor = busy_hours, busy_factor
+        self.missing, self.comments, self.comments_sigma = missing, comments, comments_sigma
+        self.maxlimits, self.max_roll_dates = maxlimits, max_roll_dates
+        self.seed = seed
+        self.stats = dict.fromkeys(('connections', 'requests', 'responses', 'dropped', 'throttled',
+                                    'timeouts', 'bytes'), 0)
+        self.bans = 0
+        self._random = random.Random(seed)
+        self._log_rtt = math.log(rtt)
+        self._offset = datetime.fromtimestamp(loop.wall_time(), tz).utcoffset().total_seconds()
+        self._tokens, self._refilled = burst, loop.time()
+        self._banned_until = self._window = -1
+        self._cnt_throttled = 0
+
+    def get_cid(self, cid):
+        """
+        :return (int, int): number of comments and maxlimit of the CID, or None if it
+            is 404
+        """
+        bits = hash((self.seed, cid)) & (2 ** 60 - 1)
+        u1, u2, u3 = (((bits >> shift & 0xFFFFF) + 0.5) / 2 ** 20 for shift in (0, 20, 40))
+        if u1 < self.missing:
+            return None
+        z = math.sqrt(-2 * math.log(u2)) * math.cos(2 * math.pi * u3)  # Box-Muller
+        comments = int(self.comments * math.exp(self.comments_sigma * z))
+        index = int((u1 - self.missing) / (1 - self.missing) * len(self.maxlimits))
+        return comments, self.maxlimits[min(index, len(self.maxlimits) - 1)]
+
+    def is_busy(self):
+        hour = (self.loop.wall_time() + self._offset) % 86400 / 3600
+        start, end = self.busy_hours
+        return start <= hour < end if start <= end else hour < end or start <= hour
+
+    def is_banned(self):
+        return self.loop.time() < self._banned_until
+
+    async def connect(self):
+        self.stats['connections'] += 1
+        await asyncio.sleep(self._draw_rtt())
+
+    async def request(self, size):
+        """Wait for a response of size bytes.
+
+        :raise HostError: if the response is dropped or times out
+        """
+        self.stats['requests'] += 1
+        rtt = self._draw_rtt()
+        if self.is_banned() or not self._admit():
+            self.stats['throttled'] += 1
+            await asyncio.sleep(rtt)
+            raise NoResponseReadError('no response from the host')
+        chance = self._random.random()
+        if chance < self.timeout_rate:
+            self.stats['timeouts'] += 1
+            await asyncio.sleep(self.TIMEOUT)
+            raise ReadTimeout('read nothing from the host before timeout')
+        if chance < self.timeout_rate + self.error_rate:
+            self.stats['dropped'] += 1
+            await asyncio.sleep(rtt)
+            raise NoResponseReadError('no response from the host')
+        self.stats['responses'] += 1
+        self.stats['bytes'] += size
+        await asyncio.sleep(rtt + size / self.bandwidth)
+
+    def _draw_rtt(self):
+        rtt = math.exp(self._random.gauss(self._log_rtt, self.rtt_sigma))
+        return rtt * self.busy_factor if self.is_busy() else rtt
+
+    def _admit(self):
+        if self.rate_limit is None:
+            return True
+        now = self.loop.time()
+        self._tokens = min(self._tokens + (now - self._refilled) * self.rate_limit, self.burst)
+        self._refilled = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        if self.ban_after is not None:
+            if now - self._window > self.BAN_WINDOW:
+                self._window, self._cnt_throttled = now, 0
+            self._cnt_throttled += 1
+            if self._cnt_throttled >= self.ban_after:
+                self._banned_until = now + self.ban_time
+                self._cnt_throttled = 0
+                self.bans += 1
+        return False
+
+
+class ModeledFetcher:
+    """Makes the requests a CIDFetcher would to the modeled host, with the same
+    retries of its Session and of aretry.
+    """
+    PAGE_HEADER = 300
+
+    def __init__(self, host):
+        self.host = host
+
+    async def __aenter__(self):
+        await self.host.connect()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+    @aretry
+    async def get_comments(self, comments):
+        await self.get(self.PAGE_HEADER + comments * self.host.BYTES_PER_COMMENT)
+
+    @aretry
+    async def get_rolldate_json(self):
+        await self.get(self.PAGE_HEADER)
+
+    @aretry
+    async def get_not_found(self):
+        await self.get(self.PAGE_HEADER)
+        raise PageNotFound('404 page')
+
+    async def get(self, size):
+        errors = []
+        retries = 0
+        while True:
+            try:
+                await self.host.request(size)
+            except HostError as e:
+                errors.append(e)
+                if retries >= Session._READ_RETRIES:
+                    if len(set(map(type, errors))) == 1:
+                        raise
+                    else:
+                        raise MultipleErrors(errors) from None
+                await asyncio.sleep(retries ** 2)
+                await self.host.connect()
+                retries += 1
+            else:
+                break
+
+
+class SimulatedWorker(BaseWorker):
+    """Requests the pages of a CID as CommentWorker does, from the modeled host.
+    Parsing blocks the loop for cpu_per_comment seconds a comment, during which
+    the clock advances and nothing else runs.
+    """
+
+    def __init__(self, *, distributor, scavenger, exporter, host, history, cpu_per_comment, loop):
+        super().__init__(distributor=distributor, scavenger=scavenger, fetcher=ModeledFetcher(host),
+                         exporter=exporter)
+        self.host, self.history, self.cpu_per_comment = host, history, cpu_per_comment
+        self.loop = loop
+
+    async def _next(self, cid):
+        size = self.host.get_cid(cid)
+        if size is None:
+            await self.fetcher.get_not_found()
+        comments, maxlimit = size
+        await self.fetcher.get_comments(min(comments, maxlimit))
+        self._parse(min(comments, maxlimit))
+        if self.history and comments >= maxlimit:
+            await self.fetcher.get_rolldate_json()
+            for _ in range(min(math.ceil(comments / maxlimit) - 1, self.host.max_roll_dates)):
+                await self.fetcher.get_comments(maxlimit)
+                self._parse(maxlimit)
+        return comments
+
+    def _parse(self, comments):
+        self.loop.advance(comments * self.cpu_per_comment)
+
+
+class _CountingExporter:
+
+    def __init__(self):
+        self.comments = 0
+
+    async def dump(self, cid, comments):
+        self.comments += comments
+
+    async def join(self):
+        pass
+
+
+class SimulatedCompany(CidCompany):
+    """A CidCompany of SimulatedWorkers, which stops claiming at the deadline."""
+
+    def __init__(self, max_workers, distributor, *, scavenger, host, history, cpu_per_comment,
+                 time_config, deadline, loop):
+        exporter = _CountingExporter()
+        super().__init__(max_workers, distributor, scavenger=scavenger, exporter=exporter,
+                         history=history, time_range=(None, None), time_config=time_config,
+                         clock=loop.wall_time, loop=loop)
+        self._ctor = lambda: SimulatedWorker(distributor=self, scavenger=scavenger, exporter=exporter,
+                                             host=host, history=history,
+                                             cpu_per_comment=cpu_per_comment, loop=loop)
+        self.deadline = deadline
+
+    async def claim(self):
+        if self.loop.time() >= self.deadline:
+            raise NoMoreItems('the simulation is over')
+        return await super().claim()
+
+
+PARAMS = {
+    'hours': 24.0,
+    'targets': 500000,
+    'start_hour': 16.0,  # of the host, for the run to go through its rush hour
+    'history': True,
+    'retries': 3,
+    'update_interval': float(CidCompany.UPDATE_INTERVAL),
+    'rush_hours': TIME_CONFIG_CN[2:4],
+    'max_health': float(Scavenger._MAX_HEALTH),
+    'regen': float(Scavenger._REGEN),
+    'cpu_per_comment': 5e-6,
+    'rtt': 0.05,
+    'rtt_sigma': 0.5,
+    'bandwidth': 2.0 ** 20,
+    'error_rate': 0.001,
+    'timeout_rate': 0.0002,
+    'rate_limit': None,
+    'burst': 20,
+    'ban_after': None,
+    'ban_time': 600.0,
+    'busy_hours': (18, 22.5),
+    'busy_factor': 2.0,
+    'missing': 0.3,
+    'comments': 300.0,
+    'comments_sigma': 1.5,
+    'seed': 0,
+}
+SWEEP = {'workers': [6], 'interval': [TIME_CONFIG_CN[0]], 'busy_interval': [TIME_CONFIG_CN[1]]}
+REPORT_INTERVAL = 3600
+
+
+def simulate(params, workers, interval, busy_interval, log=None):
+    """Simulate a scrape of params['targets'] CIDs for at most params['hours'].
+
+    :param callable log: called with a line on each REPORT_INTERVAL of virtual time
+    :return dict: results of the simulation
+    """
+    tz = TIME_CONFIG_CN[4]
+    day = tz.localize(datetime.now().replace(hour=0, minute=0, second=0, microsecond=0))
+    start = (day + timedelta(hours=params['start_hour'])).timestamp()
+    loop = VirtualTimeLoop(start)
+    asyncio.set_event_loop(loop)
+    try:
+        host = ModeledHost(params['rtt'], params['rtt_sigma'], params['bandwidth'],
+                           params['error_rate'], params['timeout_rate'], params['rate_limit'],
+                           params['burst'], params['ban_after'], params['ban_time'],
+                           params['busy_hours'], params['busy_factor'], params['missing'],
+                           params['comments'], params['comments_sigma'], tz=tz, seed=params['seed'],
+                           loop=loop)
+        distributor = BlockingDistributor(params['retries'], loop=loop)
+        scavenger = type('Scavenger', (Scavenger,), {
+            '_MAX_HEALTH': params['max_health'], '_REGEN': params['regen']})(retry=distributor.retry)
+        time_config = (interval, busy_interval) + tuple(params['rush_hours']) + (tz,)
+        company = SimulatedCompany(workers, distributor, scavenger=scavenger, host=host,
+                                   history=params['history'],
+                                   cpu_per_comment=params['cpu_per_comment'],
+                                   time_config=time_config, deadline=params['hours'] * 3600,
+                                   loop=loop)
+        company.UPDATE_INTERVAL = params['update_interval']
+        company.post(range(1, int(params['targets']) + 1))
+        company.set()
+
+        timeline = []
+        started = time.perf_counter()
+        loop.run_until_complete(_run(company, host, scavenger, timeline, log))
+        elapsed = time.perf_counter() - started
+        done = scavenger.get_success_count()
+        return {
+            'workers': workers,
+            'interval': interval,
+            'busy_interval': busy_interval,
+            'virtual_hours': loop.time() / 3600,
+            'real_seconds': elapsed,
+            'finished': done,
+            'failed': len(scavenger.get_failures()),
+            'died': scavenger.is_dead(),
+            'comments': company.exporter.comments,
+            'cids_per_hour': done / loop.time() * 3600 if loop.time() else 0,
+            'bans': host.bans,
+            'errors': scavenger.get_error_counts(),
+            'host': dict(host.stats),
+            'timeline': timeline,
+        }
+    finally:
+        loop.close()
+
+
+async def _run(company, host, scavenger, timeline, log):
+    sampler = asyncio.ensure_future(_sample(company, host, scavenger, timeline, log))
+    try:
+        await company.run()
+    finally:
+        sampler.cancel()
+    _record(company, host, scavenger, timeline, log)
+
+
+async def _sample(company, host, scavenger, timeline, log):
+    while True:
+        await asyncio.sleep(REPORT_INTERVAL)
+        _record(company, host, scavenger, timeline, log)
+
+
+def _record(company, host, scavenger, timeline, log):
+    loop = company.loop
+    health, max_health = scavenger.get_health()
+    row = {
+        'time': loop.time(),
+        'finished': scavenger.get_success_count(),
+        'requests': host.stats['requests'],
+        'throttled': host.stats['throttled'],
+        'workers': company.get_worker_count(),
+        'rush_hour': company.is_busy(),
+        'banned': host.is_banned(),
+        'health': health / max_health if max_health else None,
+    }
+    last = timeline[-1] if timeline else dict(row, time=0, finished=0, requests=0, throttled=0)
+    timeline.append(row)
+    if log is not None:
+        wall = datetime.fromtimestamp(loop.wall_time(), TIME_CONFIG_CN[4])
+        log('{:>6.2f}h {:%H:%M} {:>10} {:>10} {:>9} {:>7} {:>5} {:>7} {}'.format(
+            row['time'] / 3600, wall, row['finished'] - last['finished'],
+            row['requests'] - last['requests'], row['throttled'] - last['throttled'],
+            row['workers'], 'yes' if row['rush_hour'] else 'no',
+            '-' if row['health'] is None else '{:.0%}'.format(row['health']),
+            'banned' if row['banned'] else ''))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.simulation', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=SWEEP['workers'],
+                        help='numbers of workers (default: %(default)s)')
+    parser.add_argument('--interval', type=float, nargs='+', default=SWEEP['interval'],
+                        help='intervals between claims in common hours (default: %(default)s)')
+    parser.add_argument('--busy-interval', type=float, nargs='+', default=SWEEP['busy_interval'],
+                        help='intervals between claims at rush hour (default: %(default)s)')
+    parser.add_argument('--no-history', dest='history', action='store_false', default=True,
+                        help='do not scrape history')
+    parser.add_argument('-v', '--verbose', default=False, action='store_true',
+                        help='show the logs of the scraper')
+    for name, default in PARAMS.items():
+        if name == 'history':
+            continue
+        option = '--' + name.replace('_', '-')
+        if isinstance(default, tuple):
+            parser.add_argument(option, type=float, nargs=2, default=None, metavar=('start', 'end'),
+                                help='default: {} {}'.format(*default))
+        else:
+            parser.add_argument(option, type=float if default is None else type(default),
+                                default=None, help='default: {}'.format(default))
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    params = dict(PARAMS)
+    for name in PARAMS:
+        value = getattr(args, name)
+        if value is not None:
+            params[name] = value
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+
+    policies = list(itertools.product(args.workers, args.interval, args.busy_interval))
+    log = print if len(policies) == 1 else None
+    if log is not None:
+        log('{:>7} {:>5} {:>10} {:>10} {:>9} {:>7} {:>5} {:>7}'.format(
+            'time', 'host', 'CIDs', 'requests', 'throttled', 'workers', 'rush', 'health'))
+    results = [simulate(params, *policy, log=log) for policy in policies]
+
+    print('\n{:>7} {:>8} {:>8} {:>10} {:>10} {:>8} {:>6} {:>5} {:>7} {:>8}'.format(
+        'workers', 'interval', 'busy', 'CIDs', 'CIDs/h', 'failed', 'bans', 'died', 'hours',
+        'real'))
+    for result in results:
+        print('{:>7} {:>8g} {:>8g} {:>10} {:>10.0f} {:>8} {:>6} {:>5} {:>7.2f} {:>7.1f}s'.format(
+            result['workers'], result['interval'], result['busy_interval'], result['finished'],
+            result['cids_per_hour'], result['failed'], result['bans'],
+            'yes' if result['died'] else 'no', result['virtual_hours'], result['real_seconds']))
+
+
+if __name__ == '__main__':
+    main()
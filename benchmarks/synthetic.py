@@ -0,0 +1,132 @@
+"""Synthetic CIDs, whose pages are generated as the host would serve them, in the
+format that tests/test_comment_worker.py builds with make_xml().
+"""
+import json
+import random
+from bisect import bisect_right
+from xml.sax.saxutils import escape
+
+from dscraper.utils import escape_invalid_xml_chars, parse_comments_xml, parse_rolldate_json
+from dscraper.fetcher import decode
+
+NORMAL, PROTECTED, TITLE, CODE = range(4)
+
+_HEAD = ('<?xml version="1.0" encoding="UTF-8"?><i><chatserver>chat.bilibili.com</chatserver>'
+         '<chatid>{cid}</chatid><mission>0</mission><maxlimit>{maxlimit}</maxlimit>'
+         '<source>k-v</source>')
+_TAIL = '</i>'
+_CMT = '<d p="{offset},{mode},25,{color},{date},{pool},{user},{id}">{text}</d>'
+_WORDS = ('233333', '前方高能', '哈哈哈哈', 'awsl', '打卡', 'kksk', '泪目', '来了来了', '2333',
+          '名场面', 'excuse me?', '<3', 'A&B', '???', '第一', '空耳', '这是什么操作')
+_MODES = (1, 1, 1, 1, 1, 1, 4, 5)
+_COLORS = (16777215, 16777215, 16777215, 16646914, 16740868, 6737151)
+_INVALID = '\x08\x0b\x1f\x7f'
+
+
+class SyntheticCid:
+    """A CID with comments posted over a period of time, and roll dates on which
+    the history is kept.
+
+    :param int cid:
+    :param int comments: number of comments in total
+    :param int maxlimit: number of comments in the first pool a page contains at most
+    :param int roll_dates: number of dates on which the history is kept
+    :param float protected: ratio of protected comments
+    :param float title: ratio of comments in the title pool
+    :param float code: ratio of comments in the code pool
+    :param float invalid: ratio of comments containing characters invalid in XML
+    :param int seed: of the random generator
+    :param int start: timestamp of the first comment
+    :param int span: seconds over which the comments are posted
+    """
+
+    def __init__(self, cid=1, comments=10000, maxlimit=1000, roll_dates=30, protected=0.01,
+                 title=0.002, code=0.001, invalid=0.01, seed=0, start=1400000000,
+                 span=365 * 86400):
+        rand = random.Random(seed)
+        self.cid, self.maxlimit = cid, maxlimit
+        self.pools = ([], [], [], [])  # comments of each kind, sorted by date
+        cmt_id, dates = cid * 10 ** 6, sorted(rand.randrange(span) + start for _ in range(comments))
+        for date in dates:
+            cmt_id += rand.randint(1, 3)
+            kind = rand.random()
+            kind = CODE if kind < code else TITLE if kind < code + title else \
+                PROTECTED if kind < code + title + protected else NORMAL
+            text = escape(' '.join(rand.choice(_WORDS) for _ in range(rand.randint(1, 3))))
+            if rand.random() < invalid:
+                text += rand.choice(_INVALID)
+            self.pools[kind].append((date, _CMT.format(
+                offset='{:.{}f}'.format(rand.uniform(0, 1500), rand.choice((2, 3, 5))),
+                mode=_MODES[rand.randrange(len(_MODES))], color=rand.choice(_COLORS),
+                date=date, pool={TITLE: 1, CODE: 2}.get(kind, 0),
+                user='{:08x}'.format(rand.randrange(16 ** 8 // 5)), id=cmt_id, text=text)))
+        self._dates = [[date for date, _ in pool] for pool in self.pools]
+        if dates and roll_dates:
+            step = span / roll_dates
+            self.roll_dates = sorted(set(min(int(start + step * (i + 1)), dates[-1])
+                                         for i in range(roll_dates)))
+        else:
+            self.roll_dates = []
+        self._cache = {}
+
+    def page(self, date=0):
+        """Return the page of the date in bytes, or the latest page if date is 0."""
+        page = self._cache.get(date)
+        if page is None:
+            page = self._cache[date] = self._make_page(date).encode()
+        return page
+
+    def pages(self):
+        """Return the pages a worker would request, the latest page first.
+
+        :return [(int, bytes)]:
+        """
+        return [(0, self.page())] + [(date, self.page(date)) for date in reversed(self.roll_dates)]
+
+    def rolldate_json(self):
+        return json.dumps([{'timestamp': str(date), 'new': '0'} for date in self.roll_dates])
+
+    def _make_page(self, date):
+        def upto(kind):
+            pool = self.pools[kind]
+            return pool[:bisect_right(self._dates[kind], date)] if date else pool
+
+        protected = upto(PROTECTED)
+        normal = upto(NORMAL)[-max(self.maxlimit - len(protected), 0):]
+        lines = [_HEAD.format(cid=self.cid, maxlimit=self.maxlimit)]
+        for segment in (normal, protected, upto(TITLE), upto(CODE)):
+            lines.extend(cmt for _, cmt in segment)
+        lines.append(_TAIL)
+        return ''.join(lines)
+
+
+def parse(page):
+    """Parse a page as CIDFetcher does."""
+    text = decode(page)
+    escaped = escape_invalid_xml_chars(text)
+    return parse_comments_xml(escaped), page if escaped == text else None
+
+
+class SyntheticFetcher:
+    """Serves the pages of synthetic CIDs in place of CIDFetcher.
+
+    :param {int: SyntheticCid} cids:
+    """
+
+    def __init__(self, cids):
+        self.cids = cids
+
+    async def get_comments(self, cid, date=0):
+        return parse(self.cids[cid].page(date))
+
+    async def get_comments_root(self, cid, date=0):
+        return (await self.get_comments(cid, date))[0]
+
+    async def get_rolldate_json(self, cid):
+        return parse_rolldate_json(self.cids[cid].rolldate_json())
+
+    async def __aenter__(self):
+        pass
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
@@ -0,0 +1,170 @@
+"""A simulated comment host, serving synthetic CIDs over HTTP on localhost under
+configurable network conditions, to benchmark the whole scraper end to end.
+"""
+import asyncio
+import random
+import re
+import zlib
+
+_REQUEST = re.compile(r'^GET (\S+) HTTP/1\.[01]\r\n')
+_CURRENT = re.compile(r'^/(\d+)\.xml$')
+_HISTORY = re.compile(r'^/dmroll,(\d+),(\d+)$')
+_ROLLDATE = re.compile(r'^/rolldate,(\d+)$')
+_RESPONSE = ('HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Encoding: deflate\r\n'
+             'Content-Length: {}\r\nConnection: keep-alive\r\n\r\n')
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found'}
+_current_task = getattr(asyncio, 'current_task', None) or asyncio.Task.current_task
+
+
+def deflate(data):
+    """Compress as the host does, in raw deflate without the zlib header."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class SimulatedHost:
+    """Serves CIDs as comment.bilibili.com does, in deflated bodies with a
+    Content-Length, over connections kept alive.
+
+    CID n is served with the comments of pool[n % len(pool)], so that a few synthetic
+    CIDs make up a range of targets of any size. Network conditions are simulated on
+    the side of the host, as seen by the scraper:
+
+    :param [SyntheticCid] pool:
+    :param float rtt: seconds between a request and the first byte of its response,
+        and before the first request of a connection is read, as for the handshake
+    :param float bandwidth: bytes per second of the link shared by all connections,
+        or None if unlimited
+    :param float error_rate: ratio of requests whose connections are closed without
+        a response
+    :param float rate_limit: requests per second accepted from an IP, or None if
+        unlimited. Beyond it, connections are closed without a response, as a host
+        turning crawlers away does
+    :param int burst: requests accepted at once from an IP under the rate limit
+    :param float missing: ratio of CIDs that are 404
+    :param int seed: of the errors
+    """
+    CHUNK = 16384
+
+    def __init__(self, pool, rtt=0.05, bandwidth=None, error_rate=0, rate_limit=None, burst=10,
+                 missing=0, seed=0, *, loop=None):
+        if not pool:
+            raise ValueError('no CIDs to serve')
+        self.loop = loop or asyncio.get_event_loop()
+        self.pool = pool
+        self.rtt, self.bandwidth, self.error_rate = rtt, bandwidth, error_rate
+        self.rate_limit, self.burst, self.missing = rate_limit, burst, missing
+        self.address = None
+        self.stats = dict.fromkeys(('connections', 'requests', 'responses', 'not_found', 'dropped',
+                                    'throttled', 'bytes'), 0)
+        self._random = random.Random(seed)
+        self._buckets = {}  # ip: (tokens, time)
+        self._link_free = 0  # when the link finishes sending what is queued
+        self._pages = {}  # (index in the pool, date): deflated page
+        self._server = None
+        self._handlers = set()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        self.address = self._server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        if self._server is None:
+            return
+        self._server.close()
+        # Connections kept alive are not closed with the server
+        for handler in self._handlers:
+            handler.cancel()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        await self._server.wait_closed()
+        self._server = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def respond(self, path):
+        """
+        :param str path:
+        :return (int, bytes): status code and deflated body of the response
+        """
+        match = _CURRENT.match(path) or _HISTORY.match(path) or _ROLLDATE.match(path)
+        if not match:
+            return 400, deflate(b'')
+        cid = int(match.group(match.lastindex))
+        if self._is_missing(cid):
+            return 404, deflate(b'404 Not Found')
+        index = cid % len(self.pool)
+        if match.re is _ROLLDATE:
+            return 200, deflate(self.pool[index].rolldate_json().encode())
+        date = int(match.group(1)) if match.re is _HISTORY else 0
+        page = self._pages.get((index, date))
+        if page is None:
+            page = self._pages[(index, date)] = deflate(self.pool[index].page(date))
+        return 200, page
+
+    async def _handle(self, reader, writer):
+        self.stats['connections'] += 1
+        ip = writer.get_extra_info('peername')[0]
+        handler = _current_task()
+        self._handlers.add(handler)
+        try:
+            await asyncio.sleep(self.rtt)
+            while True:
+                try:
+                    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break
+                self.stats['requests'] += 1
+                await asyncio.sleep(self.rtt)
+                if not self._admit(ip):
+                    self.stats['throttled'] += 1
+                    break
+                if self.error_rate and self._random.random() < self.error_rate:
+                    self.stats['dropped'] += 1
+                    break
+
+                match = _REQUEST.match(head)
+                status, body = self.respond(match.group(1)) if match else (400, deflate(b''))
+                if status == 404:
+                    self.stats['not_found'] += 1
+                response = _RESPONSE.format(status, _REASONS[status], 'text/xml',
+                                            len(body)).encode('ascii') + body
+                for i in range(0, len(response), self.CHUNK):
+                    chunk = response[i:i + self.CHUNK]
+                    await self._transmit(len(chunk))
+                    writer.write(chunk)
+                await writer.drain()
+                self.stats['responses'] += 1
+                self.stats['bytes'] += len(response)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            self._handlers.discard(handler)
+
+    def _admit(self, ip):
+        """Take a token from the bucket of the IP."""
+        if self.rate_limit is None:
+            return True
+        now = self.loop.time()
+        tokens, last = self._buckets.get(ip, (self.burst, now))
+        tokens = min(tokens + (now - last) * self.rate_limit, self.burst)
+        admitted = tokens >= 1
+        self._buckets[ip] = (tokens - 1 if admitted else tokens, now)
+        return admitted
+
+    async def _transmit(self, size):
+        """Wait until the link has sent the bytes after those queued before."""
+        if self.bandwidth is None:
+            return
+        now = self.loop.time()
+        self._link_free = max(self._link_free, now) + size / self.bandwidth
+        await asyncio.sleep(self._link_free - now)
+
+    def _is_missing(self, cid):
+        # Knuth's multiplicative hash, for the same CIDs to be missing on every request
+        return self.missing and (cid * 2654435761 % 2 ** 32) / 2 ** 32 < self.missing
@@ -19,7 +19,14 @@ assert sys.version_info >= (3, 5), 'Minimum version 3.5'
 
 from .exceptions import HostError, DecodeError, PageNotFound
 from .scraper import Scraper, get
-from .exporter import StreamExporter, FileExporter# , MysqlExporter, SqliteExporter
+from .exporter import (StreamExporter, FileExporter, SqliteExporter, MysqlExporter,
+                       ExportQueue, JsonLinesExporter, CsvExporter, open_exported)
+from .archive import ArchiveExporter, ArchiveReader
+from .dedup import DedupExporter
+from .columnar import ColumnarExporter
+from .cache import NegativeCache
+from .metrics import MetricsServer
+from .control import ControlServer
 
 import logging
 logging.getLogger(__name__).addHandler(logging.NullHandler())
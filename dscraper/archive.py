@@ -0,0 +1,344 @@
+import logging
+import os
+import re
+import mmap
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from .exporter import BaseExporter, iter_documents
+
+_logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('<4sIQ')  # magic, version, number of segments sealed
+_ENTRY = struct.Struct('<qqIQQ')  # cid, date, segment, offset, length
+_KEY = struct.Struct('<qq')
+_MAGIC = b'DSAI'
+_VERSION = 1
+_MIN_DATE = -2 ** 63
+
+
+class ArchiveExporter(BaseExporter):
+    """Append the XML documents of each CID to a few large segment files, instead of
+    writing a file for each of them.
+
+    Documents are located by an index sorted by (cid, date), where date is 0 for the
+    latest page, so that ArchiveReader finds any of them in O(log n) time. Entries of
+    new documents go to a journal first, which is merged into the index on
+    disconnect, or on the next connect after a crash.
+
+    Appends are atomic: the journal is written only after the segment is synced, in
+    batches of SYNC_EVERY documents, and on recovery the segments are truncated to the
+    end of the last document in the journal. Each run starts a new segment, so that
+    sealed segments are never written again. Documents of a CID scraped again are
+    indexed anew, while the old ones are left in the segments unreferenced.
+
+    :param str path: directory to put the archive in. Default as './comments'.
+    :param bool join: whether save all comments in one document along with history,
+        or keep them separate as the original form
+    :param int segment_size: number of bytes after which a new segment is started
+    """
+    _OUT_DIR = 'comments'
+    INDEX = 'index.idx'
+    JOURNAL = 'index.journal'
+    SYNC_EVERY = 256
+    _SEGMENT = 'segment-{:05d}.dat'
+    _SEGMENT_PATTERN = re.compile(r'^segment-(\d+)\.dat$')
+    _CHUNK = _ENTRY.size * 4096
+
+    def __init__(self, path=None, join=False, segment_size=2 ** 30, *, loop=None):
+        super().__init__('Failed to append to the archive', loop=loop)
+        if path is None:
+            path = self._OUT_DIR
+        self._home = os.path.abspath(path)
+        self._split = not join
+        self.segment_size = segment_size
+        self._executor = None
+        self._segment = self._journal = None
+        self._number = self._size = 0
+        self._unsynced = []
+
+    async def dump(self, cid, flow, *, aid=None):
+        if self._executor is None:
+            raise RuntimeError('ArchiveExporter is not connected yet')
+        await self.loop.run_in_executor(self._executor, self._append, cid, flow)
+
+    async def dump_batch(self, items):
+        if self._executor is None:
+            raise RuntimeError('ArchiveExporter is not connected yet')
+        return await self.loop.run_in_executor(self._executor, self._append_batch, items)
+
+    async def _open_connection(self):
+        self._executor = ThreadPoolExecutor(1)
+        await self.loop.run_in_executor(self._executor, self._setup)
+
+    async def disconnect(self):
+        if self._executor is None:
+            return
+        try:
+            await self.loop.run_in_executor(self._executor, self._teardown)
+        finally:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _append_batch(self, items):
+        errors = []
+        for cid, flow, aid in items:
+            try:
+                self._append(cid, flow)
+            except Exception as e:
+                errors.append((cid, e))
+        return errors
+
+    def _append(self, cid, flow):
+        # All documents of a CID go to the same segment, and are synced together
+        if self._size >= self.segment_size:
+            self._sync()
+            self._segment.close()
+            self._open_segment(self._number + 1)
+        for date, data in iter_documents(flow, self._split):
+            self._segment.write(data)
+            self._unsynced.append(_ENTRY.pack(cid, date, self._number, self._size, len(data)))
+            self._size += len(data)
+        if len(self._unsynced) >= self.SYNC_EVERY:
+            self._sync()
+
+    def _sync(self):
+        if not self._unsynced:
+            return
+        self._segment.flush()
+        os.fsync(self._segment.fileno())
+        self._journal.write(b''.join(self._unsynced))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        _logger.debug('%d documents synced', len(self._unsynced))
+        self._unsynced = []
+
+    def _setup(self):
+        os.makedirs(self._home, exist_ok=True)
+        sealed = self._recover()
+        self._open_segment(sealed)
+        self._journal = open(self._cd(self.JOURNAL), 'ab')
+
+    def _teardown(self):
+        try:
+            self._sync()
+        finally:
+            self._segment.close()
+            self._journal.close()
+        sealed = self._number + 1 if self._size else self._number
+        if not self._size:
+            os.remove(self._cd(self._SEGMENT.format(self._number)))
+        entries = self._read_journal()
+        if entries or not os.path.exists(self._cd(self.INDEX)):
+            self._merge(entries, sealed)
+        else:
+            os.remove(self._cd(self.JOURNAL))
+
+    def _open_segment(self, number):
+        self._number, self._size = number, 0
+        self._segment = open(self._cd(self._SEGMENT.format(number)), 'wb')
+
+    def _recover(self):
+        """Make the archive consistent after a crash, by merging the journal left, and
+        removing documents that had not been synced.
+
+        :return int: number of segments sealed
+        """
+        sealed = self._read_header()
+        entries = self._read_journal()
+        ends = {}
+        for entry in entries:
+            _, _, number, offset, length = _ENTRY.unpack(entry)
+            ends[number] = max(ends.get(number, 0), offset + length)
+        for number in self._list_segments():
+            if number < sealed:
+                continue
+            filename = self._cd(self._SEGMENT.format(number))
+            if number in ends:
+                if os.path.getsize(filename) > ends[number]:
+                    _logger.warning('Truncating unsynced documents from segment %d', number)
+                    os.truncate(filename, ends[number])
+            else:
+                os.remove(filename)
+        if entries:
+            _logger.warning('Merging %d documents left in the journal', len(entries))
+            sealed = max(sealed, max(ends) + 1)
+            self._merge(entries, sealed)
+        return sealed
+
+    def _merge(self, entries, sealed):
+        """Merge the entries into the index, replacing the old ones of the same keys,
+        and clear the journal.
+        """
+        new = {}
+        for entry in entries:
+            new[_KEY.unpack_from(entry)] = entry  # the last one of a key wins
+        keys = sorted(new)
+        index, temp = self._cd(self.INDEX), self._cd(self.INDEX + '.tmp')
+        i = 0
+        with open(temp, 'wb') as fout:
+            fout.write(_HEADER.pack(_MAGIC, _VERSION, sealed))
+            for entry in self._iter_index():
+                key = _KEY.unpack_from(entry)
+                while i < len(keys) and keys[i] < key:
+                    fout.write(new[keys[i]])
+                    i += 1
+                if i < len(keys) and keys[i] == key:
+                    fout.write(new[keys[i]])
+                    i += 1
+                else:
+                    fout.write(entry)
+            for key in keys[i:]:
+                fout.write(new[key])
+            fout.flush()
+            os.fsync(fout.fileno())
+        os.replace(temp, index)
+        try:
+            os.remove(self._cd(self.JOURNAL))
+        except FileNotFoundError:
+            pass
+        _logger.debug('%d documents merged into the index', len(keys))
+
+    def _iter_index(self):
+        try:
+            fin = open(self._cd(self.INDEX), 'rb')
+        except FileNotFoundError:
+            return
+        with fin:
+            fin.seek(_HEADER.size)
+            while True:
+                chunk = fin.read(self._CHUNK)
+                if not chunk:
+                    break
+                for start in range(0, len(chunk), _ENTRY.size):
+                    yield chunk[start:start + _ENTRY.size]
+
+    def _read_header(self):
+        try:
+            with open(self._cd(self.INDEX), 'rb') as fin:
+                magic, version, sealed = _HEADER.unpack(fin.read(_HEADER.size))
+        except FileNotFoundError:
+            return 0
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError('unknown format of the index: {}'.format(self._cd(self.INDEX)))
+        return sealed
+
+    def _read_journal(self):
+        try:
+            with open(self._cd(self.JOURNAL), 'rb') as fin:
+                data = fin.read()
+        except FileNotFoundError:
+            return []
+        # An entry written partially is dropped
+        end = len(data) - len(data) % _ENTRY.size
+        return [data[start:start + _ENTRY.size] for start in range(0, end, _ENTRY.size)]
+
+    def _list_segments(self):
+        numbers = []
+        for filename in os.listdir(self._home):
+            match = self._SEGMENT_PATTERN.match(filename)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    def _cd(self, filename):
+        return os.path.join(self._home, filename)
+
+
+class ArchiveReader:
+    """Read documents from an archive written by ArchiveExporter, without unpacking
+    it. The index and the segments are memory-mapped, and looked up by bisection.
+
+    :param str path: directory of the archive
+    """
+
+    def __init__(self, path):
+        self._home = os.path.abspath(path)
+        with open(os.path.join(self._home, ArchiveExporter.INDEX), 'rb') as fin:
+            self._index = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _ = _HEADER.unpack_from(self._index)
+        if magic != _MAGIC or version != _VERSION:
+            self._index.close()
+            raise ValueError('unknown format of the index')
+        self._count = (len(self._index) - _HEADER.size) // _ENTRY.size
+        self._segments = {}
+
+    def get(self, cid, date=0):
+        """Return the document of the CID on the date, or the latest one.
+
+        :return bytes:
+        :raise KeyError: if there is no such document
+        """
+        i = self._bisect((cid, date))
+        if i == self._count or self._key(i) != (cid, date):
+            raise KeyError((cid, date))
+        _, _, number, offset, length = _ENTRY.unpack_from(self._index, self._position(i))
+        return self._segment(number)[offset:offset + length]
+
+    def dates(self, cid):
+        """Return the dates of all documents of the CID in ascending order, where 0 is
+        of the latest one.
+
+        :return [int]:
+        """
+        dates = []
+        i = self._bisect((cid, _MIN_DATE))
+        while i < self._count:
+            key_cid, date = self._key(i)
+            if key_cid != cid:
+                break
+            dates.append(date)
+            i += 1
+        return dates
+
+    def close(self):
+        for segment in self._segments.values():
+            segment.close()
+        self._segments.clear()
+        self._index.close()
+
+    def __contains__(self, key):
+        cid, date = key
+        i = self._bisect((cid, date))
+        return i < self._count and self._key(i) == (cid, date)
+
+    def __iter__(self):
+        """Yield the (cid, date) of all documents in order."""
+        for i in range(self._count):
+            yield self._key(i)
+
+    def __len__(self):
+        return self._count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _bisect(self, key):
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _key(self, i):
+        return _KEY.unpack_from(self._index, self._position(i))
+
+    @staticmethod
+    def _position(i):
+        return _HEADER.size + i * _ENTRY.size
+
+    def _segment(self, number):
+        try:
+            return self._segments[number]
+        except KeyError:
+            pass
+        filename = os.path.join(self._home, ArchiveExporter._SEGMENT.format(number))
+        with open(filename, 'rb') as fin:
+            segment = self._segments[number] = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+        return segment
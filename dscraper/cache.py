@@ -0,0 +1,113 @@
+import logging
+import os
+import json
+import time
+import random
+
+from .intervals import IntervalSet
+
+_logger = logging.getLogger(__name__)
+
+
+class NegativeCache:
+    """Remembers CIDs known to be dead, i.e. ended in a 404 page or an empty
+    document, across runs, so that they can be skipped without a request.
+
+    Dead CIDs are kept in interval sets, one for each day they were found on,
+    so that a whole day expires at once, and in another of all days, so that a
+    lookup costs a single bisection.
+
+    :param str path: file to load the cache from and save it to
+    :param float ttl: number of days after which a dead CID is checked again.
+        Never expires if None
+    :param float probe: fraction of the cached CIDs to check again instead of
+        skipping, to find out those that came alive
+    """
+    _VERSION = 1
+    _DAY = 24 * 60 * 60
+
+    def __init__(self, path, ttl=None, probe=0):
+        if not 0 <= probe <= 1:
+            raise ValueError('probe rate is not in range [0, 1]')
+        self.path = os.path.abspath(path)
+        self.ttl, self.probe = ttl, probe
+        self._days = {}
+        self._dead = IntervalSet()
+        self._cnt_probed = 0
+
+    def load(self):
+        """Load the cache from the file, dropping the days expired. Nothing is
+        loaded if the file does not exist.
+        """
+        self._days.clear()
+        self._dead = IntervalSet()
+        try:
+            with open(self.path) as fin:
+                data = json.load(fin)
+        except FileNotFoundError:
+            return self
+        if data.get('version') != self._VERSION:
+            raise ValueError('unknown version of the cache file: {}'.format(data.get('version')))
+
+        today = self._today()
+        for day, flat in data['days'].items():
+            day = int(day)
+            if self.ttl is not None and today - day >= self.ttl:
+                continue
+            self._days[day] = IntervalSet.from_intervals(zip(flat[::2], flat[1::2]))
+            self._dead.update(self._days[day])
+        _logger.debug('%d dead CIDs loaded from %s', len(self), self.path)
+        return self
+
+    def save(self):
+        """Save the cache to the file atomically."""
+        days = {}
+        for day, iset in self._days.items():
+            flat = []
+            for start, end in iset.intervals():
+                flat.extend((start, end))
+            days[str(day)] = flat
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp = self.path + '.tmp'
+        with open(temp, 'w') as fout:
+            json.dump({'version': self._VERSION, 'days': days}, fout, separators=(',', ':'))
+        os.replace(temp, self.path)
+        _logger.debug('%d dead CIDs saved to %s', len(self), self.path)
+
+    def update(self, dead, alive=()):
+        """Record the dead CIDs found today, and forget the alive ones.
+
+        :param IntervalSet dead:
+        :param IntervalSet alive:
+        """
+        if not isinstance(alive, IntervalSet):
+            alive = IntervalSet(alive)
+        for iset in self._days.values():
+            iset.difference_update(dead)
+            iset.difference_update(alive)
+        self._days.setdefault(self._today(), IntervalSet()).update(dead)
+        self._dead.difference_update(alive)
+        self._dead.update(dead)
+        for day in [day for day, iset in self._days.items() if not iset]:
+            del self._days[day]
+
+    def should_skip(self, cid):
+        """Return True if the CID is dead and is not picked to be probed."""
+        if cid not in self:
+            return False
+        if self.probe and random.random() < self.probe:
+            self._cnt_probed += 1
+            return False
+        return True
+
+    def get_probed_count(self):
+        return self._cnt_probed
+
+    def __contains__(self, cid):
+        return cid in self._dead
+
+    def __len__(self):
+        return len(self._dead)
+
+    def _today(self):
+        return int(time.time() // self._DAY)
@@ -0,0 +1,211 @@
+import logging
+import os
+import time
+import glob
+from concurrent.futures import ThreadPoolExecutor
+
+from .exporter import BaseExporter, iter_comments
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+_logger = logging.getLogger(__name__)
+
+COLUMNS = ('cid', 'id', 'date', 'offset', 'mode', 'size', 'color', 'pool', 'user', 'text')
+
+
+class ColumnarExporter(BaseExporter):
+    """Save comments in typed columns for analysis, as Parquet files if pyarrow is
+    installed, or as .npz files of NumPy otherwise.
+
+    Rows are partitioned into directories by CID range, such as 'cid=1000000' for
+    CIDs in [1000000, 2000000), and optionally by the month of the comment, such as
+    'cid=1000000/month=2016-05'. Rows of each partition are buffered, and written as
+    a row group of a Parquet file, or as an .npz file, every row_group_size rows.
+    The user column is dictionary-encoded. Each run writes new files, named after
+    the time it started.
+
+    :param str path: directory to put the partitions in. Default as './comments'.
+    :param int partition_size: number of CIDs in a partition
+    :param bool by_month: whether partition the rows by the month of the comments
+    :param int row_group_size: number of rows buffered for a partition before written
+    :param str format: 'parquet' or 'npz'. Default as 'parquet' if pyarrow is installed
+    """
+    _OUT_DIR = 'comments'
+    PARQUET = 'parquet'
+    NPZ = 'npz'
+
+    def __init__(self, path=None, partition_size=1000000, by_month=False, row_group_size=65536,
+                 format=None, *, loop=None):
+        super().__init__('Failed to save as columns', loop=loop)
+        if path is None:
+            path = self._OUT_DIR
+        if format is None:
+            format = self.PARQUET if pyarrow is not None else self.NPZ
+        if format not in (self.PARQUET, self.NPZ):
+            raise ValueError('unknown format: {}'.format(format))
+        self._home = os.path.abspath(path)
+        self.partition_size = partition_size
+        self.by_month = by_month
+        self.row_group_size = row_group_size
+        self.format = format
+        self._executor = None
+        self._run = None
+        self._buffers = {}  # partition: {column: list}
+        self._writers = {}  # partition: ParquetWriter
+        self._parts = {}  # partition: number of npz files written
+
+    async def dump(self, cid, flow, *, aid=None):
+        if self._executor is None:
+            raise RuntimeError('ColumnarExporter is not connected yet')
+        await self.loop.run_in_executor(self._executor, self._append, cid, flow)
+
+    async def dump_batch(self, items):
+        if self._executor is None:
+            raise RuntimeError('ColumnarExporter is not connected yet')
+        return await self.loop.run_in_executor(self._executor, self._append_batch, items)
+
+    async def _open_connection(self):
+        if numpy is None:
+            raise ImportError('numpy is required to save as columns')
+        if self.format == self.PARQUET and pyarrow is None:
+            raise ImportError('pyarrow is required to save as Parquet files')
+        os.makedirs(self._home, exist_ok=True)
+        self._run = time.strftime('%Y%m%d%H%M%S')
+        self._executor = ThreadPoolExecutor(1)
+
+    async def disconnect(self):
+        if self._executor is None:
+            return
+        try:
+            await self.loop.run_in_executor(self._executor, self._close)
+        finally:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _append_batch(self, items):
+        errors = []
+        for cid, flow, aid in items:
+            try:
+                self._append(cid, flow)
+            except Exception as e:
+                errors.append((cid, e))
+        return errors
+
+    def _append(self, cid, flow):
+        start = cid // self.partition_size * self.partition_size
+        touched = set()
+        for cmt in iter_comments(flow):
+            attrs = cmt.attrib
+            partition = (start, self._month(attrs['date'])) if self.by_month else (start,)
+            buffer = self._buffers.get(partition)
+            if buffer is None:
+                buffer = self._buffers[partition] = {column: [] for column in COLUMNS}
+            buffer['cid'].append(cid)
+            buffer['id'].append(attrs['id'])
+            buffer['date'].append(attrs['date'])
+            buffer['offset'].append(float(attrs['offset']))
+            buffer['mode'].append(int(attrs['mode']))
+            buffer['size'].append(int(attrs['font_size']))
+            buffer['color'].append(int(attrs['color']))
+            buffer['pool'].append(attrs['pool'])
+            buffer['user'].append(attrs['user'])
+            buffer['text'].append(cmt.text or '')
+            touched.add(partition)
+        for partition in touched:
+            if len(self._buffers[partition]['cid']) >= self.row_group_size:
+                self._flush(partition)
+
+    def _close(self):
+        try:
+            for partition in list(self._buffers):
+                self._flush(partition)
+        finally:
+            for writer in self._writers.values():
+                writer.close()
+            self._writers.clear()
+
+    def _flush(self, partition):
+        buffer = self._buffers.pop(partition)
+        wd = os.path.join(self._home, *self._directories(partition))
+        os.makedirs(wd, exist_ok=True)
+        if self.format == self.PARQUET:
+            self._write_row_group(partition, buffer, wd)
+        else:
+            self._write_npz(partition, buffer, wd)
+        _logger.debug('%d rows written to %s', len(buffer['cid']), wd)
+
+    def _write_row_group(self, partition, buffer, wd):
+        table = pyarrow.Table.from_arrays([
+            pyarrow.array(buffer['cid'], pyarrow.int64()),
+            pyarrow.array(buffer['id'], pyarrow.int64()),
+            pyarrow.array(buffer['date'], pyarrow.int64()),
+            pyarrow.array(buffer['offset'], pyarrow.float64()),
+            pyarrow.array(buffer['mode'], pyarrow.int8()),
+            pyarrow.array(buffer['size'], pyarrow.int16()),
+            pyarrow.array(buffer['color'], pyarrow.int32()),
+            pyarrow.array(buffer['pool'], pyarrow.int8()),
+            pyarrow.array(buffer['user'], pyarrow.string()).dictionary_encode(),
+            pyarrow.array(buffer['text'], pyarrow.string()),
+        ], names=COLUMNS)
+        writer = self._writers.get(partition)
+        if writer is None:
+            filename = os.path.join(wd, 'part-{}.parquet'.format(self._run))
+            writer = self._writers[partition] = pyarrow.parquet.ParquetWriter(
+                filename, table.schema, use_dictionary=['user'])
+        writer.write_table(table)
+
+    def _write_npz(self, partition, buffer, wd):
+        number = self._parts.get(partition, 0)
+        self._parts[partition] = number + 1
+        users, codes = numpy.unique(numpy.array(buffer['user'], dtype=str), return_inverse=True)
+        numpy.savez(os.path.join(wd, 'part-{}-{:05d}.npz'.format(self._run, number)),
+                    cid=numpy.array(buffer['cid'], dtype=numpy.int64),
+                    id=numpy.array(buffer['id'], dtype=numpy.int64),
+                    date=numpy.array(buffer['date'], dtype=numpy.int64),
+                    offset=numpy.array(buffer['offset'], dtype=numpy.float64),
+                    mode=numpy.array(buffer['mode'], dtype=numpy.int8),
+                    size=numpy.array(buffer['size'], dtype=numpy.int16),
+                    color=numpy.array(buffer['color'], dtype=numpy.int32),
+                    pool=numpy.array(buffer['pool'], dtype=numpy.int8),
+                    user=codes.astype(numpy.int32), user_dictionary=users,
+                    text=numpy.array(buffer['text'], dtype=str))
+
+    def _directories(self, partition):
+        directories = ['cid={}'.format(partition[0])]
+        if self.by_month:
+            directories.append('month={}'.format(partition[1]))
+        return directories
+
+    @staticmethod
+    def _month(date):
+        return time.strftime('%Y-%m', time.gmtime(date))
+
+
+def load_npz(path):
+    """Load and concatenate all .npz files saved by ColumnarExporter under the path,
+    decoding the user column.
+
+    :param str path: directory of the partitions, or of a partition
+    :return {str: numpy.ndarray}: columns
+    """
+    if numpy is None:
+        raise ImportError('numpy is required to load columns')
+    parts = {column: [] for column in COLUMNS}
+    for filename in sorted(glob.glob(os.path.join(path, '**', '*.npz'), recursive=True)):
+        with numpy.load(filename) as data:
+            for column in COLUMNS:
+                if column == 'user':
+                    parts[column].append(data['user_dictionary'][data['user']])
+                else:
+                    parts[column].append(data[column])
+    return {column: numpy.concatenate(arrays) if arrays else numpy.array([])
+            for column, arrays in parts.items()}
@@ -5,9 +5,11 @@ import datetime
 import concurrent
 
 from .fetcher import CIDFetcher
-from .utils import CountLatch, CommentFlow, validate_id, FrequencyController, find_elems
-from .exporter import FileExporter
-from .exceptions import Scavenger, DscraperError, NoMoreItems
+from .utils import (CountLatch, CommentFlow, validate_id, FrequencyController, find_elems,
+                    Sluice, TIME_CONFIG_CN)
+from .exceptions import Scavenger, DscraperError, NoMoreItems, PageNotFound, ContentError
+from .tracing import tracer
+from .memory import memory
 
 _logger = logging.getLogger(__name__)
 
@@ -34,8 +36,13 @@ class BaseCompany:
     async def run(self):
         self._hire(self._intended_workers)
         await self._latch.wait()
+        await self._finish()
         return self.stat()
 
+    async def _finish(self):
+        """Called when all workers are done, before the stats are made."""
+        pass
+
     def _hire(self, num=1):
         for _ in range(num):
             worker = self._ctor()
@@ -71,6 +78,25 @@ class BaseCompany:
         self._latch.count_down()
         self.scavenger.set_recorders(len(self._workers))
 
+    def get_worker_count(self):
+        """Return the number of workers running."""
+        return len(self._workers)
+
+    def resize(self, num):
+        """Hire or fire workers until num workers are running. Workers fired finish
+        their current work first.
+        """
+        if num <= 0:
+            raise ValueError('cannot resize to \'{}\' workers'.format(num))
+        if self._closed or not self._workers:
+            raise RuntimeError('company is not running')
+        running = sum(1 for worker in self._workers if not worker.is_stopped())
+        if num > running:
+            self._hire(num - running)
+        elif num < running:
+            self._fire(running - num, False)
+        self._intended_workers = num
+
     def close(self):
         """Force the company to close."""
         self._closed = True
@@ -84,21 +110,30 @@ class CidCompany(BaseCompany):
     """Taking charge of the CommentWorkers.
     """
     UPDATE_INTERVAL = 1 * 60
+    DUMP_LIMIT = 1000
 
     def __init__(self, max_workers, distributor, *, scavenger, exporter, history, time_range,
-                 loop):
+                 address=None, time_config=TIME_CONFIG_CN, clock=time.time, loop):
         ctor = lambda: CommentWorker(distributor=self, exporter=exporter, scavenger=scavenger,
-                                     history=history, time_range=time_range, loop=loop)
+                                     history=history, time_range=time_range, address=address,
+                                     loop=loop)
         super().__init__(max_workers, ctor, scavenger, loop=loop)
         self.distributor = distributor
         self.post = distributor.post
         self.post_list = distributor.post_list
         self.set = distributor.set
         self.get_total = distributor.get_total
-        self.exporter = FileExporter(loop=loop)
+        self.exporter = exporter
         self._checkpoint = True
-        self._t_start = time.time()
-        self._controller = FrequencyController()
+        self._clock = clock
+        self._t_start = clock()
+        self._controller = FrequencyController(time_config, clock=clock)
+        self._running = Sluice(loop=loop)
+        self._running.set()
+
+    async def _finish(self):
+        # Data exported in the background may still fail, which the stats must show
+        await self.exporter.join()
 
     async def claim(self):
         # Update status for every a few minutes
@@ -107,7 +142,9 @@ class CidCompany(BaseCompany):
             self._checkpoint = False
             self.loop.call_later(self.UPDATE_INTERVAL, self._enable_checkpoint)
 
-        # Wait for the controller
+        # Wait until resumed, then for the controller
+        while not self._running.is_set():
+            await self._running.wait()
         await self._controller.wait()
 
         # Claim an item
@@ -124,17 +161,43 @@ class CidCompany(BaseCompany):
             raise NoMoreItems('call it a day')
         return cid
 
-    def _update(self):
-        # Log current status
-        done = self.scavenger.get_success_count()
+    def pause(self):
+        """Stop claiming targets. Workers finish their current work and wait."""
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def is_paused(self):
+        return not self._running.is_set()
+
+    def set_rate(self, interval=None, busy_interval=None):
+        """Change the average intervals between claims, in common and rush hours."""
+        for value in (interval, busy_interval):
+            if value is not None and value < 0:
+                raise ValueError('interval cannot be negative: {}'.format(value))
+        if interval is not None:
+            self._controller.interval = interval
+        if busy_interval is not None:
+            self._controller.busy_interval = busy_interval
+
+    def get_rate(self):
+        """:return (float, float): intervals between claims in common and rush hours"""
+        return self._controller.interval, self._controller.busy_interval
+
+    def log_progress(self):
+        done = self.scavenger.get_success_count() + self.distributor.get_skipped_count()
         num_items = self.distributor.get_total()
-        elapsed = datetime.timedelta(seconds=round(time.time() - self._t_start))
+        elapsed = datetime.timedelta(seconds=round(self._clock() - self._t_start))
         if num_items is None:
             _logger.info('Progress: %d finished (time elapsed: %s)', done, elapsed)
         else:
             _logger.info('Progress: %.1f%% (%d finished, time elapsed: %s)',
                          done / num_items * 100, done, elapsed)
 
+    def _update(self):
+        self.log_progress()
+
         # Check host's status
         # TODO adjust workers in a more flexible way, according to 5 / interval
         len_worker = len(self._workers)
@@ -143,52 +206,70 @@ class CidCompany(BaseCompany):
                 _logger.info('Entering rush hour, cutting down workers')
                 self._fire(len_worker - 3, False)
         else:
-            if len_worker < self.max_workers:
+            if len_worker < self._intended_workers:
                 _logger.info('Leaving rush hour, hiring more workers')
-                self._hire(self.max_workers - len_worker)
+                self._hire(self._intended_workers - len_worker)
 
     def stat(self):
         stats = ['-----', 'CID Scraping']
 
         total = self.distributor.get_total()
-        cnt_success = self.scavenger.get_success_count()
-        failures = sorted(self.scavenger.get_failures())
-        cnt_failures = len(failures)
-        items_rem = sorted(self.distributor.dump(1001))
-        cnt_items_rem = len(items_rem)  # TODO total - succ - fail if possible
+        done = self.scavenger.get_done()
+        not_found = self.scavenger.get_not_found()
+        failures = self.scavenger.get_failures()
+        empty = self.scavenger.get_empty()
+        cnt_skipped = self.distributor.get_skipped_count()
+        cnt_success = len(done) + len(not_found) + len(empty)
+        # Targets of unknown number might be endless
+        limit = None if total is not None else self.DUMP_LIMIT + 1
+        items_rem = self.distributor.dump(limit)
+        cnt_items_rem = len(items_rem)
+        complete = limit is None or cnt_items_rem <= self.DUMP_LIMIT
+        if not complete:
+            items_rem = items_rem.head(self.DUMP_LIMIT)
 
         if total is None:
-            total = cnt_success + cnt_failures + cnt_items_rem \
-                if cnt_items_rem < 1001 else 'unknown'
+            total = cnt_success + cnt_skipped + len(failures) + cnt_items_rem \
+                if complete else 'unknown'
         stats.append('Total number of targets: {}'.format(total))
 
-        stats.append('Number of targets scraped: {}'.format(cnt_success))
+        stats.append('Number of targets scraped: {} ({} not found, {} empty)'.format(
+            cnt_success, len(not_found), len(empty)))
+
+        if cnt_skipped:
+            stats.append('Number of targets skipped as known dead: {}'.format(cnt_skipped))
+
+        cnt_duplicates = self.distributor.get_duplicate_count()
+        if cnt_duplicates:
+            stats.append('Number of duplicated targets ignored: {}'.format(cnt_duplicates))
 
         if failures:
             stats.append('Exceptions occured at: {} ({} in total)'.format(
-                ', '.join(map(str, failures)), cnt_failures))
+                failures.to_string(self.DUMP_LIMIT), len(failures)))
 
         if cnt_items_rem > 0:
-            if cnt_items_rem >= 1001:
-                srem = '... (1000+ items)'
-                items_rem = items_rem[:100]
-            else:
-                srem = ' ({} in total)'.format(cnt_items_rem)
+            srem = ' ({} in total)'.format(cnt_items_rem) if complete else \
+                '... ({}+ items)'.format(self.DUMP_LIMIT)
             srem = 'List of targets yet to be scraped: {}'.format(
-                ', '.join(map(str, items_rem))) + srem
+                items_rem.to_string(self.DUMP_LIMIT)) + srem
         else:
-            srem = 'All targets are scraped successfully!' if cnt_success == total else \
+            srem = 'All targets are scraped successfully!' if cnt_success + cnt_skipped == total else \
                 'All targets are either scraped successfully or skipped due to exceptions'
         stats.append(srem)
 
         return '\n'.join(stats)
 
+    def is_busy(self):
+        """Return whether it is rush hour at the host."""
+        return self._controller.is_busy()
+
     def _enable_checkpoint(self):
         self._checkpoint = True
 
     def close(self):
         super().close()
         self._controller.free()
+        self._running.set()
 
 
 class AidCompany(BaseCompany):
@@ -222,17 +303,23 @@ class BaseWorker:
     async def run(self):
         async with self.fetcher:
             while not self._stopped and not self.scavenger.is_dead():
+                item = None
                 try:
                     item = self.item = await self.distributor.claim()  # claim a target
-                    data = await self._next(item)  # get the data
+                    with tracer.span('scrape'):
+                        data = await self._next(item)  # get the data
                     self.item = None
-                    await self.exporter.dump(item, data)  # export it
+                    with tracer.span('export'):
+                        await self.exporter.dump(item, data)  # export it
                 except NoMoreItems:
                     break
                 except Exception as e:
                     self.scavenger.failure(self, e)
                 else:
-                    self.scavenger.success()
+                    self.scavenger.success(item)
+                    tracer.count('cids')
+                finally:
+                    memory.finish(item)
 
         self.stop()
         return self
@@ -256,9 +343,10 @@ class CommentWorker(BaseWorker):
     """
     # note: elements returned may not be sorted or in bad format like /12.xml
 
-    def __init__(self, *, distributor, scavenger, exporter, history, loop, time_range):
-        super().__init__(distributor=distributor, scavenger=scavenger,
-                         fetcher=CIDFetcher(loop=loop), exporter=exporter)
+    def __init__(self, *, distributor, scavenger, exporter, history, loop, time_range, address=None):
+        fetcher = CIDFetcher(loop=loop) if address is None else CIDFetcher(*address, loop=loop)
+        super().__init__(distributor=distributor, scavenger=scavenger, fetcher=fetcher,
+                         exporter=exporter)
         self.history = history
         self.start, self.end = time_range
         if self.start is None or self.end is None:
@@ -281,18 +369,19 @@ class CommentWorker(BaseWorker):
         """
         # root is always scraped, regardless of ending timestamp. For complete header?
         # Must be parsed as XML for formatting
-        latest = await self.fetcher.get_comments_root(cid)
+        latest, raw = await self.fetcher.get_comments(cid)
+        memory.check(cid)
 
         # Check if there are history comments
         has_history = False
         limit = self._find_int(latest, 'maxlimit', 1)
-        segments = self._digest(latest)
+        with tracer.span('digest'), memory.section(cid):
+            segments = self._digest(latest)
         if self.history:
             if self._len_cmt_pool_1(segments) >= limit:  # no less comments than a file could contain
                 normal = segments[0]
                 first_date = normal[0].attrib['date']
                 ds = self._find_int(latest, 'ds', 0)  # ds may not be provided
-                print(self.start, ds, self.end, first_date)
                 start, end = max(self.start, ds), min(self.end, first_date)
                 if start <= end:  # not all comments are in time range
                     has_history = True
@@ -300,8 +389,15 @@ class CommentWorker(BaseWorker):
         # Deal with history stuff
         if has_history:
             pools = tuple([segment] for segment in segments)  # pool is a list of segments
-            histories, roll_dates = await self._scrape_history(cid, pools, limit, start, end)
-            flows = [self._join(reversed(pool)) for pool in pools]  # Join segments into flows
+            try:
+                histories, roll_dates = await self._scrape_history(cid, pools, limit, start, end)
+            except (PageNotFound, ContentError) as e:
+                # The latest page was found, so the CID is not dead
+                e.on_history = True
+                raise
+            with tracer.span('join'), memory.section(cid):
+                flows = [self._join(reversed(pool)) for pool in pools]  # Join segments into flows
+            memory.check(cid)
         else:
             histories = flows = roll_dates = None
 
@@ -313,11 +409,12 @@ class CommentWorker(BaseWorker):
                 roll_dates = None
             else:  # only trim latest
                 latest = find_elems(latest, CommentFlow.ROOT_HEADERS)
+                raw = None
                 for segment in segments:
                     self._trim(segment, self.start, self.end)
                     latest.extend(segment)
 
-        return CommentFlow(latest, histories, flows, roll_dates, limit)
+        return CommentFlow(latest, histories, flows, roll_dates, limit, raw)
 
     async def _scrape_history(self, cid, pools, limit, start, end):
         """
@@ -338,7 +435,9 @@ class CommentWorker(BaseWorker):
             date = roll_dates[idate]
             _logger.debug('scraping timestamp: %s', date)
             root = await self.fetcher.get_comments_root(cid, date)
-            segments = self._digest(root)
+            memory.check(cid)
+            with tracer.span('digest'), memory.section(cid):
+                segments = self._digest(root)
             for pool, segment in zip(pools, segments):
                 pool.append(segment)
             histories[date] = root
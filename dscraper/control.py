@@ -0,0 +1,99 @@
+import logging
+import json
+
+from .server import BaseServer
+from .utils import validate_id
+
+_logger = logging.getLogger(__name__)
+
+
+class ControlServer(BaseServer):
+    """An HTTP admin API to tune a running Scraper without restarting it. Requests
+    and responses are JSON objects.
+
+    GET /stats
+        progress, workers, rates and health of each company
+    POST /workers {"max_workers": 8}
+        hire or fire workers
+    POST /rate {"interval": 1.5, "busy_interval": 6}
+        average seconds between claims in common and rush hours, either is optional
+    POST /pause, POST /resume
+        stop and restart claiming targets. Workers finish their current work first
+    POST /targets {"targets": [1, 2], "ranges": [[100, 200]]}
+        add targets, scraped only if the run has not finished yet
+    POST /checkpoint
+        log progress, flush the exporter and save the negative cache
+
+    Takes the same parameters as BaseServer, with the port 9101 by default.
+    """
+    NAME = 'Control server'
+    PORT = 9101
+    CONTENT_TYPE = 'application/json'
+
+    def __init__(self, scraper, host='127.0.0.1', port=PORT, *, loop=None):
+        super().__init__(scraper, host, port, loop=loop)
+        self._routes = {
+            ('GET', '/stats'): self._stats,
+            ('POST', '/workers'): self._workers,
+            ('POST', '/rate'): self._rate,
+            ('POST', '/pause'): self._pause,
+            ('POST', '/resume'): self._resume,
+            ('POST', '/targets'): self._targets,
+            ('POST', '/checkpoint'): self._checkpoint,
+        }
+
+    def respond(self, method, path, body):
+        method = 'GET' if method == 'HEAD' else method
+        handler = self._routes.get((method, path.rstrip('/')))
+        if handler is None:
+            if any(route_path == path.rstrip('/') for _, route_path in self._routes):
+                return self._reply(405, error='method not allowed')
+            return self._reply(404, error='no such operation: {}'.format(path))
+        try:
+            params = json.loads(body.decode()) if body.strip() else {}
+            if not isinstance(params, dict):
+                raise ValueError('expected a JSON object')
+            result = handler(**params)
+        except (ValueError, TypeError) as e:
+            return self._reply(400, error=str(e))
+        except RuntimeError as e:
+            return self._reply(409, error=str(e))
+        _logger.info('%s %s %s', method, path, body.decode().strip())
+        return self._reply(200, **(result or {'ok': True}))
+
+    def _reply(self, status, **content):
+        return status, self.CONTENT_TYPE, json.dumps(content).encode()
+
+    def _stats(self):
+        return self.scraper.get_stats()
+
+    def _workers(self, max_workers):
+        self.scraper.resize(int(max_workers))
+
+    def _rate(self, interval=None, busy_interval=None):
+        self.scraper.set_rate(None if interval is None else float(interval),
+                              None if busy_interval is None else float(busy_interval))
+
+    def _pause(self):
+        self.scraper.pause()
+
+    def _resume(self):
+        self.scraper.resume()
+
+    def _targets(self, targets=(), ranges=()):
+        targets = [int(target) for target in targets]
+        ranges = [(int(start), int(end)) for start, end in ranges]
+        if not (targets or ranges):
+            raise ValueError('no targets specified')
+        for target in targets:
+            validate_id(target)
+        for start, end in ranges:
+            if start <= 0 or end < start:
+                raise ValueError('not a valid range: {} - {}'.format(start, end))
+        for start, end in ranges:
+            self.scraper.post_range(start, end)
+        if targets:
+            self.scraper.post(targets)
+
+    def _checkpoint(self):
+        self.scraper.checkpoint()
@@ -0,0 +1,130 @@
+import logging
+import os
+import struct
+from array import array
+
+from .exporter import FileExporter, XmlSerializer, iter_pages, open_exported
+
+_logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('<4sBII')  # magic, version, number of lines, number of pages
+_LENGTH = struct.Struct('<I')
+_PAGE = struct.Struct('<qBI')  # date, flags, number of runs
+_MAGIC = b'DSDD'
+_VERSION = 1
+_RAW = 1  # the page is a single line kept as received
+
+
+def pack(flow, split=True):
+    """Pack all documents of the flow, storing each unique line, i.e. a comment or
+    a header element in bytes, only once. Each document is stored as runs of
+    consecutive lines in the table, which are few, since history documents are
+    slices of the same flows.
+
+    :param CommentFlow flow:
+    :param bool split: whether keep the history of each roll date as a document
+    :return bytes:
+    """
+    table, lines, pages = {}, [], []
+    raw = flow.get_raw()
+    if raw is not None:
+        lines.append(raw)
+        pages.append((0, _RAW, [0, 1]))
+    else:
+        serializer = XmlSerializer()
+        for date, elements in iter_pages(flow, split):
+            runs = array('I')
+            for line in serializer.lines(elements):
+                i = table.get(line)
+                if i is None:
+                    i = table[line] = len(lines)
+                    lines.append(line)
+                if runs and runs[-2] + runs[-1] == i:
+                    runs[-1] += 1
+                else:
+                    runs.extend((i, 1))
+            pages.append((date, 0, runs))
+
+    parts = [_HEADER.pack(_MAGIC, _VERSION, len(lines), len(pages))]
+    for line in lines:
+        parts.append(_LENGTH.pack(len(line)))
+        parts.append(line)
+    for date, flags, runs in pages:
+        parts.append(_PAGE.pack(date, flags, len(runs) // 2))
+        parts.append(array('I', runs).tobytes())
+    return b''.join(parts)
+
+
+def unpack(data):
+    """Reconstruct the documents packed, byte-identical to those FileExporter writes.
+
+    :param bytes data:
+    :yield (date, bytes): date is 0 for the latest page
+    """
+    magic, version, num_lines, num_pages = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError('unknown format of the packed documents')
+    view = memoryview(data)
+    pos, lines = _HEADER.size, []
+    for _ in range(num_lines):
+        length, = _LENGTH.unpack_from(data, pos)
+        pos += _LENGTH.size
+        lines.append(view[pos:pos + length])
+        pos += length
+    for _ in range(num_pages):
+        date, flags, num_runs = _PAGE.unpack_from(data, pos)
+        pos += _PAGE.size
+        runs = array('I')
+        runs.frombytes(view[pos:pos + num_runs * 2 * runs.itemsize])
+        pos += num_runs * 2 * runs.itemsize
+        parts = [] if flags & _RAW else [XmlSerializer.HEAD]
+        for i in range(0, len(runs), 2):
+            parts.extend(lines[runs[i]:runs[i] + runs[i + 1]])
+        if not flags & _RAW:
+            parts.append(XmlSerializer.TAIL)
+        yield date, b''.join(parts)
+
+
+def regenerate(filename, path):
+    """Write the original XML files from a file packed by DedupExporter, in the
+    layout of FileExporter.
+
+    :param str filename: the packed file
+    :param str path: directory to put the XML files
+    :return [str]: paths of the files written
+    """
+    with open_exported(filename) as fin:
+        data = fin.read()
+    documents = list(unpack(data))
+    cid = os.path.basename(filename).split('.', 1)[0]
+    wd = os.path.join(path, cid) if len(documents) > 1 else path
+    os.makedirs(wd, exist_ok=True)
+    written = []
+    for date, document in documents:
+        name = '{date},{cid}.xml'.format(date=date, cid=cid) if date else '{cid}.xml'.format(cid=cid)
+        written.append(os.path.join(wd, name))
+        with open(written[-1], 'wb') as fout:
+            fout.write(document)
+    return written
+
+
+class DedupExporter(FileExporter):
+    """Save all documents of a CID as one file, where each comment is stored once
+    no matter how many history documents it appears in, so that the size grows
+    with the number of unique comments rather than pages × maxlimit. The original
+    XML files can be regenerated byte-identically with regenerate().
+
+    Takes the same parameters as FileExporter, and files are named '[cid].dedup'.
+    """
+    SUFFIX = '.dedup'
+
+    def regenerate(self, cid, path):
+        """Write the original XML files of the CID exported.
+
+        :return [str]: paths of the files written
+        """
+        filename = self._cd(str(cid) + self.SUFFIX + self._SUFFIXES[self.compress])
+        return regenerate(filename, path)
+
+    def _dump(self, cid, flow, *, aid=None):
+        self._write(pack(flow, self._split), self._cd(), str(cid) + self.SUFFIX)
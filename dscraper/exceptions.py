@@ -1,5 +1,8 @@
 import logging
 import concurrent
+from collections import defaultdict
+
+from .intervals import IntervalSet
 
 _logger = logging.getLogger(__name__)
 
@@ -11,6 +14,7 @@ class DscraperError(Exception):
     """
     damage = 1
     level = logging.INFO
+    retryable = False
 
     def __init__(self, message=None, logging_level=True):
         if message is None:
@@ -31,6 +35,7 @@ class HostError(DscraperError, OSError):
     The only solution is to wait.
     """
     damage = 40
+    retryable = True
 
 
 class ConnectTimeout(HostError):
@@ -83,6 +88,14 @@ class PageNotFound(DscraperError):
     damage = 0
 
 
+class MemoryBudgetExceeded(DscraperError):
+    """Data of a single target took more memory than the budget allowed, so that
+    scraping it was aborted.
+    """
+    damage = 0
+    level = logging.WARNING
+
+
 class MultipleErrors(DscraperError):
     """The container of multiple errors."""
 
@@ -100,17 +113,26 @@ class NoMoreItems(DscraperError):
 
 
 class Scavenger:
-    """Handles and logs all exceptions."""
+    """Handles and logs all exceptions.
+
+    :param callable retry: called with the item on which a retryable error occured.
+        Returns True if the item will be distributed again, or False if it is
+        regarded as failed.
+    """
     _MAX_HEALTH = 120
     _REGEN = 12
     _UNEXPECTED_DAMAGE = 119.9
 
-    def __init__(self):
+    def __init__(self, retry=None):
         self.dead = False
+        self._retry = retry or (lambda item: False)
         self._health = self._max_health = self._MAX_HEALTH
         self._recorders = 1
-        self._cnt_success = 0
-        self._failures = []
+        self._done = IntervalSet()
+        self._not_found = IntervalSet()
+        self._empty = IntervalSet()
+        self._failures = IntervalSet()
+        self._errors = defaultdict(int)
 
     def set_recorders(self, num):
         if num < 0:
@@ -119,14 +141,27 @@ class Scavenger:
         self._max_health = self._MAX_HEALTH * num
         self._recorders = num
 
-    def success(self):
+    def success(self, item=None):
         self._health = min(self._health + self._REGEN, self._max_health)
-        self._cnt_success += 1
+        if item is not None:
+            self._done.add(item)
 
     def failure(self, worker, e=None):
+        self._fail(worker.item, e)
+
+    def export_failure(self, item, e):
+        """Records an error occured when exporting an item in the background, which
+        has been counted as a success.
+        """
+        self._done.discard(item)
+        self._fail(item, e)
+
+    def _fail(self, item, e):
         # TODO log worker type, change cid to aid or sth in logging
         # Logging exception and calculate consequence
-        cid = str(worker.item) if worker.item else '\'not started yet\''
+        cid = str(item) if item else '\'not started yet\''
+        if e is not None:
+            self._errors[type(e).__name__] += 1
         if isinstance(e, DscraperError):  # Expected error
             message = '{} at CID {}'.format(self.capitalize(e.args[0]), cid)
             if e.__cause__:
@@ -136,7 +171,7 @@ class Scavenger:
         elif isinstance(e, concurrent.futures._base.CancelledError):  # worker cancelled
             _logger.info('A worker was forced to stop')
         else:  # Unexpected error
-            _logger.exception('Unexpected exception occured during scraping cid %s', cid)
+            _logger.error('Unexpected exception occured during scraping cid %s', cid, exc_info=e)
             self._health -= self._UNEXPECTED_DAMAGE
 
         # Update status
@@ -144,22 +179,56 @@ class Scavenger:
             _logger.critical('Too many exceptions triggered. The scraper is about to stop')
             self.dead = True
 
-        # Update stats
-        if isinstance(e, PageNotFound):
-            self._cnt_success += 1
-        else:
-            if worker.item is not None:
-                self._failures.append(worker.item)
+        # Update stats. Only errors of the latest page tell that an item is dead
+        latest = not getattr(e, 'on_history', False)
+        if item is None:
+            pass
+        elif latest and isinstance(e, PageNotFound):
+            self._not_found.add(item)
+        elif latest and isinstance(e, ContentError):
+            self._empty.add(item)
+        # Transient errors are given another chance later in the run
+        elif not (getattr(e, 'retryable', False) and self._retry(item)):
+            self._failures.add(item)
         _logger.debug('health: %d / %d', self._health, self._max_health)
 
     def is_dead(self):
         return self.dead
 
+    def get_health(self):
+        """:return (float, float): the current and the maximum health"""
+        return self._health, self._max_health
+
+    def get_error_counts(self):
+        """:return {str: int}: number of errors occured by the name of their classes"""
+        return dict(self._errors)
+
     def get_failures(self):
+        """:return IntervalSet: items failed"""
         return self._failures
 
+    def get_done(self):
+        """:return IntervalSet: items scraped successfully"""
+        return self._done
+
+    def get_not_found(self):
+        """:return IntervalSet: items ended in a 404 page"""
+        return self._not_found
+
+    def get_empty(self):
+        """:return IntervalSet: items whose documents are empty"""
+        return self._empty
+
+    def get_dead(self):
+        """:return IntervalSet: items either not found or empty"""
+        dead = IntervalSet()
+        dead.update(self._not_found)
+        dead.update(self._empty)
+        return dead
+
     def get_success_count(self):
-        return self._cnt_success
+        """Return the number of items either scraped, not found or empty."""
+        return len(self._done) + len(self._not_found) + len(self._empty)
 
     @staticmethod
     def capitalize(s):
@@ -4,8 +4,28 @@ import sys
 from concurrent.futures import ThreadPoolExecutor
 from xml.sax.saxutils import escape
 import functools
+import asyncio
+import sqlite3
+import time
+import re
+import gzip
+import threading
+import json
+import csv
+import io
 
 from .utils import AutoConnector
+from .tracing import tracer
+
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 _logger = logging.getLogger(__name__)
 
@@ -31,6 +51,129 @@ class BaseExporter(AutoConnector):
         """
         raise NotImplementedError
 
+    async def join(self):
+        """Wait until all data dumped so far is exported, if it is exported in the
+        background.
+        """
+        pass
+
+    async def dump_batch(self, items):
+        """Export the data of several CIDs. Items failed do not stop the others.
+
+        :param [(cid, flow, aid)] items:
+        :return [(cid, Exception)]: items failed
+        """
+        errors = []
+        for cid, flow, aid in items:
+            try:
+                await self.dump(cid, flow, aid=aid)
+            except Exception as e:
+                errors.append((cid, e))
+        return errors
+
+
+def iter_comments(flow):
+    """Return an iterator of all comment Elements in the flow, without headers."""
+    if flow.has_history():
+        return flow.get_all_comments()
+    return (elem for elem in flow.get_latest() if elem.tag == 'd')
+
+
+def iter_pages(flow, split=True):
+    """Yield the Elements of each XML document of the flow. If split, the history of
+    each roll date is yielded first, and then the latest page. Otherwise the latest
+    page comes joined with history as the only document.
+
+    :yield (date, [Elements]): date is 0 for the latest page
+    """
+    if not flow.has_history():
+        latest = flow.get_latest()
+    elif flow.can_split() and split:
+        for date, root in flow.get_histories():
+            yield date, root
+        latest = flow.get_latest()
+    else:
+        latest = flow.get_document()
+    yield 0, latest
+
+
+def iter_documents(flow, split=True):
+    """Yield the XML documents of the flow in bytes, as iter_pages() does, or the
+    latest page as received if it was left untouched.
+
+    :yield (date, bytes): date is 0 for the latest page
+    """
+    raw = flow.get_raw()
+    if raw is not None:
+        yield 0, raw
+        return
+    serializer = XmlSerializer()
+    for date, elements in iter_pages(flow, split):
+        yield date, serializer.serialize(elements)
+
+
+class XmlSerializer:
+    """Serialize Elements into the bytes of an XML document.
+
+    The bytes of each element are cached by its tag, attribute p and text, so that
+    a comment appearing in many documents, such as in the history files of a CID,
+    where each file is parsed into new Elements, is encoded only once. Use one
+    serializer for the documents of one CID and then drop it.
+    """
+    HEAD = b'<?xml version="1.0" encoding="UTF-8"?>\n<i>\n'
+    TAIL = b'</i>'
+    _needs_escape = re.compile('[&<>]').search
+
+    def __init__(self):
+        self._cache = {}
+
+    def serialize(self, elements):
+        """
+        :param [Elements] elements:
+        :return bytes:
+        """
+        cache = self._cache
+        parts = [self.HEAD]
+        append = parts.append
+        for elem in elements:
+            key = elem.tag, elem.get('p'), elem.text
+            try:
+                append(cache[key])
+            except KeyError:
+                data = cache[key] = self._encode(elem)
+                append(data)
+        append(self.TAIL)
+        return b''.join(parts)
+
+    def lines(self, elements):
+        """Return the bytes of each element, which joined between HEAD and TAIL make
+        the document.
+
+        :param [Elements] elements:
+        :return [bytes]: the same bytes object for equal elements
+        """
+        cache = self._cache
+        lines = []
+        append = lines.append
+        for elem in elements:
+            key = elem.tag, elem.get('p'), elem.text
+            try:
+                append(cache[key])
+            except KeyError:
+                data = cache[key] = self._encode(elem)
+                append(data)
+        return lines
+
+    def _encode(self, elem):
+        text = elem.text
+        if not text:
+            text = ''
+        elif self._needs_escape(text):
+            text = escape(text)
+        if elem.tag == 'd':
+            return ('\t<d p="' + elem.attrib['p'] + '">' + text + '</d>\n').encode()
+        return ('\t<' + elem.tag + '>' + text + '</' + elem.tag + '>\n').encode()
+
 
 class StreamExporter(BaseExporter):
     """Write the output to a stream. The default stream is stdout."""
@@ -48,39 +191,325 @@ class StreamExporter(BaseExporter):
 
     async def dump(self, cid, flow, *, aid=None):
         # TODO if aid, Comments from AID and CID
-        self.write(self.stream, flow.get_document() if flow.has_history() else flow.get_latest())
+        raw = flow.get_raw()
+        if raw is not None:
+            self.stream.write(raw.decode())
+        else:
+            self.write(self.stream, flow.get_document() if flow.has_history() else flow.get_latest())
         self.stream.write(self.end)
 
     @staticmethod
     def write(stream, elements):
-        stream.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-        stream.write('<i>\n')
-        for elem in elements:
-            text = escape(elem.text) if elem.text else ''
-            stream.write('\t<d p="{attrs}">{text}</d>\n'.format(attrs=elem.attrib['p'], text=text)
-                         if elem.tag == 'd' else
-                         '\t<{tag}>{text}</{tag}>\n'.format(tag=elem.tag, text=text))
-        stream.write('</i>')
+        stream.write(XmlSerializer().serialize(elements).decode())
+
+
+class LineExporter(BaseExporter):
+    """Base class of exporters writing one comment per line, with the CID and the
+    fields decoded, for line-oriented tools.
+
+    Lines are buffered, and written when buffer_size characters are buffered, every
+    flush_interval seconds if set, and on disconnect. Output goes to stdout, or to
+    files in the path, such as 'comments-00000.jsonl', rotated after rotate_size bytes.
+
+    :param str path: directory to put files in. Write to stdout if None or '-'
+    :param int rotate_size: number of bytes after which a new file is started
+    :param int buffer_size: number of characters buffered before written
+    :param float flush_interval: maximum number of seconds a line is buffered for
+    """
+    FIELDS = ('cid', 'id', 'date', 'offset', 'mode', 'size', 'color', 'pool', 'user', 'text')
+    EXTENSION = None
+    _PREFIX = 'comments-'
+
+    def __init__(self, path=None, rotate_size=2 ** 28, buffer_size=2 ** 16, flush_interval=None, *,
+                 loop=None):
+        super().__init__('Failed to write lines', loop=loop)
+        self._home = None if path in (None, '-') else os.path.abspath(path)
+        self.rotate_size = rotate_size
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._stream = self._flusher = None
+        self._number = 0
+        self._rotatable = False  # whether any line is written to the file
+        self._buffer = []
+        self._buffered = 0
+
+    async def dump(self, cid, flow, *, aid=None):
+        if self._stream is None:
+            raise RuntimeError('{} is not connected yet'.format(type(self).__name__))
+        for cmt in iter_comments(flow):
+            attrs = cmt.attrib
+            line = self._format((cid, attrs['id'], attrs['date'], float(attrs['offset']),
+                                 int(attrs['mode']), int(attrs['font_size']), int(attrs['color']),
+                                 attrs['pool'], attrs['user'], cmt.text or ''))
+            self._buffer.append(line)
+            self._buffered += len(line)
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Write the lines buffered."""
+        if not self._buffer:
+            return
+        if self._home is not None and self._rotatable and self._stream.tell() >= self.rotate_size:
+            self._stream.close()
+            self._open_file(self._number + 1)
+        self._stream.write(''.join(self._buffer))
+        self._buffer, self._buffered = [], 0
+        self._rotatable = True
+        if self._home is None:
+            self._stream.flush()
+
+    async def _open_connection(self):
+        if self._home is None:
+            self._stream = sys.stdout
+            self._write_header()
+        else:
+            os.makedirs(self._home, exist_ok=True)
+            self._open_file(self._next_number())
+        if self.flush_interval:
+            self._flusher = asyncio.ensure_future(self._flush_periodically(), loop=self.loop)
+
+    async def disconnect(self):
+        if self._stream is None:
+            return
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        try:
+            self.flush()
+        finally:
+            if self._home is not None:
+                self._stream.close()
+            self._stream = None
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    def _open_file(self, number):
+        self._number, self._rotatable = number, False
+        filename = '{}{:05d}{}'.format(self._PREFIX, number, self.EXTENSION)
+        self._stream = open(os.path.join(self._home, filename), 'w', encoding='utf-8', newline='')
+        self._write_header()
+        _logger.debug('Writing lines to %s', filename)
+
+    def _next_number(self):
+        # Never overwrite the files of previous runs
+        numbers = [int(filename[len(self._PREFIX):-len(self.EXTENSION)])
+                   for filename in os.listdir(self._home)
+                   if filename.startswith(self._PREFIX) and filename.endswith(self.EXTENSION)]
+        return max(numbers) + 1 if numbers else 0
+
+    def _write_header(self):
+        pass
+
+    def _format(self, row):
+        """
+        :param tuple row: values of FIELDS
+        :return str: the line ending with a newline
+        """
+        raise NotImplementedError
+
+
+class JsonLinesExporter(LineExporter):
+    """Write each comment as a JSON object per line. See LineExporter."""
+    EXTENSION = '.jsonl'
+
+    def _format(self, row):
+        return json.dumps(dict(zip(self.FIELDS, row)), ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+class CsvExporter(LineExporter):
+    """Write each comment as a CSV record, after a header of the fields. See
+    LineExporter.
+    """
+    EXTENSION = '.csv'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._line = io.StringIO()
+        self._writer = csv.writer(self._line, lineterminator='\n')
+
+    def _write_header(self):
+        self._stream.write(self._format(self.FIELDS))
+
+    def _format(self, row):
+        self._line.seek(0)
+        self._line.truncate()
+        self._writer.writerow(row)
+        return self._line.getvalue()
+
+
+class ExportQueue(BaseExporter):
+    """Decouples workers from an exporter, so that fetching and exporting overlap.
+
+    Data dumped is put into a bounded queue and exported in batches by consumers
+    in the background. When the queue is full, dump() blocks, which in turn stops
+    the worker from claiming the next target, so that a slow exporter throttles
+    the scraping instead of making data pile up in memory.
+
+    :param exporter exporter: where data is finally exported
+    :param int depth: maximum number of CIDs waiting in the queue
+    :param int batch_size: maximum number of CIDs exported at once
+    :param int consumers: number of batches exported at the same time
+    :param Scavenger scavenger: where export errors are reported
+    """
+
+    def __init__(self, exporter, depth=32, batch_size=8, consumers=2, *, scavenger=None,
+                 loop=None):
+        super().__init__(loop=loop)
+        if depth <= 0 or batch_size <= 0 or consumers <= 0:
+            raise ValueError('depth, batch size and number of consumers must be positive')
+        self.exporter = exporter
+        self.depth, self.batch_size, self.consumers = depth, batch_size, consumers
+        self.scavenger = scavenger
+        self._queue = None
+        self._consumers = []
+
+    async def dump(self, cid, flow, *, aid=None):
+        if self._queue is None:
+            raise RuntimeError('ExportQueue is not connected yet')
+        await self._queue.put((cid, flow, aid))
+
+    async def connect(self):
+        await self.exporter.connect()
+        self._queue = asyncio.Queue(self.depth)
+        self._consumers = [asyncio.ensure_future(self._consume(), loop=self.loop)
+                           for _ in range(self.consumers)]
+
+    async def disconnect(self):
+        if self._queue is None:
+            return
+        try:
+            for _ in self._consumers:
+                await self._queue.put(None)
+            await asyncio.gather(*self._consumers)
+        finally:
+            self._queue = None
+            self._consumers = []
+            await self.exporter.disconnect()
+
+    async def join(self):
+        """Wait until all CIDs in the queue are exported, and their failures reported."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    def qsize(self):
+        """Return the number of CIDs waiting in the queue."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _consume(self):
+        closing = False
+        while not closing:
+            item = await self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+            batch = [item]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    self._queue.task_done()
+                    closing = True
+                    break
+                batch.append(item)
+            try:
+                with tracer.span('export_batch'):
+                    errors = await self.exporter.dump_batch(batch)
+            except Exception as e:
+                errors = [(cid, e) for cid, _, _ in batch]
+            for cid, e in errors:
+                if self.scavenger is not None:
+                    self.scavenger.export_failure(cid, e)
+                else:
+                    _logger.error('Failed to export CID %s: %s', cid, e)
+            for _ in batch:
+                self._queue.task_done()
+
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+_GZIP_MAGIC = b'\x1f\x8b'
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+def open_exported(path, dictionary=None):
+    """Open a file saved by FileExporter for reading in binary mode, whether it is
+    plain, gzipped or compressed by zstd.
+
+    :param str path:
+    :param bytes dictionary: zstd dictionary the file was compressed with. Looked
+        up next to the file and in its parent directory if not given
+    :return file object:
+    """
+    with open(path, 'rb') as fin:
+        magic = fin.read(len(_ZSTD_MAGIC))
+    if magic.startswith(_GZIP_MAGIC):
+        return gzip.open(path, 'rb')
+    if magic != _ZSTD_MAGIC:
+        return open(path, 'rb')
+    if zstandard is None:
+        raise ImportError('zstandard is required to read {}'.format(path))
+    if dictionary is None:
+        dictionary = _find_dictionary(os.path.dirname(os.path.abspath(path)))
+    if dictionary is not None:
+        dictionary = zstandard.ZstdCompressionDict(dictionary)
+    decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+    return decompressor.stream_reader(open(path, 'rb'), closefd=True)
+
+
+def _find_dictionary(wd):
+    for directory in (wd, os.path.dirname(wd)):
+        try:
+            with open(os.path.join(directory, FileExporter.DICTIONARY), 'rb') as fin:
+                return fin.read()
+        except FileNotFoundError:
+            pass
+    return None
 
 
 class FileExporter(BaseExporter):
     """Save comments as XML files.
 
+    With zstd compression, a dictionary is trained on the first DICT_SAMPLES files
+    and saved as DICTIONARY in the path, so that small files of the same kind
+    compress well. Those files are held in memory until the dictionary is ready.
+    An existing dictionary in the path is reused. Use open_exported() to read the
+    files in any format.
+
     :param str path: path to put files. Default as './comments'.
     :param bool join: whether save all comments in one file along with history,
         or keep them separate as the original form. Notice: if choose not to
         join files, the resulting files could take huge space because of
         duplication.
+    :param int max_threads: maximum number of threads writing files
+    :param str compress: None, 'gzip' or 'zstd'. zstd requires zstandard
+    :param int level: compression level. Default as the one of the format
     """
     _OUT_DIR = 'comments'
+    _SUFFIXES = {None: '', GZIP: '.gz', ZSTD: '.zst'}
+    _DEFAULT_LEVELS = {None: None, GZIP: 6, ZSTD: 3}
+    DICTIONARY = 'dictionary.zstd'
+    DICT_SAMPLES = 512
+    DICT_SIZE = 112640
 
-    def __init__(self, path=None, join=False, *, loop=None):
+    def __init__(self, path=None, join=False, max_threads=None, compress=None, level=None, *,
+                 loop=None):
         super().__init__('Failed to save as files', loop=loop)
+        if compress not in self._SUFFIXES:
+            raise ValueError('unknown compression: {}'.format(compress))
         if path is None:
             path = self._OUT_DIR
         self._home = os.path.abspath(path)
         self._split = not join
+        self.max_threads = max_threads
+        self.compress = compress
+        self.level = self._DEFAULT_LEVELS[compress] if level is None else level
         self._executor = None
+        self._lock = threading.Lock()
+        self._dictionary = None
+        self._pending = None
 
     async def dump(self, *args, **kwargs):
         try:
@@ -89,80 +518,517 @@ class FileExporter(BaseExporter):
         except AttributeError:
             raise RuntimeError('FileExporter is not connected yet') from None
 
+    async def dump_batch(self, items):
+        # One job for all items, rather than one for each
+        return await self.loop.run_in_executor(self._executor, self._dump_batch, items)
+
+    def _dump_batch(self, items):
+        errors = []
+        for cid, flow, aid in items:
+            try:
+                self._dump(cid, flow, aid=aid)
+            except Exception as e:
+                errors.append((cid, e))
+        return errors
+
     def _dump(self, cid, flow, *, aid=None):
         # TODO if aid, dir: comments/av+aid/cid/*.xml
         wd = self._cd()
-        if not flow.has_history():
-            latest = flow.get_latest()
-        elif flow.can_split() and self._split:
-            wd = self._cd(cid)
-            for date, root in flow.get_histories():
-                self._write(root, wd, '{date},{cid}.xml'.format(cid=cid, date=date))
-            latest = flow.get_latest()
-        else:
-            latest = flow.get_document()
-        self._write(latest, wd, '{cid}.xml'.format(cid=cid))
+        for date, data in iter_documents(flow, self._split):
+            if date:
+                wd = self._cd(cid)
+                self._write(data, wd, '{date},{cid}.xml'.format(cid=cid, date=date))
+            else:
+                self._write(data, wd, '{cid}.xml'.format(cid=cid))
 
     async def _open_connection(self):
         wd = self._cd()
         os.makedirs(wd, exist_ok=True)
-        self._executor = ThreadPoolExecutor()
+        if self.compress == ZSTD:
+            if zstandard is None:
+                raise ImportError('zstandard is required to compress with zstd')
+            data = _find_dictionary(wd)
+            if data is None:
+                self._pending = []
+            else:
+                self._dictionary = self._load_dictionary(data)
+        self._executor = ThreadPoolExecutor(self.max_threads)
 
     async def disconnect(self):
+        if self._pending:
+            # Not enough files for the samples, but they have to be written anyway
+            await self.loop.run_in_executor(self._executor, self._train_locked)
         self._executor.shutdown()
 
     def _cd(self, path=''):
         """Change working directory from home."""
         return os.path.join(self._home, str(path))
 
-    def _write(self, elements, wd, filename):
+    def _write(self, data, wd, filename):
+        filename += self._SUFFIXES[self.compress]
+        if self._pending is not None:
+            with self._lock:
+                if self._pending is not None:
+                    self._pending.append((data, wd, filename))
+                    if len(self._pending) >= self.DICT_SAMPLES:
+                        self._train()
+                    return
+        self._write_file(self._compress(data), wd, filename)
+
+    def _write_file(self, data, wd, filename):
         _logger.debug('Writing to %s', filename)
         os.makedirs(wd, exist_ok=True)
-        with open(os.path.join(wd, filename), 'w') as fout:
-            StreamExporter.write(fout, elements)
+        with open(os.path.join(wd, filename), 'wb') as fout:
+            fout.write(data)
         _logger.debug('Writing to %s completed', filename)
 
+    def _compress(self, data):
+        if self.compress == GZIP:
+            return gzip.compress(data, self.level)
+        elif self.compress == ZSTD:
+            # Compressors are not thread-safe
+            return zstandard.ZstdCompressor(level=self.level, dict_data=self._dictionary).compress(data)
+        return data
+
+    def _train_locked(self):
+        with self._lock:
+            if self._pending:
+                self._train()
+
+    def _train(self):
+        """Train the dictionary on the files pending, and write them.
+
+        Must be called with the lock held. Files are pending until the dictionary is
+        ready, so that others wait for it on the lock rather than go without it.
+        """
+        pending = self._pending
+        try:
+            dictionary = zstandard.train_dictionary(self.DICT_SIZE, [data for data, _, _ in pending])
+        except zstandard.ZstdError as e:
+            _logger.warning('Failed to train the zstd dictionary, compressing without one: %s', e)
+        else:
+            with open(self._cd(self.DICTIONARY), 'wb') as fout:
+                fout.write(dictionary.as_bytes())
+            self._dictionary = self._load_dictionary(dictionary.as_bytes())
+            _logger.debug('zstd dictionary trained on %d files', len(pending))
+        self._pending = None
+        for data, wd, filename in pending:
+            self._write_file(self._compress(data), wd, filename)
+
+    def _load_dictionary(self, data):
+        dictionary = zstandard.ZstdCompressionDict(data)
+        dictionary.precompute_compress(level=self.level)
+        return dictionary
+
 
 class MysqlExporter(BaseExporter):
-    """Intended features:
-        auto-reconnect on connection lost,
-        switch to a new table the current one contains to many rows
+    """Insert comments into a MySQL database with the schema of cmtdb.sql.
+
+    Rows of the CIDs dumped at once, as ExportQueue does with a batch, are flushed
+    as multi-row INSERT IGNORE statements as large as the server accepts, over a small
+    pool of connections, before the call returns. A statement failed because of a lost
+    connection is retried on a new one. When the comments table grows beyond max_rows,
+    a new table of the same structure is created and used instead, named with an
+    increasing suffix such as comments_1.
+
+    Requires aiomysql.
+
+    :param dict config: keyword arguments to connect to the server, such as host, port,
+        user, password and db
+    :param int pool_size: maximum number of connections, which is also the maximum
+        number of flushes running at the same time
+    :param int buffer_size: number of bytes of rows of a batch flushed together
+    :param int max_rows: number of rows the comments table could contain
     """
+    _TABLE = 'comments'
+    _RETRIES = 2
+    _CONNECTION_LOST = (2006, 2013)
+    _PACKET_MARGIN = 1024
+    _MAX_CONTENT = 1000
+    _SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS `chatmetadata` (
+            `chat_id` int(10) unsigned NOT NULL,
+            `chat_source` varchar(10) COLLATE utf8mb4_unicode_ci NOT NULL DEFAULT '',
+            `chat_max_limit` int(10) unsigned NOT NULL DEFAULT '0',
+            `chat_mission` varchar(100) COLLATE utf8mb4_unicode_ci NOT NULL DEFAULT '',
+            `chat_crawled_time` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            `av_id` int(10) unsigned NOT NULL DEFAULT '0',
+            PRIMARY KEY (`chat_id`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+        """CREATE TABLE IF NOT EXISTS `comments` (
+            `cmt_id` bigint(10) unsigned NOT NULL,
+            `cmt_time` float NOT NULL,
+            `cmt_mode` tinyint(1) NOT NULL DEFAULT '1',
+            `cmt_size` tinyint(3) unsigned NOT NULL DEFAULT '25',
+            `cmt_color` mediumint(8) unsigned NOT NULL DEFAULT '16777215',
+            `cmt_date` timestamp NOT NULL DEFAULT '1970-01-01 08:00:01',
+            `cmt_pool` tinyint(2) NOT NULL DEFAULT '0',
+            `cmt_user_id` varchar(8) COLLATE utf8mb4_unicode_ci NOT NULL,
+            `cmt_content` varchar(1000) COLLATE utf8mb4_unicode_ci NOT NULL,
+            `chat_id` int(10) unsigned NOT NULL,
+            PRIMARY KEY (`cmt_id`,`cmt_date`),
+            KEY `cmt_foreign_cid_idx` (`chat_id`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+        """CREATE TABLE IF NOT EXISTS `specialcomments` (
+            `cmt_id` bigint(10) unsigned NOT NULL,
+            `cmt_date` timestamp NOT NULL DEFAULT '1970-01-01 08:00:01',
+            `cmt_user_id` varchar(8) COLLATE utf8mb4_unicode_ci NOT NULL,
+            `cmt_content` mediumtext COLLATE utf8mb4_unicode_ci NOT NULL,
+            `chat_id` int(10) unsigned NOT NULL,
+            PRIMARY KEY (`cmt_id`,`cmt_date`),
+            KEY `spcmt_foreign_cid_idx` (`chat_id`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"""
+    )
+    _INSERT_CHAT = ('INSERT INTO chatmetadata (chat_id, chat_source, chat_max_limit, chat_mission, '
+                    'av_id) VALUES {} ON DUPLICATE KEY UPDATE chat_crawled_time = CURRENT_TIMESTAMP')
+    _INSERT_CMT = ('INSERT IGNORE INTO {table} (cmt_id, cmt_date, cmt_user_id, cmt_content, chat_id, '
+                   'cmt_time, cmt_mode, cmt_size, cmt_color, cmt_pool) VALUES {{}}')
+    _INSERT_SPCMT = ('INSERT IGNORE INTO specialcomments (cmt_id, cmt_date, cmt_user_id, cmt_content, '
+                     'chat_id) VALUES {}')
+    _ROW_CHAT = '({},{},{},{},{})'
+    _ROW_CMT = '({},FROM_UNIXTIME({}),{},{},{},{!r},{},{},{},{})'
+    _ROW_SPCMT = '({},FROM_UNIXTIME({}),{},{},{})'
+    _ESCAPE_TABLE = str.maketrans({'\0': '\\0', '\\': '\\\\', '\n': '\\n', '\r': '\\r',
+                                   "'": "\\'", '"': '\\"', '\x1a': '\\Z'})
 
-    def __init__(self, *, loop=None):
+    def __init__(self, config, pool_size=4, buffer_size=2 ** 20, max_rows=50000000, *,
+                 loop=None):
         super().__init__('Failed to insert into the database', loop=loop)
-        # TODO wait until connect
-        # if cmtdb is not created, create and set encoding
-        # SET NAMES utf8mb4 COLLATE utf8mb4_unicode_ci;
-        raise NotImplementedError
+        self.config = dict(config)
+        self.pool_size = pool_size
+        self.buffer_size = buffer_size
+        self.max_rows = max_rows
+        self.table = self._TABLE
+        self._pool = None
+        self._max_packet = None
+        self._rows = 0
+        self._lock_table = self._sem = None
 
     async def dump(self, cid, flow, *, aid=None):
-        # TODO
-        # d._user = int(user, 16)
-        # d._is_tourist = (user[0] == 'D')
-        pass
+        errors = await self.dump_batch([(cid, flow, aid)])
+        if errors:
+            raise errors[0][1]
+
+    async def dump_batch(self, items):
+        """Insert the rows of the CIDs before returning, in flushes of about buffer_size
+        bytes. All CIDs of a flush failed are reported failed.
+        """
+        if self._pool is None:
+            raise RuntimeError('MysqlExporter is not connected yet')
+        errors, flushes = [], []
+        rows = _MysqlRows()
+        for cid, flow, aid in items:
+            try:
+                self._add_rows(rows, cid, flow, aid)
+            except Exception as e:
+                errors.append((cid, e))
+                continue
+            if rows.size >= self.buffer_size:
+                flushes.append(rows)
+                rows = _MysqlRows()
+        if rows.cids:
+            flushes.append(rows)
+        results = await asyncio.gather(*[self._flush(rows) for rows in flushes],
+                                       return_exceptions=True)
+        for rows, result in zip(flushes, results):
+            if isinstance(result, Exception):
+                errors.extend((cid, result) for cid in rows.cids)
+        return errors
+
+    def _add_rows(self, rows, cid, flow, aid):
+        header = {elem.tag: elem.text for elem in flow.get_latest() if elem.tag != 'd'}
+        chats, cmts, spcmts = [], [], []
+        self._buffer(chats, self._ROW_CHAT.format(
+            int(cid), self._literal(header.get('source') or ''),
+            int(header.get('maxlimit') or 0), self._literal(header.get('mission') or ''),
+            int(aid or 0)))
+        for cmt in iter_comments(flow):
+            attrs = cmt.attrib
+            text = cmt.text or ''
+            if attrs['pool'] == 2:
+                row = self._ROW_SPCMT.format(attrs['id'], attrs['date'], self._literal(attrs['user']),
+                                             self._literal(text), int(cid))
+                self._buffer(spcmts, row)
+            else:
+                row = self._ROW_CMT.format(
+                    attrs['id'], attrs['date'], self._literal(attrs['user']),
+                    self._literal(text[:self._MAX_CONTENT]), int(cid), float(attrs['offset']),
+                    int(attrs['mode']), int(attrs['font_size']), int(attrs['color']), attrs['pool'])
+                self._buffer(cmts, row)
+        # Added only when all rows of the CID are made, not to insert part of them
+        rows.cids.append(cid)
+        for buffered, added in ((rows.chats, chats), (rows.cmts, cmts), (rows.spcmts, spcmts)):
+            buffered.extend(added)
+            rows.size += sum(size for _, size in added)
 
     async def _open_connection(self):
-        pass
+        if aiomysql is None:
+            raise ImportError('MysqlExporter requires aiomysql')
+        self._pool = await aiomysql.create_pool(minsize=1, maxsize=self.pool_size,
+                                                charset='utf8mb4', autocommit=True,
+                                                loop=self.loop, **self.config)
+        await self._setup()
 
     async def disconnect(self):
-        pass
+        if self._pool is None:
+            return
+        self._pool.close()
+        await self._pool.wait_closed()
+        self._pool = None
+
+    async def _setup(self):
+        self._sem = asyncio.Semaphore(self.pool_size)
+        self._lock_table = asyncio.Lock()
+        for statement in self._SCHEMA:
+            await self._execute(statement)
+        (max_packet,), = await self._execute('SELECT @@max_allowed_packet', fetch=True)
+        self._max_packet = int(max_packet) - self._PACKET_MARGIN
+
+        # Continue with the latest table
+        tables = await self._execute("SHOW TABLES LIKE '{}%'".format(self._TABLE), fetch=True)
+        suffixes = [int(name[len(self._TABLE) + 1:] or 0) for name, in tables
+                    if re.fullmatch(self._TABLE + r'(_\d+)?', name)]
+        if suffixes and max(suffixes) > 0:
+            self.table = '{}_{}'.format(self._TABLE, max(suffixes))
+        rows = await self._execute(
+            "SELECT TABLE_ROWS FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = '{}'".format(self.table), fetch=True)
+        self._rows = int(rows[0][0] or 0) if rows else 0
+        _logger.debug('Inserting into table %s of about %d rows', self.table, self._rows)
+
+    @staticmethod
+    def _buffer(rows, row):
+        rows.append((row, len(row.encode()) + 1))
+
+    async def _flush(self, rows):
+        # Flushes beyond the size of the pool wait for a free connection
+        async with self._sem:
+            await self._insert(rows.chats, rows.cmts, rows.spcmts)
+
+    async def _insert(self, chats, cmts, spcmts):
+        # Metadata first, which comments refer to
+        for statement in self._pack(self._INSERT_CHAT, chats, self._max_packet):
+            await self._execute(statement)
+        for statement in self._pack(self._INSERT_SPCMT, spcmts, self._max_packet):
+            await self._execute(statement)
+        template = self._INSERT_CMT.format(table=self.table)
+        for statement in self._pack(template, cmts, self._max_packet):
+            self._rows += await self._execute(statement)
+        if self._rows >= self.max_rows:
+            await self._rotate()
+
+    async def _rotate(self):
+        async with self._lock_table:
+            if self._rows < self.max_rows:
+                return
+            match = re.fullmatch(self._TABLE + r'_(\d+)', self.table)
+            table = '{}_{}'.format(self._TABLE, int(match.group(1)) + 1 if match else 1)
+            await self._execute('CREATE TABLE IF NOT EXISTS {} LIKE {}'.format(table, self._TABLE))
+            _logger.info('Table %s is full, switching to %s', self.table, table)
+            self.table, self._rows = table, 0
+
+    async def _execute(self, statement, fetch=False):
+        """Execute a statement, retrying on lost connections.
+
+        :return: all rows if fetch, or else the number of affected rows
+        """
+        tries = 0
+        while True:
+            try:
+                async with self._pool.acquire() as conn:
+                    async with conn.cursor() as cur:
+                        await cur.execute(statement)
+                        return await cur.fetchall() if fetch else cur.rowcount
+            except Exception as e:
+                if tries >= self._RETRIES or not (e.args and e.args[0] in self._CONNECTION_LOST):
+                    raise
+                _logger.info('Connection to MySQL was lost, reconnecting')
+                tries += 1
+
+    @classmethod
+    def _literal(cls, text):
+        return "'" + text.translate(cls._ESCAPE_TABLE) + "'"
+
+    @staticmethod
+    def _pack(template, rows, max_size):
+        """Yield multi-row statements, each no larger than max_size bytes.
+
+        :param str template: statement with '{}' where rows should be
+        :param [(str, int)] rows: rows and their sizes in bytes
+        """
+        base = len(template.encode())
+        values, size = [], base
+        for row, row_size in rows:
+            if values and size + row_size > max_size:
+                yield template.format(','.join(values))
+                values, size = [], base
+            values.append(row)
+            size += row_size
+        if values:
+            yield template.format(','.join(values))
+
+
+class _MysqlRows:
+    """Rows of the CIDs inserted in one flush, each a (row, size in bytes) pair."""
+    __slots__ = ('cids', 'chats', 'cmts', 'spcmts', 'size')
+
+    def __init__(self):
+        self.cids, self.chats, self.cmts, self.spcmts = [], [], [], []
+        self.size = 0
 
 
 class SqliteExporter(BaseExporter):
+    """Insert comments into an SQLite database with the schema of cmtdb.sql.
 
-    def __init__(self, *, loop=None):
+    Comments of the CIDs dumped at once, as ExportQueue does with a batch, are written
+    by a single dedicated thread in one transaction. Comments of the same ID and date,
+    which appear repeatedly in history, are inserted only once.
+
+    :param str path: directory to put the database in. Default as './comments'.
+    :param bool defer_index: whether create secondary indexes after all the comments
+        are inserted, which is much faster for bulk loads
+    """
+    _OUT_DIR = 'comments'
+    _FILENAME = 'cmtdb.sqlite'
+    _SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS chatmetadata (
+            chat_id INTEGER NOT NULL PRIMARY KEY,
+            chat_source TEXT NOT NULL DEFAULT '',
+            chat_max_limit INTEGER NOT NULL DEFAULT 0,
+            chat_mission TEXT NOT NULL DEFAULT '',
+            chat_crawled_time INTEGER NOT NULL,
+            av_id INTEGER NOT NULL DEFAULT 0)""",
+        """CREATE TABLE IF NOT EXISTS comments (
+            cmt_id INTEGER NOT NULL,
+            cmt_time REAL NOT NULL,
+            cmt_mode INTEGER NOT NULL DEFAULT 1,
+            cmt_size INTEGER NOT NULL DEFAULT 25,
+            cmt_color INTEGER NOT NULL DEFAULT 16777215,
+            cmt_date INTEGER NOT NULL,
+            cmt_pool INTEGER NOT NULL DEFAULT 0,
+            cmt_user_id TEXT NOT NULL,
+            cmt_content TEXT NOT NULL,
+            chat_id INTEGER NOT NULL,
+            PRIMARY KEY (cmt_id, cmt_date)) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS specialcomments (
+            cmt_id INTEGER NOT NULL,
+            cmt_date INTEGER NOT NULL,
+            cmt_user_id TEXT NOT NULL,
+            cmt_content TEXT NOT NULL,
+            chat_id INTEGER NOT NULL,
+            PRIMARY KEY (cmt_id, cmt_date)) WITHOUT ROWID"""
+    )
+    _INDEXES = (
+        'CREATE INDEX IF NOT EXISTS cmt_foreign_cid_idx ON comments (chat_id)',
+        'CREATE INDEX IF NOT EXISTS spcmt_foreign_cid_idx ON specialcomments (chat_id)'
+    )
+    _INSERT_CHAT = ('INSERT OR REPLACE INTO chatmetadata (chat_id, chat_source, chat_max_limit, '
+                    'chat_mission, chat_crawled_time, av_id) VALUES (?, ?, ?, ?, ?, ?)')
+    _INSERT_CMT = ('INSERT OR IGNORE INTO comments (cmt_id, cmt_time, cmt_mode, cmt_size, '
+                   'cmt_color, cmt_date, cmt_pool, cmt_user_id, cmt_content, chat_id) '
+                   'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)')
+    _INSERT_SPCMT = ('INSERT OR IGNORE INTO specialcomments (cmt_id, cmt_date, cmt_user_id, '
+                     'cmt_content, chat_id) VALUES (?, ?, ?, ?, ?)')
+
+    def __init__(self, path=None, defer_index=True, *, loop=None):
         super().__init__('Failed to insert into the database', loop=loop)
-        raise NotImplementedError
+        if path is None:
+            path = self._OUT_DIR
+        self._home = os.path.abspath(path)
+        self.defer_index = defer_index
+        self._executor = None
+        self._conn = None
 
     async def dump(self, cid, flow, *, aid=None):
-        pass
+        errors = await self.dump_batch([(cid, flow, aid)])
+        if errors:
+            raise errors[0][1]
+
+    async def dump_batch(self, items):
+        if self._executor is None:
+            raise RuntimeError('SqliteExporter is not connected yet')
+        return await self.loop.run_in_executor(self._executor, self._write, items)
 
     async def _open_connection(self):
-        pass
+        self._executor = ThreadPoolExecutor(1)
+        await self.loop.run_in_executor(self._executor, self._setup)
 
     async def disconnect(self):
-        pass
+        if self._executor is None:
+            return
+        try:
+            await self.loop.run_in_executor(self._executor, self._teardown)
+        finally:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _setup(self):
+        os.makedirs(self._home, exist_ok=True)
+        conn = self._conn = sqlite3.connect(os.path.join(self._home, self._FILENAME))
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        with conn:
+            for statement in self._SCHEMA:
+                conn.execute(statement)
+            if not self.defer_index:
+                for statement in self._INDEXES:
+                    conn.execute(statement)
+
+    def _teardown(self):
+        if self._conn is None:
+            return
+        if self.defer_index:
+            _logger.debug('Creating indexes')
+            with self._conn:
+                for statement in self._INDEXES:
+                    self._conn.execute(statement)
+        self._conn.close()
+        self._conn = None
+
+    def _write(self, batch):
+        """Insert the comments of the batch in one transaction.
+
+        :return [(cid, Exception)]: CIDs failed, which are all of them if the
+            transaction failed
+        """
+        chats, cmts, spcmts, errors = [], [], [], []
+        now = int(time.time())
+        for cid, flow, aid in batch:
+            try:
+                rows = self._make_rows(cid, flow, aid, now)
+            except Exception as e:
+                errors.append((cid, e))
+                continue
+            for buffered, added in zip((chats, cmts, spcmts), rows):
+                buffered.extend(added)
+        if not chats:
+            return errors
+        try:
+            with self._conn:
+                self._conn.executemany(self._INSERT_CHAT, chats)
+                self._conn.executemany(self._INSERT_CMT, cmts)
+                self._conn.executemany(self._INSERT_SPCMT, spcmts)
+        except Exception as e:
+            return errors + [(chat[0], e) for chat in chats]
+        _logger.debug('%d CIDs and %d comments inserted', len(chats), len(cmts) + len(spcmts))
+        return errors
+
+    @staticmethod
+    def _make_rows(cid, flow, aid, now):
+        cmts, spcmts = [], []
+        header = {elem.tag: elem.text for elem in flow.get_latest() if elem.tag != 'd'}
+        chat = (cid, header.get('source') or '', int(header.get('maxlimit') or 0),
+                header.get('mission') or '', now, aid or 0)
+        for cmt in iter_comments(flow):
+            attrs = cmt.attrib
+            text = cmt.text or ''
+            if attrs['pool'] == 2:
+                spcmts.append((attrs['id'], attrs['date'], attrs['user'], text, cid))
+            else:
+                cmts.append((attrs['id'], float(attrs['offset']), int(attrs['mode']),
+                             int(attrs['font_size']), int(attrs['color']), attrs['date'],
+                             attrs['pool'], attrs['user'], text, cid))
+        return [chat], cmts, spcmts
 
 
 class MemoryExporter(BaseExporter):
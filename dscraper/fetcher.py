@@ -1,6 +1,7 @@
 import logging
 import asyncio
 import re
+import time
 from collections import defaultdict
 import zlib
 
@@ -8,6 +9,8 @@ from .utils import (AutoConnector, parse_comments_xml, parse_rolldate_json,
                     escape_invalid_xml_chars, aretry)
 from .exceptions import (HostError, ConnectTimeout, ReadTimeout, ResponseError, MultipleErrors,
                          NoResponseReadError, PageNotFound, DecodeError)
+from .tracing import tracer
+from .memory import memory
 from . import __version__
 
 _logger = logging.getLogger(__name__)
@@ -58,6 +61,13 @@ class BaseFetcher:
         Instead create multiple Fetcher objects.
 
         :param string uri: the URI to fetch content from
+        :raise: HostError, DecodeError, PageNotFound
+        """
+        return decode(await self.get_raw(uri))
+
+    async def get_raw(self, uri):
+        """Fetch the content as inflated bytes, without decoding.
+
         :raise: HostError, DecodeError, PageNotFound
         """
         # try to get the response
@@ -74,20 +84,33 @@ class CIDFetcher(BaseFetcher):
     HISTORY_URI = '/dmroll,{timestamp},{cid}'
     ROLLDATE_URI = '/rolldate,{cid}'
 
-    def __init__(self, *, loop):
-        super().__init__(HOST_CID, loop=loop)
+    def __init__(self, host=HOST_CID, port=PORT, *, loop):
+        super().__init__(host, port, loop=loop)
 
-    @aretry
     async def get_comments_root(self, cid, date=0):
+        root, _ = await self.get_comments(cid, date)
+        return root
+
+    @aretry
+    async def get_comments(self, cid, date=0):
+        """
+        :return (Element, bytes): root of the parsed document, and the document as
+            received, which is None if it had to be escaped before parsing
+        """
         if date == 0:
             uri = self.CURRENT_URI.format(cid=cid)
         else:
             uri = self.HISTORY_URI.format(timestamp=date, cid=cid)
 
-        text = await self.get(uri)
-        # Escape invalid XML chracters with their hexadecimal notations
-        text = escape_invalid_xml_chars(text)
-        return parse_comments_xml(text)
+        raw = await self.get_raw(uri)
+        with tracer.span('parse'), memory.section(cid):
+            text = decode(raw)
+            # Escape invalid XML chracters with their hexadecimal notations
+            escaped = escape_invalid_xml_chars(text)
+            root = parse_comments_xml(escaped)
+        if memory.enabled:
+            memory.count(cid, 1, sum(1 for elem in root if elem.tag == 'd'))
+        return root, raw if escaped == text else None
 
     @aretry
     async def get_rolldate_json(self, cid):
@@ -150,9 +173,10 @@ class Session(AutoConnector):
         """Retries on failure. Raises all distinct errors when max retries exceeded.
 
         :param string uri: URI to request from
-        :return string: decoded body of the response
+        :return bytes: inflated body of the response
         """
         request = self._template.format(uri=uri).encode('ascii')
+        tracer.count('requests')
         errors = []
         retries = 0
         while True:
@@ -176,11 +200,13 @@ class Session(AutoConnector):
         if self._get_status_code(headers) == 404:
             raise PageNotFound('404 page')
 
-        return self._inflate_and_decode(body)
+        with tracer.span('inflate'):
+            return self._inflate(body)
 
     async def _get(self, request):
         # send the request and read the response
         self._writer.write(request)
+        tracer.count('bytes_out', len(request))
         try:
             await self._writer.drain()
             response = await self._read()
@@ -202,6 +228,7 @@ class Session(AutoConnector):
         # TODO Still get frozen occasionally upon reading a 404 page. Save response to debug
         response = b''
         content_length = is_chunked = None
+        started = time.perf_counter() if tracer.enabled else None
 
         while True:
             coro_read = self._reader.read(16384)
@@ -211,6 +238,9 @@ class Session(AutoConnector):
                     chunk = await asyncio.wait_for(coro_read, self.read_timeout, loop=self.loop)
                 except asyncio.TimeoutError:
                     raise ReadTimeout('read nothing from the host before timeout') from None
+                if started is not None:
+                    first_byte = time.perf_counter()
+                    tracer.record('ttfb', first_byte - started, started)
             else:
                 chunk = await coro_read
             # Which means the response contains no end-of-response information
@@ -265,14 +295,18 @@ class Session(AutoConnector):
                     else:
                         if len(body) == content_length:
                             break
+        if started is not None:
+            tracer.record('transfer', time.perf_counter() - first_byte, first_byte)
+            tracer.count('bytes_in', len(response))
         return response
 
     async def _open_connection(self):
         if self._writer:
             await self.disconnect()
             _logger.debug('Trying to reconnect to the host')
-        self._reader, self._writer = await asyncio.open_connection(self.host, self.port,
-                                                                   loop=self.loop)
+        with tracer.span('connect'):
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port,
+                                                                       loop=self.loop)
         _logger.debug('Connection established')
 
     async def disconnect(self):
@@ -287,12 +321,20 @@ class Session(AutoConnector):
             pass
 
     @staticmethod
-    def _inflate_and_decode(raw):
+    def _inflate(raw):
         dobj = zlib.decompressobj(-zlib.MAX_WBITS)
         try:
             inflated = dobj.decompress(raw)
             inflated += dobj.flush()
-            return inflated.decode()
-        except (zlib.error, UnicodeDecodeError):
+            return inflated
+        except zlib.error:
             _logger.debug('cannot decode: \n%s', raw)
             raise DecodeError('failed to decode the data from the response') from None
+
+
+def decode(raw):
+    try:
+        return raw.decode()
+    except UnicodeDecodeError:
+        _logger.debug('cannot decode: \n%s', raw)
+        raise DecodeError('failed to decode the data from the response') from None
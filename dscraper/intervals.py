@@ -0,0 +1,160 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import islice
+
+
+class IntervalSet:
+    """A set of integers kept as sorted, disjoint and inclusive intervals.
+
+    Memory grows with the number of intervals rather than of integers, so a set
+    of mostly consecutive IDs stays small however large it is. Adding an integer
+    at or next to the last interval is O(1); elsewhere it costs a bisection.
+
+    :param iterable iterable: integers to add initially
+    """
+
+    def __init__(self, iterable=()):
+        self._starts = array('q')
+        self._ends = array('q')
+        self._len = 0
+        for item in iterable:
+            self.add(item)
+
+    @classmethod
+    def from_intervals(cls, intervals):
+        """Build a set from (start, end) pairs, as returned by intervals()."""
+        iset = cls()
+        for start, end in intervals:
+            iset.add_range(start, end)
+        return iset
+
+    def add(self, item):
+        self.add_range(item, item)
+
+    def add_range(self, start, end):
+        """Add all integers in [start, end]."""
+        if start > end:
+            return
+        starts, ends = self._starts, self._ends
+        # Fast paths: the new interval is at the tail
+        if not ends or start > ends[-1] + 1:
+            starts.append(start)
+            ends.append(end)
+            self._len += end - start + 1
+            return
+        if start >= starts[-1]:
+            if end > ends[-1]:
+                self._len += end - ends[-1]
+                ends[-1] = end
+            return
+
+        # Merge with all intervals overlapping or adjacent to [start, end]
+        ifront = bisect_left(ends, start - 1)
+        irear = bisect_right(starts, end + 1)
+        if ifront == irear:
+            starts.insert(ifront, start)
+            ends.insert(ifront, end)
+            self._len += end - start + 1
+            return
+        start, end = min(start, starts[ifront]), max(end, ends[irear - 1])
+        self._len -= sum(ends[i] - starts[i] + 1 for i in range(ifront, irear))
+        self._len += end - start + 1
+        del starts[ifront + 1:irear]
+        del ends[ifront + 1:irear]
+        starts[ifront], ends[ifront] = start, end
+
+    def discard(self, item):
+        self.discard_range(item, item)
+
+    def discard_range(self, start, end):
+        """Remove all integers in [start, end]."""
+        starts, ends = self._starts, self._ends
+        ifront = bisect_left(ends, start)
+        irear = bisect_right(starts, end)
+        if start > end or ifront >= irear:
+            return
+        # Keep what is left of the intervals at both edges
+        pieces = []
+        if starts[ifront] < start:
+            pieces.append((starts[ifront], start - 1))
+        if ends[irear - 1] > end:
+            pieces.append((end + 1, ends[irear - 1]))
+        self._len -= sum(ends[i] - starts[i] + 1 for i in range(ifront, irear))
+        del starts[ifront:irear]
+        del ends[ifront:irear]
+        for i, (piece_start, piece_end) in enumerate(pieces, ifront):
+            starts.insert(i, piece_start)
+            ends.insert(i, piece_end)
+            self._len += piece_end - piece_start + 1
+
+    def difference_update(self, other):
+        """Remove all integers in another IntervalSet."""
+        for start, end in list(other.intervals()):
+            self.discard_range(start, end)
+
+    def update(self, iterable):
+        """Add all integers from an iterable, or another IntervalSet."""
+        if isinstance(iterable, IntervalSet):
+            for start, end in iterable.intervals():
+                self.add_range(start, end)
+        else:
+            for item in iterable:
+                self.add(item)
+
+    def head(self, num=None):
+        """Return an IntervalSet of the num smallest integers, or self if there are
+        no more than num of them.
+        """
+        if num is None or self._len <= num:
+            return self
+        head = IntervalSet()
+        for start, end in self.intervals():
+            left = num - len(head)
+            if left <= 0:
+                break
+            head.add_range(start, min(end, start + left - 1))
+        return head
+
+    def count_intervals(self):
+        """Return the number of intervals, by which the memory taken grows."""
+        return len(self._starts)
+
+    def intervals(self):
+        """Return an iterator of (start, end) pairs in ascending order."""
+        return zip(self._starts, self._ends)
+
+    def __contains__(self, item):
+        i = bisect_right(self._starts, item) - 1
+        return i >= 0 and item <= self._ends[i]
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for start, end in self.intervals():
+            yield from range(start, end + 1)
+
+    def __eq__(self, other):
+        if not isinstance(other, IntervalSet):
+            return NotImplemented
+        return self._starts == other._starts and self._ends == other._ends
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, list(self.intervals()))
+
+    def __str__(self):
+        """Return a compact notation, such as '1-5, 7, 9-12'."""
+        return self.to_string()
+
+    def to_string(self, limit=None):
+        """Return the compact notation of at most limit intervals, followed by '...'
+        if there are more.
+        """
+        intervals = self.intervals()
+        if limit is not None:
+            intervals = islice(intervals, limit)
+        text = ', '.join(str(start) if start == end else '{}-{}'.format(start, end)
+                         for start, end in intervals)
+        if limit is not None and self.count_intervals() > limit:
+            text += ', ...'
+        return text
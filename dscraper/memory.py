@@ -0,0 +1,155 @@
+import logging
+import heapq
+import tracemalloc
+
+from .exceptions import MemoryBudgetExceeded
+
+_logger = logging.getLogger(__name__)
+
+
+class _Section:
+    __slots__ = ('_record', '_start')
+
+    def __init__(self, record):
+        self._record = record
+
+    def __enter__(self):
+        self._start = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, *exc):
+        record = self._record
+        record[0] = max(record[0] + tracemalloc.get_traced_memory()[0] - self._start, 0)
+        if record[0] > record[1]:
+            record[1] = record[0]
+
+
+class _NoopSection:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NOOP = _NoopSection()
+
+
+class MemoryTracker:
+    """Accounts the memory taken by the data of each CID with tracemalloc. Does
+    nothing but return a shared object until enabled.
+
+    Workers run concurrently, so the memory of the process cannot tell which CID
+    takes how much. Instead, only synchronous sections, such as parsing a page and
+    joining the flows, are measured, during which no other worker runs, and the
+    growth of memory traced in them is charged to the CID. Memory allocated by
+    exporters in threads at the same time is charged as well.
+
+    The largest CIDs by peak memory are reported in stat(), along with their numbers
+    of pages and comments.
+    """
+    TOP = 10
+    FRAMES = 1
+
+    def __init__(self):
+        self.enabled = False
+        self.budget, self.abort = None, False
+        self._started = False
+        self.reset()
+
+    def enable(self, budget=None, abort=False):
+        """
+        :param int budget: bytes a CID may take before a warning, or an abortion
+        :param bool abort: whether abort CIDs over budget by raising
+            MemoryBudgetExceeded on check()
+        """
+        self.reset()
+        self.budget, self.abort = budget, abort
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.FRAMES)
+            self._started = True
+        self.enabled = True
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        self.peak = tracemalloc.get_traced_memory()[1]
+        if self._started:
+            tracemalloc.stop()
+            self._started = False
+
+    def reset(self):
+        self.peak = 0
+        self._records = {}  # cid: [bytes held, peak, pages, comments, reported]
+        self._largest = []  # heap of (peak, cid, pages, comments)
+        self._cnt_over_budget = 0
+
+    def section(self, cid):
+        """Return a context manager charging the memory allocated in it to the CID.
+        No coroutine should be awaited in it.
+        """
+        if not self.enabled:
+            return _NOOP
+        return _Section(self._get_record(cid))
+
+    def count(self, cid, pages=0, comments=0):
+        if not self.enabled:
+            return
+        record = self._get_record(cid)
+        record[2] += pages
+        record[3] += comments
+
+    def check(self, cid):
+        """Warn once, or raise MemoryBudgetExceeded if set to abort, if the CID has
+        taken more memory than the budget.
+        """
+        if not self.enabled or self.budget is None:
+            return
+        record = self._records.get(cid)
+        if record is None or record[1] <= self.budget or record[4]:
+            return
+        record[4] = True
+        self._cnt_over_budget += 1
+        message = 'CID {} takes {:.1f}MB with {} pages and {} comments, over the budget of {:.1f}MB'.format(
+            cid, record[1] / 2 ** 20, record[2], record[3], self.budget / 2 ** 20)
+        if self.abort:
+            raise MemoryBudgetExceeded(message)
+        _logger.warning(message)
+
+    def finish(self, cid):
+        """Stop accounting the CID, whose data has been released."""
+        if not self.enabled:
+            return
+        record = self._records.pop(cid, None)
+        if record is None:
+            return
+        entry = (record[1], cid, record[2], record[3])
+        if len(self._largest) < self.TOP:
+            heapq.heappush(self._largest, entry)
+        elif entry > self._largest[0]:
+            heapq.heapreplace(self._largest, entry)
+
+    def stat(self):
+        peak = tracemalloc.get_traced_memory()[1] if self.enabled else self.peak
+        stats = ['-----', 'Memory']
+        stats.append('Peak traced: {:.1f}MB'.format(peak / 2 ** 20))
+        if self.budget is not None:
+            stats.append('CIDs over the budget of {:.1f}MB: {}'.format(
+                self.budget / 2 ** 20, self._cnt_over_budget))
+        if self._largest:
+            stats.append('Largest CIDs (peak, pages, comments):')
+            for peak, cid, pages, comments in sorted(self._largest, reverse=True):
+                stats.append('  {}: {:.1f}MB, {}, {}'.format(cid, peak / 2 ** 20, pages, comments))
+        return '\n'.join(stats)
+
+    def _get_record(self, cid):
+        record = self._records.get(cid)
+        if record is None:
+            record = self._records[cid] = [0, 0, 0, 0, False]
+        return record
+
+
+memory = MemoryTracker()
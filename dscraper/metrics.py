@@ -0,0 +1,106 @@
+import logging
+
+from .tracing import tracer
+from .server import BaseServer
+
+_logger = logging.getLogger(__name__)
+
+
+class MetricsServer(BaseServer):
+    """Serves the live state of a running Scraper over HTTP, in the text format of
+    Prometheus, at any path.
+
+    The server runs on the loop of the scraper. Nothing is collected in the
+    background: the counters and histograms of the tracer, which the scraper enables
+    for this, are read and the companies are polled only when a request comes.
+
+    Takes the same parameters as BaseServer, with the port 9100 by default.
+    """
+    NAME = 'Metrics server'
+    PORT = 9100
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+    _PREFIX = 'dscraper_'
+    _COUNTERS = (
+        ('requests', 'requests_total', 'Requests sent to the host'),
+        ('bytes_in', 'received_bytes_total', 'Bytes of responses received from the host'),
+        ('bytes_out', 'sent_bytes_total', 'Bytes of requests sent to the host'),
+        ('cids', 'cids_total', 'CIDs scraped and exported'),
+    )
+
+    def __init__(self, scraper, host='127.0.0.1', port=PORT, *, loop=None):
+        super().__init__(scraper, host, port, loop=loop)
+
+    def respond(self, method, path, body):
+        if method not in ('GET', 'HEAD'):
+            return 405, 'text/plain', b''
+        return 200, self.CONTENT_TYPE, self.render().encode()
+
+    def render(self):
+        """:return str: all metrics in the text format of Prometheus"""
+        counters, histograms = tracer.snapshot()
+        lines = []
+        for key, name, help in self._COUNTERS:
+            self._metric(lines, name, 'counter', help, [(None, counters.get(key, 0))])
+
+        companies = self.scraper.companies
+        errors = {}
+        for company in companies:
+            for error, num in company.scavenger.get_error_counts().items():
+                errors[error] = errors.get(error, 0) + num
+        self._metric(lines, 'errors_total', 'counter', 'Errors occured by exception class',
+                     [({'class': error}, num) for error, num in sorted(errors.items())])
+
+        gauges = (
+            ('workers', 'Workers running', lambda c: c.get_worker_count()),
+            ('max_workers', 'Workers the company intends to run', lambda c: c.max_workers),
+            ('backlog', 'Fresh targets yet to be distributed, if known',
+             lambda c: c.distributor.get_backlog()),
+            ('retry_backlog', 'Targets waiting to be retried',
+             lambda c: c.distributor.get_retry_count()),
+            ('health', 'Health of the scavenger, which stops the run at 0',
+             lambda c: c.scavenger.get_health()[0]),
+            ('max_health', 'Maximum health of the scavenger',
+             lambda c: c.scavenger.get_health()[1]),
+            ('dead', 'Whether the scavenger has stopped the run',
+             lambda c: int(c.scavenger.is_dead())),
+            ('rush_hour', 'Whether it is rush hour at the host', lambda c: int(c.is_busy())),
+        )
+        for name, help, get in gauges:
+            samples = []
+            for company in companies:
+                value = get(company)
+                if value is not None:
+                    samples.append(({'company': type(company).__name__}, value))
+            self._metric(lines, name, 'gauge', help, samples)
+
+        self._metric(lines, 'export_queue_depth', 'gauge', 'CIDs waiting to be exported',
+                     [(None, self.scraper.get_export_queue_depth())])
+
+        name = self._PREFIX + 'stage_seconds'
+        lines.append('# HELP {} Latency of the stages of scraping'.format(name))
+        lines.append('# TYPE {} histogram'.format(name))
+        for stage in sorted(histograms):
+            buckets, total, count = histograms[stage]
+            for bound, seen in buckets:
+                lines.append(self._sample(name + '_bucket', {'stage': stage, 'le': repr(bound)},
+                                          seen))
+            lines.append(self._sample(name + '_bucket', {'stage': stage, 'le': '+Inf'}, count))
+            lines.append(self._sample(name + '_sum', {'stage': stage}, total))
+            lines.append(self._sample(name + '_count', {'stage': stage}, count))
+        lines.append('')
+        return '\n'.join(lines)
+
+    @classmethod
+    def _metric(cls, lines, name, type, help, samples):
+        name = cls._PREFIX + name
+        lines.append('# HELP {} {}'.format(name, help))
+        lines.append('# TYPE {} {}'.format(name, type))
+        for labels, value in samples:
+            lines.append(cls._sample(name, labels, value))
+
+    @staticmethod
+    def _sample(name, labels, value):
+        if labels:
+            name += '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                                   for k, v in labels.items()) + '}'
+        return '{} {}'.format(name, value)
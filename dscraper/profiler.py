@@ -0,0 +1,131 @@
+import logging
+import asyncio
+import os
+import sys
+import threading
+from collections import defaultdict
+
+from .watchdog import find_item
+
+_logger = logging.getLogger(__name__)
+
+_ASYNCIO = os.path.dirname(asyncio.__file__) + os.sep
+
+
+class SamplingProfiler:
+    """Samples the stack of the thread running the event loop from another thread,
+    which costs the loop nothing but the time the GIL is held for a sample, unlike
+    a deterministic profiler that slows down every call and distorts the timing of
+    asyncio.
+
+    Frames of asyncio running the callbacks are cut off, so that each stack starts
+    from the coroutine running. A sample is attributed to the CID of the worker on
+    the stack, and to the stage of the innermost function known in STAGES, or
+    'idle' if the loop is waiting for I/O. Stacks are written in the collapsed
+    format, one 'stage;frame;...;frame count' per line, which flamegraph.pl,
+    speedscope and inferno read.
+
+    :param str path: file to write the collapsed stacks to
+    :param float rate: samples per second. While the loop is busy, a sample waits up
+        to sys.getswitchinterval() for the GIL, which limits the rate to about 200
+    """
+    STAGES = {
+        'parse_comments_xml': 'parse',
+        '_inflate': 'inflate',
+        '_read': 'transfer',
+        '_open_connection': 'connect',
+        '_digest': 'digest',
+        '_join': 'join',
+        '_trim': 'trim',
+        'dump': 'export',
+        'dump_batch': 'export',
+        'select': 'idle',
+    }
+    MAX_DEPTH = 64
+    TOP = 10
+
+    def __init__(self, path, rate=100, *, loop=None):
+        if rate <= 0:
+            raise ValueError('sampling rate must be positive: {}'.format(rate))
+        self.loop = loop or asyncio.get_event_loop()
+        self.path, self.rate = path, rate
+        self.stacks = defaultdict(int)  # (stage, frames): samples
+        self.cids = defaultdict(int)  # cid: samples
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._thread = self._thread_id = None
+
+    def start(self):
+        """Start sampling the current thread, where the loop is running."""
+        if self._thread is not None:
+            raise RuntimeError('profiler is already started')
+        self._thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._sample_periodically, name='dscraper-profiler',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+
+    def write(self):
+        """Write the collapsed stacks to the file."""
+        with open(self.path, 'w') as fout:
+            for (stage, frames), count in sorted(self.stacks.items()):
+                fout.write('{} {}\n'.format(';'.join((stage,) + frames), count))
+        _logger.info('Profile of %d samples written to %s', self.samples, self.path)
+
+    def stat(self):
+        stats = ['-----', 'Profile ({} samples at {:g}Hz)'.format(self.samples, self.rate)]
+        if not self.samples:
+            return '\n'.join(stats)
+        stages, functions = defaultdict(int), defaultdict(int)
+        for (stage, frames), count in self.stacks.items():
+            stages[stage] += count
+            if frames:
+                functions[frames[-1]] += count
+        stats.append('By stage: ' + ', '.join('{} {}'.format(stage, self._percent(count))
+                                              for stage, count in self._top(stages)))
+        stats.append('Hottest functions (self):')
+        stats.extend('  {} {}'.format(self._percent(count), function)
+                     for function, count in self._top(functions))
+        if self.cids:
+            stats.append('Hottest CIDs: ' + ', '.join('{} ({})'.format(cid, self._percent(count))
+                                                      for cid, count in self._top(self.cids)))
+        return '\n'.join(stats)
+
+    def _sample_periodically(self):
+        interval = 1 / self.rate
+        while not self._stopped.wait(interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self._sample(frame)
+            del frame
+
+    def _sample(self, frame):
+        frames, stage = [], None
+        top = frame
+        while frame is not None and len(frames) < self.MAX_DEPTH:
+            code = frame.f_code
+            if code.co_filename.startswith(_ASYNCIO):
+                break
+            if stage is None:
+                stage = self.STAGES.get(code.co_name)
+            frames.append('{}:{}'.format(os.path.basename(code.co_filename), code.co_name))
+            frame = frame.f_back
+        frames.reverse()
+        self.stacks[(stage or 'other', tuple(frames))] += 1
+        self.samples += 1
+        cid = find_item(top)
+        if cid is not None:
+            self.cids[cid] += 1
+
+    def _top(self, counts):
+        return sorted(counts.items(), key=lambda item: item[1], reverse=True)[:self.TOP]
+
+    def _percent(self, count):
+        return '{:.1f}%'.format(count / self.samples * 100)
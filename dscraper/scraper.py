@@ -4,12 +4,22 @@ import datetime
 import time
 import io
 from collections import deque, defaultdict
-from itertools import chain, islice
+from collections.abc import Sequence, Set
+from itertools import islice, count
 import concurrent
+import heapq
+import random
 
-from .exporter import FileExporter, StreamExporter
+from .exporter import FileExporter, StreamExporter, ExportQueue
 from .exceptions import Scavenger, NoMoreItems
-from .utils import Sluice, validate_id, CommentFlow
+from .utils import Sluice, validate_id, CommentFlow, TIME_CONFIG_CN
+from .intervals import IntervalSet
+from .tracing import tracer
+from .memory import memory
+from .metrics import MetricsServer
+from .control import ControlServer
+from .watchdog import LagMonitor
+from .profiler import SamplingProfiler
 from .company import CidCompany, AidCompany, CID, AID
 
 _logger = logging.getLogger(__name__)
@@ -64,16 +74,47 @@ class Scraper:
         ending dates between which comments should be scraped (inclusive)
     :param int max_workers: maximum number of workers (connections) to one host the scraper
         could establish at the same time
+    :param int retries: maximum number of times a target failed for transient reasons, such
+        as timeouts, is retried at the end of the run
+    :param NegativeCache negative_cache: CIDs known to be dead, which are skipped. Updated
+        with the CIDs found dead or alive when the run is finished
+    :param int export_queue: if set, data is exported in the background through a queue
+        of this many CIDs, so that workers do not wait for the exporter
+    :param trace: if True, time the stages of scraping and report the latencies and
+        throughput. If a path, also write a JSON trace of every stage timed to it
+    :param int metrics: if set, serve live metrics in the text format of Prometheus on
+        this port of localhost while running
+    :param int control: if set, serve an admin API on this port of localhost while
+        running, see ControlServer
+    :param float watchdog: if set, monitor the lag of the event loop, and report where
+        it has been stalled for longer than these seconds
+    :param str profile: if set, sample the stacks of the event loop while running, write
+        them to this path in the collapsed format, and report the hottest ones
+    :param float profile_rate: samples per second of the profiler
+    :param bool memory: if True, account the memory taken by each CID with tracemalloc,
+        and report the largest ones
+    :param int memory_budget: bytes a CID may take before a warning is logged. Implies
+        memory
+    :param bool memory_abort: whether abort CIDs over the budget instead of warning
+    :param (str, int) address: host and port to scrape comments from, in place of
+        comment.bilibili.com, such as a mirror or a simulated host
+    :param tuple time_config: intervals between claims and the rush hour of the host,
+        see FrequencyController
 
     TODO add user interface during running using the curses library
     """
     MAX_WORKERS = 24
     _IND = 'individual'
 
-    def __init__(self, exporter=None, history=True, time_range=None, max_workers=6, *,
-                 loop=None):
+    def __init__(self, exporter=None, history=True, time_range=None, max_workers=6, retries=3, *,
+                 negative_cache=None, export_queue=None, trace=False, metrics=None,
+                 control=None, watchdog=None, profile=None, profile_rate=100,
+                 memory=False, memory_budget=None, memory_abort=False, address=None,
+                 time_config=TIME_CONFIG_CN, loop=None):
         if not 0 < max_workers <= self.MAX_WORKERS:
             raise ValueError('number of workers is not in range [1, {}]'.format(self.MAX_WORKERS))
+        if retries < 0:
+            raise ValueError('cannot retry \'{}\' times'.format(retries))
         if time_range is None:
             time_range = (None, None)
         else:
@@ -96,6 +137,18 @@ class Scraper:
         self.exporter = exporter or FileExporter(loop=self.loop)
         self.history, self.time_range = history, time_range
         self.max_workers = max_workers
+        self.retries = retries
+        self.negative_cache = negative_cache
+        self.export_queue = export_queue
+        self.trace = trace
+        self.metrics = metrics
+        self.control = control
+        self.watchdog = watchdog
+        self.profile, self.profile_rate = profile, profile_rate
+        self.memory = memory or memory_budget is not None
+        self.memory_budget, self.memory_abort = memory_budget, memory_abort
+        self.address, self.time_config = address, time_config
+        self._queue = None
         self._iters = defaultdict(list)
         self.companies = []
 
@@ -143,12 +196,50 @@ class Scraper:
 
     async def async_run(self):
         """The indeed main coroutine that can be awaited."""
+        if self.trace or self.metrics:
+            tracer.enable(None if self.trace in (True, False) else self.trace)
+        server = None
+        if self.metrics:
+            server = MetricsServer(self, port=self.metrics, loop=self.loop)
+            await server.start()
+        monitor = None
+        if self.watchdog:
+            monitor = LagMonitor(self.watchdog, loop=self.loop)
+            monitor.start()
+        if self.memory:
+            memory.enable(self.memory_budget, self.memory_abort)
+        profiler = None
+        if self.profile:
+            profiler = SamplingProfiler(self.profile, self.profile_rate, loop=self.loop)
+            profiler.start()
         start_time = time.time()
-        stats = await self._async_run()
+        try:
+            stats = await self._async_run()
+        finally:
+            if profiler is not None:
+                profiler.stop()
+                profiler.write()
+            if monitor is not None:
+                monitor.stop()
+            if self.memory:
+                memory.disable()
+            if server is not None:
+                await server.close()
+            if self.trace or self.metrics:
+                tracer.disable()
         end_time = time.time()
 
         # Sum up the results
         stats.insert(0, 'Report')
+        if self.trace:
+            stats.append(tracer.stat())
+            tracer.write_trace()
+        if monitor is not None:
+            stats.append(monitor.stat())
+        if profiler is not None:
+            stats.append(profiler.stat())
+        if self.memory:
+            stats.append(memory.stat())
         stats.append('-----')
         stats.append('Overall')
         stats.append('Finished in: {}'.format(
@@ -157,7 +248,6 @@ class Scraper:
         _logger.info('\n'.join(stats))
 
     async def _async_run(self):
-        scavenger = Scavenger()
         distributor = None
         exporter = self.exporter
         self.companies.clear()
@@ -176,11 +266,18 @@ class Scraper:
         # Build the CidCompany
         if distributor is None:
             # If there is no AidCompany upstream, the CidCompany needs an initial distributor
-            distributor = BlockingDistributor(loop=self.loop)
+            skip = None
+            if self.negative_cache is not None:
+                skip = self.negative_cache.load().should_skip
+            distributor = BlockingDistributor(self.retries, skip, loop=self.loop)
+        scavenger = Scavenger(retry=distributor.retry)
+        if self.export_queue:
+            exporter = self._queue = ExportQueue(exporter, self.export_queue,
+                                                 scavenger=scavenger, loop=self.loop)
         # TODO max_workers = min(max_workers, len(disteibutor))
         company = CidCompany(self.max_workers, distributor, history=self.history,
                              scavenger=scavenger, exporter=exporter, time_range=self.time_range,
-                             loop=self.loop)
+                             address=self.address, time_config=self.time_config, loop=self.loop)
 
         targets = self._iters[CID]
         targets.append(self._iters[(CID, self._IND)])
@@ -191,58 +288,220 @@ class Scraper:
             return []
 
         self.companies.append(company)
-        del scavenger, distributor, exporter, company, targets
+        del distributor, company, targets
         self._iters.clear()
 
-        await self.exporter.connect()
-        asyncio.ensure_future(self._patrol())
+        await exporter.connect()
+        patrol = asyncio.ensure_future(self._patrol())
         try:
             return await asyncio.gather(*[com.run() for com in self.companies])
         finally:
-            await self.exporter.disconnect()
+            patrol.cancel()
+            await asyncio.gather(patrol, return_exceptions=True)
+            await exporter.disconnect()
+            if self.negative_cache is not None:
+                self.negative_cache.update(scavenger.get_dead(), scavenger.get_done())
+                self.negative_cache.save()
+
+    def resize(self, max_workers, company_type=CID):
+        """Change the number of workers of the running company."""
+        if not 0 < max_workers <= self.MAX_WORKERS:
+            raise ValueError('number of workers is not in range [1, {}]'.format(self.MAX_WORKERS))
+        self._get_company(company_type).resize(max_workers)
+        self.max_workers = max_workers
+
+    def set_rate(self, interval=None, busy_interval=None, company_type=CID):
+        """Change the average intervals in seconds between claims of the running
+        company, in common and rush hours. None to keep the current one.
+        """
+        self._get_company(company_type).set_rate(interval, busy_interval)
+
+    def pause(self, company_type=CID):
+        """Stop claiming targets until resumed."""
+        self._get_company(company_type).pause()
+
+    def resume(self, company_type=CID):
+        self._get_company(company_type).resume()
+
+    def post(self, targets, company_type=CID):
+        """Add targets to the running scraper, which are scraped if it has not
+        finished yet.
+
+        :param iterable targets: an iterable of integers
+        """
+        self._get_company(company_type).post(targets)
+
+    def post_range(self, start, end, company_type=CID):
+        """Add a range of targets to the running scraper, inclusive."""
+        if start <= 0 or end < start:
+            raise ValueError('not a valid range: {} - {}'.format(start, end))
+        self._get_company(company_type).post(range(start, end + 1))
+
+    def checkpoint(self):
+        """Log the progress, flush the exporter if it buffers, and save what has
+        been found dead or alive to the negative cache.
+        """
+        for company in self.companies:
+            company.log_progress()
+        flush = getattr(self.exporter, 'flush', None)
+        if flush is not None:
+            flush()
+        if self.negative_cache is not None:
+            for company in self.companies:
+                self.negative_cache.update(company.scavenger.get_dead(),
+                                           company.scavenger.get_done())
+            self.negative_cache.save()
+
+    def get_stats(self):
+        """:return dict: the live state of the scraper, which can be dumped as JSON"""
+        companies = []
+        for company in self.companies:
+            interval, busy_interval = company.get_rate()
+            health, max_health = company.scavenger.get_health()
+            companies.append({
+                'type': type(company).__name__,
+                'workers': company.get_worker_count(),
+                'paused': company.is_paused(),
+                'rush_hour': company.is_busy(),
+                'interval': interval,
+                'busy_interval': busy_interval,
+                'total': company.distributor.get_total(),
+                'finished': company.scavenger.get_success_count(),
+                'failed': len(company.scavenger.get_failures()),
+                'backlog': company.distributor.get_backlog(),
+                'retry_backlog': company.distributor.get_retry_count(),
+                'health': health,
+                'max_health': max_health,
+                'errors': company.scavenger.get_error_counts(),
+            })
+        return {'companies': companies, 'export_queue_depth': self.get_export_queue_depth()}
+
+    def get_export_queue_depth(self):
+        """Return the number of CIDs waiting to be exported in the background."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _get_company(self, company_type):
+        company_class = {CID: CidCompany, AID: AidCompany}[company_type]
+        for company in self.companies:
+            if isinstance(company, company_class):
+                return company
+        raise RuntimeError('no {} company is running'.format(company_type))
 
     async def _patrol(self):
-        # TODO read from the command line and update states. stop the scraper by
-        # calling distributor.close
-        pass
+        """Serve the admin API until the run is finished."""
+        if not self.control:
+            return
+        server = ControlServer(self, port=self.control, loop=self.loop)
+        try:
+            await server.start()
+        except OSError as e:
+            _logger.error('Failed to start the control server: %s', e)
+            return
+        try:
+            await self.loop.create_future()  # Until cancelled
+        finally:
+            await server.close()
 
 
 class BlockingDistributor:
     """Distributes items from iterables on demand. Block when there is
-    no items available.
+    no items available. Each item is distributed only once, however many times
+    it is posted.
+
+    Items failed for transient reasons can be handed back with retry(). They are
+    distributed again after all the fresh items, each no sooner than its backoff.
+
+    :param int retries: maximum number of times an item could be retried
+    :param callable skip: called with each fresh item before it is distributed.
+        The item is dropped if True is returned
     """
 
-    def __init__(self, *, loop):
+    RETRY_BACKOFF = 60
+    RETRY_MAX_BACKOFF = 60 * 60
+    RETRY_JITTER = 0.5
+
+    def __init__(self, retries=3, skip=None, *, loop):
+        self.loop = loop
         self._queue = deque()
         self._iter = None
         self._latch = Sluice(loop=loop)
+        self._bell = Sluice(loop=loop)
         self.set = self._latch.set
         self.is_set = self._latch.is_set
-        self._count = 0
+        self._scheduled = IntervalSet()
+        self._hinted = 0
+        self._seen = IntervalSet()
+        self._cnt_duplicates = 0
+        self.retries = retries
+        self._attempts = {}
+        self._retries = []
+        self._seq = count()
+        self._skip = skip
+        self._cnt_skipped = 0
 
     def post(self, it, recycle=False):
         """
         :param iterable it: can be a list or generator
+        :param bool recycle: whether the items were distributed before and are put back
         """
-        if self._count is not None and not recycle:
-            try:
-                self._count += len(it)
-            except TypeError:
-                self._count = None
-        self._queue.append(iter(it))
-        self._latch.leak()
+        self.post_list([it], recycle)
 
     def post_list(self, its, recycle=False):
         """
         :param list its: a list of lists or generators
+        :param bool recycle: whether the items were distributed before and are put back
+        """
+        if recycle:
+            its = [list(it) for it in its]
+            for it in its:
+                for item in it:
+                    self._seen.discard(item)
+        else:
+            for it in its:
+                self._schedule(it)
+        self._queue.extend(map(_cursor, its))
+        self._wake()
+
+    def _schedule(self, it):
+        """Count distinct items in the iterable if it could be done without iterating
+        through a generator.
         """
-        if self._count is not None and not recycle:
+        if isinstance(it, range) and it.step == 1:
+            if it:
+                self._scheduled.add_range(it[0], it[-1])
+            return
+        if isinstance(it, (Sequence, Set)):
+            # Merged only if all the items are valid, not to be counted twice otherwise
+            try:
+                items = IntervalSet(it)
+            except (TypeError, OverflowError):
+                pass
+            else:
+                self._scheduled.update(items)
+                return
+        if self._hinted is not None:
             try:
-                self._count += sum(map(len, its))
+                self._hinted += len(it)
             except TypeError:
-                self._count = None
-        self._queue.extend(map(iter, its))
-        self._latch.leak()
+                self._hinted = None
+
+    def retry(self, item):
+        """Schedules a failed item to be distributed again, after an exponential
+        backoff with jitter.
+
+        :return bool: True if the item is scheduled, False if it has run out of attempts
+        """
+        attempts = self._attempts.get(item, 0)
+        if attempts >= self.retries:
+            self._attempts.pop(item, None)
+            return False
+        self._attempts[item] = attempts + 1
+        backoff = min(self.RETRY_BACKOFF * 2 ** attempts, self.RETRY_MAX_BACKOFF)
+        backoff *= random.uniform(1 - self.RETRY_JITTER, 1)
+        _logger.debug('Retrying %s in %.1f seconds (attempt %d)', item, backoff, attempts + 1)
+        heapq.heappush(self._retries, (self.loop.time() + backoff, next(self._seq), item))
+        self._wake()
+        return True
 
     async def claim(self):
         """Polls an item.
@@ -254,23 +513,79 @@ class BlockingDistributor:
             if not self._iter:
                 if self._queue:
                     self._iter = self._queue.popleft()
+                elif self._retries:
+                    # Retries are scheduled after all the fresh items
+                    due, _, item = self._retries[0]
+                    delay = due - self.loop.time()
+                    if delay <= 0:
+                        heapq.heappop(self._retries)
+                        return item
+                    # Wait until the retry is due or there are new items
+                    try:
+                        await asyncio.wait_for(self._bell.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
                 elif self.is_set():
                     raise NoMoreItems('all items have been distributed')
                 else:
                     # Wait until there are new items or this distributor is closed
                     await self._latch.wait()
                     continue
+            it = self._iter
+            try:
+                if hasattr(it, '__anext__'):
+                    item = await it.__anext__()
+                else:
+                    item = next(it)
+            except (StopIteration, StopAsyncIteration):
+                # Another claimer may have moved on to the next iterable meanwhile
+                if self._iter is it:
+                    self._iter = None
+                continue
             try:
-                return next(self._iter)
-            except StopIteration:
-                self._iter = None
+                if item in self._seen:
+                    self._cnt_duplicates += 1
+                    continue
+                self._seen.add(item)
+            except (TypeError, OverflowError):
+                return item  # Not a valid ID, leave it to the claimer
+            if self._skip is not None and self._skip(item):
+                self._cnt_skipped += 1
+                continue
+            return item
 
     def dump(self, num=None):
-        """Remove all items yet to be distributed, and return at most num of them."""
-        iter_items = chain(self._iter or [], *self._queue)
-        if num is not None:
-            iter_items = islice(iter_items, num)
-        items = list(iter_items)
+        """Remove all items yet to be distributed, and return at most num of them.
+
+        :return IntervalSet:
+        """
+        items = IntervalSet()
+        its = [self._iter] if self._iter else []
+        its.extend(self._queue)
+        for it in its:
+            if num is not None and len(items) >= num:
+                break
+            if isinstance(it, _RangeCursor) and it.rest().step == 1:
+                # Ranges are dumped in whole without iterating through them
+                rest = it.rest()
+                if rest:
+                    fresh = IntervalSet()
+                    fresh.add_range(rest[0], rest[-1])
+                    fresh.difference_update(self._seen)
+                    items.update(fresh.head(None if num is None else num - len(items)))
+                continue
+            # Items posted more than once may have been distributed already
+            while num is None or len(items) < num:
+                chunk = list(islice(it, None if num is None else num - len(items)))
+                if not chunk:
+                    break
+                items.update(item for item in chunk if item not in self._seen)
+        # Items waiting to be retried have been distributed, but not finished
+        for _, _, item in sorted(self._retries):
+            if num is not None and len(items) >= num:
+                break
+            items.add(item)
         self.clear()
         return items
 
@@ -278,6 +593,61 @@ class BlockingDistributor:
         """Remove all items yet to be distributed."""
         self._queue.clear()
         self._iter = None
+        self._retries.clear()
 
     def get_total(self):
-        return self._count
+        """Return the number of distinct items posted, or None if unknown."""
+        if self._hinted is None:
+            return None
+        return len(self._scheduled) + self._hinted
+
+    def get_backlog(self):
+        """Return the number of fresh items yet to be distributed, or None if unknown."""
+        total = self.get_total()
+        if total is None:
+            return None
+        return max(total - len(self._seen), 0)
+
+    def get_retry_count(self):
+        """Return the number of items waiting to be retried."""
+        return len(self._retries)
+
+    def get_duplicate_count(self):
+        return self._cnt_duplicates
+
+    def get_skipped_count(self):
+        return self._cnt_skipped
+
+    def _wake(self):
+        self._latch.leak()
+        self._bell.leak()
+
+
+class _RangeCursor:
+    """An iterator over a range that can tell what is left in it."""
+
+    def __init__(self, r):
+        self._range = r
+        self._i = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            item = self._range[self._i]
+        except IndexError:
+            raise StopIteration from None
+        self._i += 1
+        return item
+
+    def rest(self):
+        return self._range[self._i:]
+
+
+def _cursor(it):
+    if isinstance(it, range):
+        return _RangeCursor(it)
+    if hasattr(it, '__aiter__'):
+        return it.__aiter__()
+    return iter(it)
@@ -0,0 +1,78 @@
+import logging
+import asyncio
+
+_logger = logging.getLogger(__name__)
+
+
+class BaseServer:
+    """A minimal HTTP server running on the loop of a Scraper, answering each
+    request with respond() and closing the connection.
+
+    :param Scraper scraper:
+    :param str host: address to listen on. Default as localhost only
+    :param int port: 0 for any port available
+    """
+    NAME = 'HTTP server'
+    MAX_BODY = 2 ** 20
+    _REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                409: 'Conflict', 413: 'Payload Too Large'}
+
+    def __init__(self, scraper, host='127.0.0.1', port=0, *, loop=None):
+        self.scraper = scraper
+        self.host, self.port = host, port
+        self.loop = loop or scraper.loop
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]  # in case of port 0
+        _logger.info('%s listening on http://%s:%d', self.NAME, self.host, self.port)
+
+    async def close(self):
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    def respond(self, method, path, body):
+        """
+        :param str method:
+        :param str path: without the query
+        :param bytes body:
+        :return (int, str, bytes): status code, content type and body of the response
+        """
+        raise NotImplementedError
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                name, _, value = line.partition(b':')
+                if name.strip().lower() == b'content-length':
+                    length = int(value)
+            parts = request.decode('latin-1').split()
+            if len(parts) < 2:
+                status, content_type, body = 400, 'text/plain', b''
+            elif length > self.MAX_BODY:
+                status, content_type, body = 413, 'text/plain', b''
+            else:
+                method, path = parts[0], parts[1].split('?', 1)[0]
+                status, content_type, body = self.respond(
+                    method, path, await reader.readexactly(length) if length else b'')
+                if method == 'HEAD':
+                    body = b''
+            writer.write('HTTP/1.0 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\n\r\n'.format(
+                status, self._REASONS.get(status, ''), content_type, len(body)).encode('ascii'))
+            writer.write(body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        except Exception:
+            _logger.exception('%s failed to respond', self.NAME)
+        finally:
+            writer.close()
@@ -0,0 +1,193 @@
+import logging
+import asyncio
+import threading
+import json
+import math
+import time
+from collections import defaultdict
+
+_logger = logging.getLogger(__name__)
+
+_clock = time.perf_counter
+_current_task = getattr(asyncio, 'current_task', None) or asyncio.Task.current_task
+
+
+class Histogram:
+    """Histogram of durations in seconds, with buckets growing by 2 ** (1 / SCALE),
+    so that percentiles are estimated within about 19% with a fixed amount of memory.
+    """
+    SCALE = 4
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.count = 0
+        self.sum = self.max = 0.0
+
+    def add(self, value):
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """Return the upper bound of the bucket the q-th percentile falls in.
+
+        :param float q: in range [0, 100]
+        """
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self.bound(index), self.max)
+        return self.max
+
+    def buckets(self):
+        """Yield the upper bound of each bucket and the cumulative count of values."""
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            yield self.bound(index), seen
+
+    @classmethod
+    def bound(cls, index):
+        return 2 ** ((index + 1) / cls.SCALE)
+
+    @classmethod
+    def _index(cls, value):
+        if value <= 0:
+            return -1000
+        return math.floor(math.log2(value) * cls.SCALE)
+
+
+class _Span:
+    __slots__ = ('_tracer', '_stage', '_start')
+
+    def __init__(self, tracer, stage):
+        self._tracer, self._stage = tracer, stage
+
+    def __enter__(self):
+        self._start = _clock()
+        return self
+
+    def __exit__(self, *exc):
+        self._tracer.record(self._stage, _clock() - self._start, self._start)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Tracer:
+    """Times the stages of scraping, such as connecting, waiting for the first byte
+    and parsing, into a histogram for each stage, and counts requests, CIDs and
+    bytes for throughput. Does nothing but return a shared object until enabled.
+
+    Stages are timed with span(), or record() when started somewhere else. If a
+    trace file is given, every span is also kept as an event of the Trace Event
+    Format, which chrome://tracing and Perfetto open.
+    """
+    STAGES = ('connect', 'ttfb', 'transfer', 'inflate', 'parse', 'digest', 'join', 'scrape',
+              'export', 'export_batch')
+    MAX_EVENTS = 10 ** 6
+    _PERCENTILES = (50, 95, 99)
+
+    def __init__(self):
+        self.enabled = False
+        self.trace = None
+        self._lock = threading.Lock()  # exporters record in threads
+        self.reset()
+
+    def enable(self, trace=None):
+        """
+        :param str trace: path to write the trace to on write_trace()
+        """
+        self.reset()
+        self.enabled = True
+        self.trace = trace
+
+    def disable(self):
+        self.enabled = False
+        self._stop = _clock()
+
+    def reset(self):
+        self.histograms = defaultdict(Histogram)
+        self.counters = defaultdict(int)
+        self._events = []
+        self._start, self._stop = _clock(), None
+
+    def span(self, stage):
+        """Return a context manager timing the stage."""
+        if not self.enabled:
+            return _NOOP
+        return _Span(self, stage)
+
+    def record(self, stage, seconds, start=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.histograms[stage].add(seconds)
+            if self.trace is not None and start is not None and len(self._events) < self.MAX_EVENTS:
+                self._events.append({'name': stage, 'ph': 'X', 'pid': 0, 'tid': self._lane(),
+                                     'ts': (start - self._start) * 1e6, 'dur': seconds * 1e6})
+
+    def count(self, name, value=1):
+        if self.enabled:
+            self.counters[name] += value
+
+    def snapshot(self):
+        """Return a copy of the counters, and of the buckets, sum and count of each
+        histogram, which is consistent even if exporters are recording in threads.
+
+        :return ({str: int}, {str: ([(float, int)], float, int)}):
+        """
+        with self._lock:
+            histograms = {stage: (list(histogram.buckets()), histogram.sum, histogram.count)
+                          for stage, histogram in self.histograms.items()}
+            return dict(self.counters), histograms
+
+    def stat(self):
+        elapsed = (self._stop or _clock()) - self._start
+        stats = ['-----', 'Latency (p50 / p95 / p99 / max, count)']
+        stages = [stage for stage in self.STAGES if stage in self.histograms]
+        stages.extend(sorted(set(self.histograms) - set(self.STAGES)))
+        for stage in stages:
+            histogram = self.histograms[stage]
+            stats.append('{}: {} / {} / {} / {:.1f}ms, {}'.format(
+                stage, *('{:.1f}'.format(histogram.percentile(q) * 1e3) for q in self._PERCENTILES),
+                histogram.max * 1e3, histogram.count))
+        stats.append('Throughput: {:.2f} CIDs/s, {:.2f} requests/s, {:.3f} MB/s in'.format(
+            self.counters['cids'] / elapsed, self.counters['requests'] / elapsed,
+            self.counters['bytes_in'] / elapsed / 2 ** 20))
+        return '\n'.join(stats)
+
+    def write_trace(self):
+        """Write the events to the trace file, if any."""
+        if self.trace is None:
+            return
+        with open(self.trace, 'w') as fout:
+            json.dump({'traceEvents': self._events, 'displayTimeUnit': 'ms'}, fout)
+        _logger.info('Trace of %d events written to %s', len(self._events), self.trace)
+
+    @staticmethod
+    def _lane():
+        try:
+            task = _current_task()
+        except RuntimeError:  # in a thread of an executor
+            task = None
+        return id(task) if task is not None else threading.get_ident()
+
+
+tracer = Tracer()
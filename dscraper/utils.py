@@ -1,4 +1,5 @@
 from functools import update_wrapper
+from contextlib import contextmanager
 from collections import deque
 from pytz import timezone
 from datetime import datetime
@@ -8,8 +9,13 @@ import xml.etree.ElementTree as et
 import json
 import logging
 import itertools
+import os
+import sys
+import gzip
+import time
 
 from .exceptions import ParseError, ContentError, ConnectTimeout, DscraperError
+from .intervals import IntervalSet
 
 _logger = logging.getLogger(__name__)
 
@@ -90,6 +96,197 @@ def validate_id(target):
                         .format(type(target).__name__)) from None
 
 
+class TargetFile:
+    """Reads targets lazily from a file, which is never loaded into memory as a whole.
+
+    Each line contains either an ID or an inclusive range of IDs such as '1000-2000'.
+    Blank lines and comments after '#' are ignored. Invalid lines are logged and
+    skipped. Gzip-compressed files are recognized by their magic number.
+
+    The length is known only for uncompressed regular files, where the distinct IDs
+    are counted beforehand with a quick pass over the file, for the sake of progress
+    report. If the lines are not in ascending order, another pass counts them in an
+    IntervalSet, and the length is unknown if it would grow too large.
+
+    Iterated asynchronously, as BlockingDistributor does, the file is read in a
+    thread, so that a slow input such as a pipe does not block the event loop.
+
+    :param str path: path to the file, or '-' for the standard input
+    """
+    _CHUNK_SIZE = 2 ** 20
+    _GZIP_MAGIC = b'\x1f\x8b'
+    _MAX_INTERVALS = 2 ** 16
+
+    def __init__(self, path):
+        self.path = path
+        self._len = self._count()
+
+    def __iter__(self):
+        for ranges in self._chunks():
+            for start, end in ranges:
+                if start == end:
+                    yield start
+                else:
+                    yield from range(start, end + 1)
+
+    def __aiter__(self):
+        return _AsyncTargets(self._chunks())
+
+    def __len__(self):
+        if self._len is None:
+            raise TypeError('number of targets in \'{}\' is unknown'.format(self.path))
+        return self._len
+
+    @contextmanager
+    def _open(self):
+        if self.path == '-':
+            fin = open(sys.stdin.fileno(), 'rb', closefd=False)
+        else:
+            fin = open(self.path, 'rb')
+        with fin:
+            if fin.peek(2)[:2] == self._GZIP_MAGIC:
+                with gzip.GzipFile(fileobj=fin) as gin:
+                    yield gin
+            else:
+                yield fin
+
+    def _chunks(self, warn=True):
+        """Yield the (start, end) ranges of the lines read at once, in lists."""
+        with self._open() as fin:
+            lineno, rest, eof = 0, b'', False
+            while not eof:
+                data = fin.read1(self._CHUNK_SIZE)
+                eof = not data
+                data = rest + data
+                if eof:
+                    rest = b''
+                else:
+                    ilast = data.rfind(b'\n') + 1
+                    data, rest = data[:ilast], data[ilast:]
+                lines = data.splitlines()
+                if not lines:
+                    continue
+                ranges = None
+                # Lines of IDs alone, the most of them, are parsed at once
+                if b'-' not in data and b'#' not in data:
+                    try:
+                        ids = list(map(int, lines))
+                    except ValueError:
+                        pass  # blank or invalid lines
+                    else:
+                        if min(ids) > 0:
+                            ranges = list(zip(ids, ids))
+                if ranges is None:
+                    ranges = list(self._parse_lines(lines, lineno, warn))
+                lineno += len(lines)
+                yield ranges
+
+    def _parse_lines(self, lines, lineno, warn):
+        for lineno, line in enumerate(lines, lineno + 1):
+            try:
+                start, end = self._parse(line)
+            except ValueError:
+                if warn:
+                    _logger.warning('Invalid target at line %d of %s: %r', lineno, self.path,
+                                    line.strip())
+                continue
+            if start is not None:
+                yield start, end
+
+    def _count(self):
+        if self.path == '-' or not os.path.isfile(self.path):
+            return None
+        with open(self.path, 'rb') as fin:
+            if fin.peek(2)[:2] == self._GZIP_MAGIC:
+                return None
+        # Ranges in ascending order are distinct, and need no memory to count
+        cnt = last = 0
+        for ranges in self._chunks(False):
+            for start, end in ranges:
+                if start <= last:
+                    return self._count_distinct()
+                cnt += end - start + 1
+                last = end
+        return cnt
+
+    def _count_distinct(self):
+        targets = IntervalSet()
+        for ranges in self._chunks(False):
+            for start, end in ranges:
+                targets.add_range(start, end)
+            if targets.count_intervals() > self._MAX_INTERVALS:
+                return None
+        return len(targets)
+
+    @staticmethod
+    def _parse(line):
+        """:return (start, end): an inclusive range, or (None, None) on an empty line"""
+        line = line.split(b'#', 1)[0].strip()
+        if not line:
+            return None, None
+        start, _, end = line.partition(b'-')
+        start = int(start)
+        end = int(end) if end else start
+        if start <= 0 or end < start:
+            raise ValueError('not a valid range: {} - {}'.format(start, end))
+        return start, end
+
+
+class _AsyncTargets:
+    """Iterates over the targets of the chunks of a TargetFile, which are read in a
+    thread when iterated asynchronously. One chunk is read at a time.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._pending = deque()  # iterators over the targets of chunks read
+        self._done = False
+        self._lock = asyncio.Lock()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            item = self._pop()
+            if item is not None:
+                return item
+            if self._done:
+                raise StopAsyncIteration
+            async with self._lock:
+                if self._pending or self._done:
+                    continue
+                loop = asyncio.get_event_loop()
+                self._push(await loop.run_in_executor(None, next, self._chunks, None))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while True:
+            item = self._pop()
+            if item is not None:
+                return item
+            if self._done:
+                raise StopIteration
+            self._push(next(self._chunks, None))
+
+    def _pop(self):
+        while self._pending:
+            item = next(self._pending[0], None)
+            if item is not None:
+                return item
+            self._pending.popleft()
+        return None
+
+    def _push(self, ranges):
+        if ranges is None:
+            self._done = True
+        else:
+            self._pending.append(itertools.chain.from_iterable(
+                range(start, end + 1) for start, end in ranges))
+
+
 def escape_invalid_xml_chars(text):
     return _PATTERN_ILL_XML_CHR.sub(_REPL_ILL_XML_CHR, text)
 
@@ -174,12 +371,13 @@ class CommentFlow:
     ROOT_HEADERS = ('chatserver', 'chatid', 'mission', 'maxlimit', 'source')
     HISTORY_HEADERS = ('chatserver', 'chatid', 'mission', 'maxlimit')
 
-    def __init__(self, latest, histories, flows, roll_dates, limit):
+    def __init__(self, latest, histories, flows, roll_dates, limit, raw=None):
         self.latest = latest  # root element with children referenced in the flows.
         self._histories_roots = histories
         self.flows = flows
         self._splitter = roll_dates
         self.limit = limit
+        self._raw = raw  # document of the latest page as received, if left untouched
 
     def can_split(self):
         return bool(self._splitter)
@@ -197,6 +395,16 @@ class CommentFlow:
         """
         return self.latest
 
+    def get_raw(self):
+        """Return the latest page (/[cid].xml) exactly as received, or None if
+        it was trimmed, joined with history or had to be escaped, in which case
+        it must be serialized from the Elements instead.
+        Mostly called by file exporters, which could write it as is.
+
+        :return bytes:
+        """
+        return None if self._histories_roots else self._raw
+
     def get_all_comments(self):
         """Return a list of all comment Elements.
         Mostly called by database exporters, which require pure data and do not
@@ -416,11 +624,13 @@ class FrequencyController:
         float start: beginning of rush hour (inclusive)
         float end: ending of rush hour (exclusive)
         tzinfo timezone: time zone where the host is
+    :param callable clock: returns the current Unix time, by which rush hour is told
     """
     # TODO choose time config from the host's geolocation
 
-    def __init__(self, time_config=TIME_CONFIG_CN, *, loop=None):
+    def __init__(self, time_config=TIME_CONFIG_CN, *, clock=time.time, loop=None):
         self.loop = loop or asyncio.get_event_loop()
+        self._clock = clock
         self.interval, self.busy_interval, start, end, self.tz = time_config
         if not (0 <= start < 24 and 0 <= end < 24):
             raise ValueError('hours not in range [0, 24)')
@@ -452,7 +662,7 @@ class FrequencyController:
         return blocked
 
     def is_busy(self):
-        now = datetime.now(tz=self.tz)
+        now = datetime.fromtimestamp(self._clock(), tz=self.tz)
         hour = now.hour + now.minute / 60 + now.second / 3600
         return self._is_rush_hour(hour)
 
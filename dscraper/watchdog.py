@@ -0,0 +1,148 @@
+import logging
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+
+from .company import BaseWorker
+from .tracing import tracer
+
+_logger = logging.getLogger(__name__)
+
+_clock = time.perf_counter
+_ASYNCIO = os.path.dirname(asyncio.__file__) + os.sep
+
+
+class LagMonitor:
+    """Measures the lag of the event loop, i.e. how late a callback runs than it is
+    scheduled, to find out synchronous work that stalls all the workers.
+
+    A coroutine wakes up every interval and records how late it is. Meanwhile a
+    watchdog thread checks that the coroutine keeps waking up. Once the loop has
+    been stalled for longer than the threshold, the thread captures the stack of
+    the loop's thread, and the CID of the worker found on it, which are blamed for
+    the stall when the loop comes back. Stalls are grouped by stack, and the worst
+    offenders are reported in stat().
+
+    :param float threshold: seconds of lag regarded as a stall
+    :param float interval: seconds between checks. Default as half of the threshold
+    """
+    STACK_LIMIT = 8
+    TOP = 5
+    MAX_CIDS = 5
+
+    def __init__(self, threshold=0.1, interval=None, *, loop=None):
+        if threshold <= 0:
+            raise ValueError('threshold must be positive: {}'.format(threshold))
+        self.loop = loop or asyncio.get_event_loop()
+        self.threshold = threshold
+        self.interval = interval or threshold / 2
+        self.max_lag = 0.0
+        self.stalls = {}  # stack: [count, total lag, max lag, [cids]]
+        self._beat = None
+        self._captured = None  # (beat, stack, cid) of the stall going on
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._task = self._thread = self._thread_id = None
+
+    def start(self):
+        """Start monitoring the loop, which must be running in the current thread."""
+        if self._task is not None:
+            raise RuntimeError('monitor is already started')
+        self._thread_id = threading.get_ident()
+        self._beat = _clock()
+        self._stopped.clear()
+        self._task = asyncio.ensure_future(self._tick(), loop=self.loop)
+        self._thread = threading.Thread(target=self._watch, name='dscraper-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._stopped.set()
+        self._thread.join()
+        self._task = self._thread = None
+
+    def stat(self):
+        stats = ['-----', 'Event loop lag (threshold: {:.0f}ms)'.format(self.threshold * 1e3)]
+        stats.append('Max lag: {:.1f}ms, stalls: {}'.format(
+            self.max_lag * 1e3, sum(stall[0] for stall in self.stalls.values())))
+        worst = sorted(self.stalls.items(), key=lambda item: item[1][1], reverse=True)
+        for rank, (stack, (count, total, max_lag, cids)) in enumerate(worst[:self.TOP], 1):
+            stats.append('{}. {} stalls, {:.1f}ms in total, max {:.1f}ms{}'.format(
+                rank, count, total * 1e3, max_lag * 1e3,
+                ', at CID ' + ', '.join(map(str, cids)) if cids else ''))
+            if stack is None:
+                stats.append('  (stack not captured)')
+            for filename, lineno, name in reversed(stack or ()):
+                stats.append('  {}:{} in {}'.format(filename, lineno, name))
+        return '\n'.join(stats)
+
+    async def _tick(self):
+        while True:
+            start = _clock()
+            await asyncio.sleep(self.interval)
+            now = _clock()
+            lag = max(now - start - self.interval, 0.0)
+            with self._lock:
+                self._beat = now
+                captured, self._captured = self._captured, None
+            tracer.record('loop_lag', lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+            if lag >= self.threshold:
+                self._blame(lag, captured)
+
+    def _blame(self, lag, captured):
+        stack, cid = captured[1:] if captured is not None else (None, None)
+        stall = self.stalls.get(stack)
+        if stall is None:
+            stall = self.stalls[stack] = [0, 0.0, 0.0, []]
+        stall[0] += 1
+        stall[1] += lag
+        stall[2] = max(stall[2], lag)
+        if cid is not None and cid not in stall[3] and len(stall[3]) < self.MAX_CIDS:
+            stall[3].append(cid)
+        _logger.debug('Event loop stalled for %.1fms at CID %s', lag * 1e3, cid)
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            with self._lock:
+                beat, captured = self._beat, self._captured
+            if _clock() - beat - self.interval < self.threshold:
+                continue
+            if captured is not None and captured[0] == beat:
+                continue  # Captured once for each stall
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stack = [(summary.filename, summary.lineno, summary.name) for summary in
+                     traceback.extract_stack(frame, self.STACK_LIMIT)]
+            # Frames of the loop running the callback tell nothing
+            for i in range(len(stack) - 1, -1, -1):
+                if stack[i][0].startswith(_ASYNCIO):
+                    stack = tuple(stack[i + 1:])
+                    break
+            else:
+                stack = tuple(stack)
+            cid = find_item(frame)
+            del frame
+            with self._lock:
+                if self._beat == beat:  # Still stalled
+                    self._captured = beat, stack, cid
+
+
+def find_item(frame):
+    """Return the item of the innermost worker on the stack of the frame, if any."""
+    while frame is not None:
+        local = frame.f_locals
+        worker = local.get('self')
+        if isinstance(worker, BaseWorker):
+            # Worker forgets the item when exporting, unlike BaseWorker.run()
+            item = worker.item
+            return item if item is not None else local.get('item')
+        frame = frame.f_back
+    return None
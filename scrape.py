@@ -6,6 +6,9 @@ import logging
 import logging.handlers
 import argparse
 import datetime
+import json
+import sys
+from dscraper.utils import TargetFile
 
 # TODO hard-coded default config
 DEFAULT_SCRAPER_CONFIG = {}
@@ -14,8 +17,22 @@ DEFAULT_SCRAPER_CONFIG = {}
 FILE = 'file'
 STDOUT = 'stdout'
 MYSQL = 'mysql'
+SQLITE = 'sqlite'
+ARCHIVE = 'archive'
+DEDUP = 'dedup'
+COLUMNS = 'columns'
+JSONL = 'jsonl'
+CSV = 'csv'
 
 LOGGING_DIR = './log'
+MYSQL_CONFIG = './mysql.json'
+DEFAULT_MYSQL_CONFIG = {
+    'host': 'localhost',
+    'port': 3306,
+    'user': '',
+    'password': '',
+    'db': 'cmtdb'
+}
 
 logger = None
 
@@ -29,14 +46,29 @@ def parse_args():
     # TODO mode: add AID; export: add mysql
     parser = argparse.ArgumentParser()
     parser.add_argument('-e', '--export', metavar='method', default='file',
-                        choices=[FILE, STDOUT], help='how data is exported')
+                        choices=[FILE, STDOUT, SQLITE, MYSQL, ARCHIVE, DEDUP, COLUMNS, JSONL, CSV], help='how data is exported')
     parser.add_argument('-p', '--path', metavar='path', default='./comments',
-                        help='where should files go, if -e "file" was specified')
+                        help='where should files, the database or the archive go, if -e "file", "sqlite", "archive", "dedup", '
+                        '"columns", "jsonl" or "csv" was specified. "-" for stdout, if -e "jsonl" or "csv" was specified')
     parser.add_argument('-j', '--join', action='store_true', default=False,
-                        help='join comments of different dates into one file, if -e "file" was specified')
-
+                        help='join comments of different dates into one file, if -e "file", "archive" or "dedup" was specified')
+    parser.add_argument('-c', '--compress', metavar='format', default=None, choices=['gzip', 'zstd'],
+                        help='compress files with "gzip" or "zstd", if -e "file" or "dedup" was specified')
+
+    parser.add_argument('--flush-interval', metavar='seconds', type=float, default=None,
+                        help='maximum seconds lines are buffered for, if -e "jsonl" or "csv" was specified')
+    parser.add_argument('-q', '--export-queue', metavar='size', type=int, default=32,
+                        help='number of targets waiting to be exported in the background. 0 to export in place')
     parser.add_argument('-b', '--no-history', dest='history', action='store_false', default=True,
                         help='do not request history comments. Get latest comments only')
+    parser.add_argument('--retries', metavar='times', type=int, default=3,
+                        help='how many times a target failed for transient reasons is retried at the end')
+    parser.add_argument('-d', '--dead-cache', metavar='path', default=None,
+                        help='file remembering CIDs not found or empty, which are skipped in later runs')
+    parser.add_argument('--dead-ttl', metavar='days', type=float, default=None,
+                        help='check CIDs in the dead cache again after this many days')
+    parser.add_argument('--probe', metavar='rate', type=float, default=0,
+                        help='fraction of CIDs in the dead cache that are checked again anyway')
     parser.add_argument('-t', '--type', metavar='id_type', default='cid',
                         choices=['cid'], help='what kind of ID numbers in -r and targets are specified')
     parser.add_argument('-s', '--start-time', metavar='timestamp', dest='start', type=int, default=None,
@@ -46,18 +78,56 @@ def parse_args():
 
     parser.add_argument('-r', '--range', metavar=('id', 'id'), nargs=2, type=int, action='append', default=[],
                         help='the first and last ID numbers of consecutive targets to scrape. Can be specified multiple times')
+    parser.add_argument('-f', '--targets-file', metavar='path', dest='files', action='append', default=[],
+                        help='file of ID numbers or ranges like "1000-2000", one per line, optionally gzipped. '
+                        '"-" for stdin. Can be specified multiple times')
     parser.add_argument('targets', nargs='*', type=int,
                         help='ID numbers of individual targets to scrape')
 
+    parser.add_argument('--trace', metavar='path', nargs='?', const=True, default=False,
+                        help='report latencies of each stage and throughput. '
+                        'If a path is given, also write a JSON trace to it')
+    parser.add_argument('--metrics', metavar='port', nargs='?', type=int, const=dscraper.MetricsServer.PORT,
+                        help='serve live metrics in the Prometheus text format on localhost:port '
+                        '(default port: %(const)s)')
+    parser.add_argument('--control', metavar='port', nargs='?', type=int, const=dscraper.ControlServer.PORT,
+                        help='serve an admin API on localhost:port to resize, pause or add targets '
+                        'while running (default port: %(const)s)')
+    parser.add_argument('--watchdog', metavar='ms', nargs='?', type=float, const=100,
+                        help='report where the event loop is stalled for longer than ms milliseconds '
+                        '(default: %(const)s)')
+    parser.add_argument('--profile', metavar='path',
+                        help='sample the stacks while running, write them to path as collapsed stacks '
+                        'for flame graphs, and report the hottest functions and CIDs')
+    parser.add_argument('--profile-rate', metavar='Hz', type=float, default=100,
+                        help='samples per second of --profile (default: %(default)s)')
+    parser.add_argument('--memory', default=False, action='store_true',
+                        help='account the memory taken by each CID, and report the largest ones')
+    parser.add_argument('--memory-budget', metavar='MB', type=float,
+                        help='warn about CIDs taking more memory than this. Implies --memory')
+    parser.add_argument('--memory-abort', default=False, action='store_true',
+                        help='abort CIDs over --memory-budget instead of warning')
     parser.add_argument('-v', '--verbose', default=False, action='store_true',
                         help='logging in a verbose way')
 
     args = parser.parse_args()
-    if not (args.range or args.targets):
-        parser.error('no targets specified: expected --range and/or targets')
+    if not (args.range or args.targets or args.files):
+        parser.error('no targets specified: expected --range, --targets-file and/or targets')
     return args
 
 
+def get_mysql_config():
+    """Load the configuration of MySQL. If there is none, generate one and exit."""
+    try:
+        with open(MYSQL_CONFIG) as fin:
+            return json.load(fin)
+    except FileNotFoundError:
+        with open(MYSQL_CONFIG, 'w') as fout:
+            json.dump(DEFAULT_MYSQL_CONFIG, fout, indent=4)
+        sys.exit('Please set the username and password of MySQL in {}'.format(
+            os.path.abspath(MYSQL_CONFIG)))
+
+
 def config_logging(verbose):
     def set_handler(hdlr):
         hdlr.setLevel(lvl)
@@ -81,9 +151,16 @@ def config_logging(verbose):
 
 def main():
     args = parse_args()
-    export, path, start, end, mode, range_targets, targets, join, history, verbose = \
+    export, path, start, end, mode, range_targets, targets, join, history, verbose, retries = \
         args.export, args.path, args.start, args.end, args.type, args.range, args.targets, \
-        args.join, args.history, args.verbose
+        args.join, args.history, args.verbose, args.retries
+    dead_cache, dead_ttl, probe, files = args.dead_cache, args.dead_ttl, args.probe, args.files
+    export_queue, compress, flush_interval = args.export_queue, args.compress, args.flush_interval
+    trace, metrics, control = args.trace, args.metrics, args.control
+    watchdog = args.watchdog / 1000 if args.watchdog else None
+    profile, profile_rate = args.profile, args.profile_rate
+    memory, memory_abort = args.memory, args.memory_abort
+    memory_budget = int(args.memory_budget * 2 ** 20) if args.memory_budget else None
     time_range = None if start is None and end is None else (start, end)
 
     config_logging(verbose)
@@ -91,22 +168,44 @@ def main():
     loop = asyncio.get_event_loop()
 
     if export == FILE:
-        exporter = dscraper.FileExporter(path, join, loop=loop)
+        exporter = dscraper.FileExporter(path, join, compress=compress, loop=loop)
     elif export == STDOUT:
         exporter = dscraper.StreamExporter(loop=loop)
+    elif export == SQLITE:
+        exporter = dscraper.SqliteExporter(path, loop=loop)
     elif export == MYSQL:
-        # TODO generate config file and notice user to set username and pw in config file
-        pass
-
-    scraper = dscraper.Scraper(exporter, history, time_range, loop=loop)
+        exporter = dscraper.MysqlExporter(get_mysql_config(), loop=loop)
+    elif export == JSONL:
+        exporter = dscraper.JsonLinesExporter(path, flush_interval=flush_interval, loop=loop)
+    elif export == CSV:
+        exporter = dscraper.CsvExporter(path, flush_interval=flush_interval, loop=loop)
+    elif export == COLUMNS:
+        exporter = dscraper.ColumnarExporter(path, loop=loop)
+    elif export == DEDUP:
+        exporter = dscraper.DedupExporter(path, join, compress=compress, loop=loop)
+    elif export == ARCHIVE:
+        exporter = dscraper.ArchiveExporter(path, join, loop=loop)
+
+    negative_cache = None
+    if dead_cache is not None:
+        negative_cache = dscraper.NegativeCache(dead_cache, dead_ttl, probe)
+
+    scraper = dscraper.Scraper(exporter, history, time_range, retries=retries,
+                               negative_cache=negative_cache, export_queue=export_queue, trace=trace,
+                               metrics=metrics, control=control, watchdog=watchdog,
+                               profile=profile, profile_rate=profile_rate,
+                               memory=memory, memory_budget=memory_budget,
+                               memory_abort=memory_abort, loop=loop)
     mode = mode.upper()
     for target in targets:
         scraper.add(target, mode)
     for start, end in range_targets:
         scraper.add_range(start, end, mode)
+    for filename in files:
+        scraper.add_list(TargetFile(filename), mode)
 
-    logger.info('Start scraping with the configuration: export: %s, path: %s, time_range: %s, mode: %s, range_targets: %s, targets: %s, join: %s, history: %s',
-                export, path, time_range, mode, range_targets, targets, join, history)
+    logger.info('Start scraping with the configuration: export: %s, path: %s, time_range: %s, mode: %s, range_targets: %s, targets: %s, targets_files: %s, join: %s, compress: %s, history: %s, retries: %s, dead_cache: %s',
+                export, path, time_range, mode, range_targets, targets, files, join, compress, history, retries, dead_cache)
     scraper.run()
 
     loop.close()
@@ -0,0 +1,80 @@
+import logging
+import os
+import tempfile
+from dscraper.archive import ArchiveExporter, ArchiveReader
+from dscraper.exporter import XmlSerializer
+
+from .utils import Test
+from .test_exporter import make_flow
+
+logger = logging.getLogger(__name__)
+
+
+def serialize(flow):
+    return XmlSerializer().serialize(flow.get_latest())
+
+
+class TestArchive(Test):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def connect(self, **kwargs):
+        exporter = ArchiveExporter(self.dir.name, loop=self.loop, **kwargs)
+        self.loop_until_complete(exporter._open_connection())
+        return exporter
+
+    def dump(self, exporter, cids):
+        for cid in cids:
+            self.loop_until_complete(exporter.dump(cid, make_flow([cid, cid + 1])))
+
+    def test_read(self):
+        exporter = self.connect(segment_size=1)
+        self.dump(exporter, [5, 3, 9, 1])
+        self.loop_until_complete(exporter.dump_batch([(7, make_flow([70]), None)]))
+        self.loop_until_complete(exporter.disconnect())
+        self.assertEqual(len([filename for filename in os.listdir(self.dir.name)
+                              if filename.startswith('segment')]), 5, 'segments not rotated')
+        with ArchiveReader(self.dir.name) as reader:
+            self.assertEqual(list(reader), [(1, 0), (3, 0), (5, 0), (7, 0), (9, 0)])
+            self.assertEqual(reader.get(3), serialize(make_flow([3, 4])))
+            self.assertEqual(reader.get(7), serialize(make_flow([70])))
+            self.assertEqual(reader.dates(9), [0])
+            self.assertNotIn((4, 0), reader)
+            with self.assertRaises(KeyError):
+                reader.get(4)
+
+    def test_append(self):
+        exporter = self.connect()
+        self.dump(exporter, [1, 2])
+        self.loop_until_complete(exporter.disconnect())
+        exporter = self.connect()
+        self.loop_until_complete(exporter.dump(2, make_flow([20])))
+        self.dump(exporter, [3])
+        self.loop_until_complete(exporter.disconnect())
+        with ArchiveReader(self.dir.name) as reader:
+            self.assertEqual(len(reader), 3)
+            self.assertEqual(reader.get(1), serialize(make_flow([1, 2])))
+            self.assertEqual(reader.get(2), serialize(make_flow([20])), 'old document not replaced')
+
+    def test_recover(self):
+        exporter = self.connect()
+        exporter.SYNC_EVERY = 2
+        self.dump(exporter, [1, 2, 3])
+        # Crash before the third document is synced
+        exporter._segment.close()
+        exporter._journal.close()
+        exporter._executor.shutdown()
+        exporter = self.connect()
+        self.dump(exporter, [4])
+        self.loop_until_complete(exporter.disconnect())
+        with ArchiveReader(self.dir.name) as reader:
+            self.assertEqual(list(reader), [(1, 0), (2, 0), (4, 0)])
+            self.assertEqual(reader.get(2), serialize(make_flow([2, 3])))
+            self.assertEqual(reader.get(4), serialize(make_flow([4, 5])))
+        with open(os.path.join(self.dir.name, 'segment-00000.dat'), 'rb') as fin:
+            self.assertEqual(fin.read(), serialize(make_flow([1, 2])) + serialize(make_flow([2, 3])),
+                             'unsynced document not truncated')
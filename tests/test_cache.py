@@ -0,0 +1,53 @@
+import unittest
+import logging
+import os
+import json
+import tempfile
+
+from dscraper.cache import NegativeCache
+from dscraper.intervals import IntervalSet
+
+logger = logging.getLogger(__name__)
+
+
+class TestNegativeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'dead.json')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_persist(self):
+        cache = NegativeCache(self.path).load()
+        self.assertEqual(len(cache), 0)
+        cache.update(IntervalSet([1, 2, 3, 7]))
+        cache.save()
+
+        cache = NegativeCache(self.path).load()
+        self.assertEqual(len(cache), 4)
+        self.assertTrue(cache.should_skip(2))
+        self.assertFalse(cache.should_skip(4))
+
+        cache.update(IntervalSet([10]), alive=IntervalSet([2]))
+        self.assertEqual([cid for cid in range(12) if cid in cache], [1, 3, 7, 10])
+
+    def test_ttl(self):
+        cache = NegativeCache(self.path)
+        cache.update(IntervalSet([1, 2]))
+        cache.save()
+        with open(self.path) as fin:
+            data = json.load(fin)
+        data['days'] = {str(int(day) - 10): flat for day, flat in data['days'].items()}
+        with open(self.path, 'w') as fout:
+            json.dump(data, fout)
+
+        self.assertEqual(len(NegativeCache(self.path, ttl=20).load()), 2)
+        self.assertEqual(len(NegativeCache(self.path, ttl=5).load()), 0, 'not expired')
+
+    def test_probe(self):
+        cache = NegativeCache(self.path, probe=1)
+        cache.update(IntervalSet([1]))
+        self.assertFalse(cache.should_skip(1))
+        self.assertEqual(cache.get_probed_count(), 1)
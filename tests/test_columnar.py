@@ -0,0 +1,63 @@
+import logging
+import os
+import tempfile
+import unittest
+from dscraper.columnar import ColumnarExporter, load_npz, numpy, pyarrow
+
+from .utils import Test
+from .test_exporter import make_flow
+
+logger = logging.getLogger(__name__)
+
+MAY_2016 = 1462060800
+JUNE_2016 = 1464739200
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class TestColumnarExporter(Test):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def export(self, **kwargs):
+        exporter = ColumnarExporter(self.dir.name, partition_size=10, row_group_size=3,
+                                    loop=self.loop, **kwargs)
+        self.loop_until_complete(exporter._open_connection())
+        self.loop_until_complete(exporter.dump(1, make_flow(
+            [{'id': 1, 'user': 'a'}, {'id': 2, 'user': 'b'}, {'id': 3, 'user': 'a', 'pool': 1}])))
+        self.loop_until_complete(exporter.dump_batch([
+            (2, make_flow([{'id': 4, 'user': 'b', 'date': MAY_2016}]), None),
+            (15, make_flow([{'id': 5, 'user': 'c', 'date': JUNE_2016, 'color': 255}]), None)]))
+        self.loop_until_complete(exporter.disconnect())
+
+    def test_npz(self):
+        self.export(format='npz')
+        self.assertEqual(sorted(os.listdir(self.dir.name)), ['cid=0', 'cid=10'])
+        self.assertEqual(len(os.listdir(os.path.join(self.dir.name, 'cid=0'))), 2,
+                         'rows not flushed by row_group_size')
+        columns = load_npz(self.dir.name)
+        self.assertEqual(sorted(columns['id'].tolist()), [1, 2, 3, 4, 5])
+        self.assertEqual(sorted(zip(columns['id'].tolist(), columns['user'].tolist())),
+                         [(1, 'a'), (2, 'b'), (3, 'a'), (4, 'b'), (5, 'c')])
+        self.assertEqual(columns['color'][columns['id'] == 5].tolist(), [255])
+        self.assertEqual(columns['pool'][columns['id'] == 3].tolist(), [1])
+
+    def test_by_month(self):
+        self.export(format='npz', by_month=True)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.dir.name, 'cid=0'))),
+                         ['month=1970-01', 'month=2016-05'])
+        columns = load_npz(os.path.join(self.dir.name, 'cid=10', 'month=2016-06'))
+        self.assertEqual(columns['cid'].tolist(), [15])
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_parquet(self):
+        self.export(format='parquet')
+        table = pyarrow.parquet.read_table(os.path.join(self.dir.name, 'cid=0'))
+        self.assertEqual(sorted(table.column('id').to_pylist()), [1, 2, 3, 4])
+        self.assertEqual(pyarrow.parquet.ParquetFile(os.path.join(
+            self.dir.name, 'cid=0', os.listdir(os.path.join(self.dir.name, 'cid=0'))[0])
+        ).num_row_groups, 2)
+        self.assertEqual(str(table.schema.field('user').type), 'dictionary<values=string, indices=int32, ordered=0>')
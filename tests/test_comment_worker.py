@@ -2,6 +2,7 @@ import logging
 from itertools import chain
 from xml.etree.ElementTree import Element
 from dscraper.company import CommentWorker
+from dscraper.exceptions import Scavenger, ContentError
 from dscraper.scraper import BlockingDistributor
 from dscraper.utils import parse_comments_xml
 
@@ -290,6 +291,19 @@ class TestCommentWorker(Test):
         for (_, (dumped_cid, _, _)), cid in zip(actions, STUB_DATA_GENERAL.keys()):
             self.assertEqual(dumped_cid, cid, 'incorrect target cid')
 
+    def test_history_error(self):
+        async def get_rolldate_json(cid):
+            raise ContentError('content of the Roll Date is invalid')
+        self.fcer.get_rolldate_json = get_rolldate_json
+        with self.assertRaises(ContentError) as cm:
+            self.loop.run_until_complete(self.worker._next(1))
+
+        scavenger = Scavenger()
+        self.worker.item = 1
+        scavenger.failure(self.worker, cm.exception)
+        self.assertEqual(len(scavenger.get_dead()), 0, 'CID of a valid latest page regarded as dead')
+        self.assertEqual(list(scavenger.get_failures()), [1])
+
     def test_digest(self):
         for data in STUB_DATA_DIGEST:
             segments = self.worker._digest(make_xml(data[CMTS]))
@@ -321,6 +335,9 @@ class TestCommentWorker(Test):
 
 class DummyFetcher(ActionRecorder):
 
+    async def get_comments(self, cid, date=0):
+        return await self.get_comments_root(cid, date), None
+
     async def get_comments_root(self, cid, date=0):
         self.record_cmts(cid, date)
         data = STUB_DATA_GENERAL[cid]
@@ -348,7 +365,7 @@ class DummyScavenger(ActionRecorder):
     def is_dead(self):
         return False
 
-    def success(self):
+    def success(self, item=None):
         pass
 
     def failure(self, worker, e):
@@ -0,0 +1,85 @@
+import logging
+import asyncio
+from unittest import mock
+from dscraper.company import CidCompany, BaseWorker
+from dscraper.exceptions import Scavenger
+from dscraper.exporter import BaseExporter, ExportQueue
+from dscraper.scraper import BlockingDistributor
+
+from .utils import Test
+
+logger = logging.getLogger(__name__)
+
+
+class DummyController:
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    async def wait(self):
+        pass
+
+    def is_busy(self):
+        return False
+
+    def release(self):
+        pass
+
+    def free(self):
+        pass
+
+
+class DummyFetcher:
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+
+class DummyWorker(BaseWorker):
+
+    async def _next(self, item):
+        return item
+
+
+class LateExporter(BaseExporter):
+    """Fails a CID only after the workers are done with it."""
+
+    def __init__(self, bad, *, loop):
+        super().__init__(loop=loop)
+        self.bad = bad
+
+    async def connect(self):
+        pass
+
+    async def disconnect(self):
+        pass
+
+    async def dump_batch(self, items):
+        await asyncio.sleep(0.01)
+        return [(cid, ValueError('bad cid')) for cid, _, _ in items if cid == self.bad]
+
+
+class TestCidCompany(Test):
+
+    def test_late_export_failure(self):
+        distributor = BlockingDistributor(0, loop=self.loop)
+        scavenger = Scavenger(retry=distributor.retry)
+        exporter = ExportQueue(LateExporter(20, loop=self.loop), depth=32, scavenger=scavenger,
+                               loop=self.loop)
+        with mock.patch('dscraper.company.FrequencyController', DummyController):
+            company = CidCompany(2, distributor, scavenger=scavenger, exporter=exporter,
+                                 history=False, time_range=None, loop=self.loop)
+        company._ctor = lambda: DummyWorker(exporter=exporter, distributor=company,
+                                            scavenger=scavenger, fetcher=DummyFetcher())
+        company.post(range(1, 21))
+        company.set()
+        self.loop_until_complete(exporter.connect())
+        try:
+            stats = self.loop_until_complete(company.run()).split('\n')
+        finally:
+            self.loop_until_complete(exporter.disconnect())
+        self.assertIn('Number of targets scraped: 19 (0 not found, 0 empty)', stats)
+        self.assertIn('Exceptions occured at: 20 (1 in total)', stats)
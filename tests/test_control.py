@@ -0,0 +1,74 @@
+import logging
+import asyncio
+import json
+from dscraper.scraper import Scraper
+from dscraper.control import ControlServer
+
+from .utils import Test
+
+logger = logging.getLogger(__name__)
+
+
+class DummyScraper:
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+    def get_stats(self):
+        return {'companies': []}
+
+
+class TestControlServer(Test):
+
+    def setUp(self):
+        self.scraper = DummyScraper()
+        self.server = ControlServer(self.scraper, loop=self.loop)
+
+    def respond(self, method, path, body=b''):
+        status, _, body = self.server.respond(method, path, body)
+        return status, json.loads(body.decode())
+
+    def test_operations(self):
+        self.assertEqual(self.respond('POST', '/workers', b'{"max_workers": 8}'), (200, {'ok': True}))
+        self.respond('POST', '/rate', b'{"busy_interval": 6}')
+        self.respond('POST', '/pause/')
+        self.respond('POST', '/targets', b'{"targets": [3, 4], "ranges": [[10, 20]]}')
+        self.assertEqual(self.scraper.calls, [
+            ('resize', (8,)), ('set_rate', (None, 6.0)), ('pause', ()),
+            ('post_range', (10, 20)), ('post', ([3, 4],))])
+        self.assertEqual(self.respond('GET', '/stats'), (200, {'companies': []}))
+
+    def test_errors(self):
+        self.assertEqual(self.respond('POST', '/nothing')[0], 404)
+        self.assertEqual(self.respond('GET', '/workers')[0], 405)
+        self.assertEqual(self.respond('POST', '/workers', b'{"max_workers": ')[0], 400)
+        self.assertEqual(self.respond('POST', '/workers', b'{"workers": 8}')[0], 400)
+        self.assertEqual(self.respond('POST', '/targets', b'{"targets": [1], "ranges": [[5, 2]]}')[0],
+                         400)
+        self.assertFalse(self.scraper.calls, 'invalid request executed')
+
+    def test_not_running(self):
+        self.server.scraper = Scraper(loop=self.loop)
+        status, content = self.respond('POST', '/pause')
+        self.assertEqual(status, 409)
+        self.assertIn('no CID company', content['error'])
+
+    def test_serve(self):
+        async def post():
+            await self.server.start()
+            try:
+                reader, writer = await asyncio.open_connection(self.server.host, self.server.port)
+                body = b'{"max_workers": 3}'
+                writer.write(b'POST /workers HTTP/1.1\r\nContent-Length: 18\r\n\r\n' + body)
+                response = await reader.read()
+                writer.close()
+                return response
+            finally:
+                await self.server.close()
+        self.server.port = 0
+        head, body = self.loop_until_complete(post()).split(b'\r\n\r\n', 1)
+        self.assertTrue(head.startswith(b'HTTP/1.0 200 OK'))
+        self.assertEqual(self.scraper.calls, [('resize', (3,))])
@@ -0,0 +1,48 @@
+import logging
+import os
+import tempfile
+from dscraper.dedup import DedupExporter, pack, unpack
+from dscraper.exporter import FileExporter, iter_documents
+from dscraper.utils import CommentFlow
+
+from .utils import Test
+from .test_comment_worker import make_xml
+from .test_exporter import make_flow
+
+logger = logging.getLogger(__name__)
+
+
+def make_history_flow():
+    cmts = make_xml(list(range(1, 61)), 20)
+    flow = [elem for elem in cmts if elem.tag == 'd']
+    latest = make_xml(list(range(41, 61)), 20)
+    return CommentFlow(latest, {2: None}, [flow], list(range(2, 42, 2)), 20)
+
+
+class TestDedup(Test):
+
+    def test_round_trip(self):
+        for flow in (make_history_flow(), make_flow([1, 2, 3]), make_flow([1], raw=b'<i></i>')):
+            self.assertEqual(list(unpack(pack(flow))), list(iter_documents(flow)))
+        flow = make_history_flow()
+        self.assertEqual(list(unpack(pack(flow, False))), list(iter_documents(flow, False)))
+
+    def test_size(self):
+        flow = make_history_flow()
+        size = sum(len(document) for _, document in iter_documents(flow))
+        self.assertLess(len(pack(flow)) * 2, size, 'history overlap not deduplicated')
+
+    def test_regenerate(self):
+        with tempfile.TemporaryDirectory() as path:
+            for exporter in (DedupExporter(os.path.join(path, 'dedup'), loop=self.loop),
+                             FileExporter(os.path.join(path, 'xml'), loop=self.loop)):
+                self.loop_until_complete(exporter._open_connection())
+                self.loop_until_complete(exporter.dump(3, make_history_flow()))
+                self.loop_until_complete(exporter.disconnect())
+            files = DedupExporter(os.path.join(path, 'dedup'), loop=self.loop).regenerate(
+                3, os.path.join(path, 'regenerated'))
+            self.assertEqual(len(files), 21)
+            for filename in files:
+                relative = os.path.relpath(filename, os.path.join(path, 'regenerated'))
+                with open(filename, 'rb') as fin, open(os.path.join(path, 'xml', relative), 'rb') as orig:
+                    self.assertEqual(fin.read(), orig.read(), 'not byte-identical: ' + relative)
@@ -0,0 +1,139 @@
+import logging
+import os
+import tempfile
+from dscraper.scraper import BlockingDistributor
+from dscraper.exceptions import NoMoreItems
+from dscraper.utils import TargetFile
+
+from .utils import Test
+
+logger = logging.getLogger(__name__)
+
+
+class TestBlockingDistributor(Test):
+
+    def setUp(self):
+        self.d = BlockingDistributor(2, loop=self.loop)
+        self.d.RETRY_BACKOFF = 0.01
+        self.d.RETRY_JITTER = 0
+
+    def claim_all(self):
+        async def _claim_all():
+            items = []
+            while True:
+                try:
+                    items.append(await self.d.claim())
+                except NoMoreItems:
+                    return items
+        return self.loop_until_complete(_claim_all())
+
+    def claim(self):
+        return self.loop_until_complete(self.d.claim())
+
+    def test_claim(self):
+        self.d.post([1, 2, 3])
+        self.d.post_list([range(4, 6), iter([6])])
+        self.d.set()
+        self.assertEqual(self.claim_all(), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(self.d.get_total(), None)
+
+    def test_claim_file(self):
+        with tempfile.TemporaryDirectory() as dir:
+            path = os.path.join(dir, 'targets.txt')
+            with open(path, 'wb') as fout:
+                fout.write(b'1-3\n2\n5\n')
+            self.d.post(TargetFile(path))
+            self.d.post([6])
+            self.d.set()
+            self.assertEqual(self.d.get_total(), 5)
+            self.assertEqual(self.claim_all(), [1, 2, 3, 5, 6])
+
+    def test_deduplicate(self):
+        self.d.post_list([range(1, 6), [3, 4, 10], range(4, 8)])
+        self.assertEqual(self.d.get_total(), 8)
+        self.d.post(iter([2, 11]))
+        self.assertEqual(self.d.get_total(), None)
+        self.d.set()
+        self.assertEqual(self.claim_all(), [1, 2, 3, 4, 5, 10, 6, 7, 11])
+        self.assertEqual(self.d.get_duplicate_count(), 5)
+
+    def test_total_invalid(self):
+        self.d.post_list([[1, 2, 'x'], [3, 2 ** 70]])
+        self.assertEqual(self.d.get_total(), 5)
+
+    def test_recycle(self):
+        self.d.post([1, 2])
+        self.assertEqual(self.claim(), 1)
+        self.d.post([1], True)
+        self.assertEqual(self.d.get_total(), 2)
+        self.d.set()
+        self.assertEqual(self.claim_all(), [2, 1])
+
+    def test_skip(self):
+        self.d = BlockingDistributor(skip=lambda item: item % 2 == 0, loop=self.loop)
+        self.d.post(range(1, 7))
+        self.d.set()
+        self.assertEqual(self.claim_all(), [1, 3, 5])
+        self.assertEqual(self.d.get_skipped_count(), 3)
+
+    def test_retry_after_fresh_items(self):
+        self.d.post([1, 2, 3])
+        self.d.set()
+        self.assertEqual(self.claim(), 1)
+        self.assertTrue(self.d.retry(1))
+        self.assertEqual(self.claim_all(), [2, 3, 1])
+
+    def test_retry_attempts(self):
+        self.d.set()
+        self.assertTrue(self.d.retry(1))
+        self.assertEqual(self.claim(), 1)
+        self.assertTrue(self.d.retry(1))
+        self.assertEqual(self.claim(), 1)
+        self.assertFalse(self.d.retry(1), 'retried more times than allowed')
+        self.assertEqual(self.claim_all(), [])
+
+    def test_retry_backoff(self):
+        self.d.RETRY_BACKOFF = 0.2
+        self.d.set()
+        self.d.retry(1)
+        start = self.loop.time()
+        self.assertEqual(self.claim(), 1)
+        self.assertGreaterEqual(self.loop.time() - start, 0.2, 'retried before backoff')
+
+    def test_retry_woken_by_new_items(self):
+        self.d.RETRY_BACKOFF = 10
+        self.d.retry(1)
+        self.loop.call_later(0.01, self.d.post, [2])
+        self.assertEqual(self.claim(), 2)
+
+    def test_dump(self):
+        self.d.RETRY_BACKOFF = 10
+        self.d.post(range(1, 6))
+        self.assertEqual([self.claim() for _ in range(3)], [1, 2, 3])
+        self.assertTrue(self.d.retry(2))
+        self.assertEqual(list(self.d.dump()), [2, 4, 5])
+        self.d.set()
+        self.assertEqual(self.claim_all(), [])
+
+    def test_dump_duplicates(self):
+        self.d.post(iter([1, 2, 3]))
+        self.assertEqual([self.claim() for _ in range(2)], [1, 2])
+        self.d.post(iter([1, 2, 4, 5, 6]))
+        self.d.post(range(1, 8))
+        self.assertEqual(str(self.d.dump(3)), '3-5')
+        self.d.post(range(1, 8))
+        self.assertEqual(str(self.d.dump()), '3-7')
+
+    def test_dump_range(self):
+        self.d.post(range(1, 10 ** 12))
+        self.d.post(iter([10 ** 13, 10 ** 14]))
+        self.assertEqual(self.claim(), 1)
+        items = self.d.dump()
+        self.assertEqual(len(items), 10 ** 12)
+        self.assertEqual(list(items.intervals()), [(2, 10 ** 12 - 1), (10 ** 13, 10 ** 13),
+                                                   (10 ** 14, 10 ** 14)])
+
+    def test_dump_limit(self):
+        self.d.post(iter([20, 30]))
+        self.d.post(range(1, 100))
+        self.assertEqual(str(self.d.dump(5)), '1-3, 20, 30')
@@ -0,0 +1,395 @@
+import logging
+import asyncio
+import os
+import sqlite3
+import io
+import tempfile
+import threading
+import unittest
+import json
+from unittest import mock
+from xml.etree.ElementTree import Element
+from dscraper.exporter import (SqliteExporter, MysqlExporter, ExportQueue, BaseExporter,
+                               FileExporter, StreamExporter, XmlSerializer, open_exported,
+                               zstandard, JsonLinesExporter, CsvExporter)
+from dscraper.utils import CommentFlow
+
+from .utils import Test
+from .test_comment_worker import make_xml
+
+logger = logging.getLogger(__name__)
+
+
+def make_flow(cmts, maxlimit=0, raw=None):
+    return CommentFlow(make_xml(cmts, maxlimit), None, None, None, maxlimit, raw)
+
+
+class SlowExporter(BaseExporter):
+
+    def __init__(self, *, loop):
+        super().__init__(loop=loop)
+        self.batches = []
+        self.sluice = asyncio.Event()
+
+    async def connect(self):
+        pass
+
+    async def disconnect(self):
+        pass
+
+    async def dump_batch(self, items):
+        await self.sluice.wait()
+        self.batches.append([cid for cid, _, _ in items])
+        return [(cid, ValueError('bad cid')) for cid, _, _ in items if cid < 0]
+
+
+class DummyScavenger:
+
+    def __init__(self):
+        self.failures = []
+
+    def export_failure(self, item, e):
+        self.failures.append(item)
+
+
+class TestExportQueue(Test):
+
+    def setUp(self):
+        self.exporter = SlowExporter(loop=self.loop)
+        self.scavenger = DummyScavenger()
+        self.queue = ExportQueue(self.exporter, depth=4, batch_size=3, consumers=1,
+                                 scavenger=self.scavenger, loop=self.loop)
+        self.loop_until_complete(self.queue.connect())
+
+    def tearDown(self):
+        self.exporter.sluice.set()
+        self.loop_until_complete(self.queue.disconnect())
+
+    def test_backpressure(self):
+        async def dump_all():
+            for cid in range(1, 11):
+                await self.queue.dump(cid, None)
+        fut = asyncio.ensure_future(dump_all(), loop=self.loop)
+        self.loop_until_complete(asyncio.sleep(0.01))
+        self.assertFalse(fut.done(), 'not blocked on a full queue')
+        self.assertEqual(self.queue.qsize(), 4)
+
+        self.exporter.sluice.set()
+        self.loop_until_complete(fut)
+        self.loop_until_complete(self.queue.disconnect())
+        self.assertEqual(sum(self.exporter.batches, []), list(range(1, 11)))
+        self.assertLessEqual(max(map(len, self.exporter.batches)), 3)
+        self.assertGreater(max(map(len, self.exporter.batches)), 1, 'not batched')
+
+    def test_failure(self):
+        self.exporter.sluice.set()
+        self.loop_until_complete(self.queue.dump(-1, None))
+        self.loop_until_complete(self.queue.dump(2, None))
+        self.loop_until_complete(self.queue.disconnect())
+        self.assertEqual(self.scavenger.failures, [-1])
+
+
+class TestXmlSerializer(Test):
+
+    def test_serialize(self):
+        header = Element('maxlimit')
+        header.text = '8'
+        cmt = Element('d', {'p': '1,2'})
+        cmt.text = 'a<b & c'
+        serializer = XmlSerializer()
+        data = serializer.serialize([header, cmt])
+        self.assertEqual(data, XmlSerializer.HEAD + b'\t<maxlimit>8</maxlimit>\n'
+                         b'\t<d p="1,2">a&lt;b &amp; c</d>\n' + XmlSerializer.TAIL)
+
+    def test_cache(self):
+        pages = [list(make_xml(cmts)) for cmts in ([1, 2, 3], [2, 3, 4], [3, 4, 5])]
+        serializer = XmlSerializer()
+        with mock.patch.object(serializer, '_encode', wraps=serializer._encode) as encode:
+            documents = [serializer.serialize(page) for page in pages]
+        # 5 comments, and the maxlimit and ds headers shared by the pages
+        self.assertEqual(encode.call_count, 7, 'comment of overlapping pages encoded again')
+        self.assertEqual(documents, [XmlSerializer().serialize(page) for page in pages])
+
+
+class TestRawExport(Test):
+    RAW = '<?xml version="1.0"?><i><maxlimit>0</maxlimit><d p="1">原文</d></i>'.encode()
+
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as path:
+            exporter = FileExporter(path, loop=self.loop)
+            self.loop_until_complete(exporter._open_connection())
+            self.loop_until_complete(exporter.dump(1, make_flow([1], raw=self.RAW)))
+            self.loop_until_complete(exporter.dump(2, make_flow([1])))
+            self.loop_until_complete(exporter.disconnect())
+            with open(os.path.join(path, '1.xml'), 'rb') as fin:
+                self.assertEqual(fin.read(), self.RAW, 'raw document not written as is')
+            with open(os.path.join(path, '2.xml')) as fin:
+                self.assertIn('<maxlimit>', fin.read())
+
+    def test_stream(self):
+        stream = io.StringIO()
+        exporter = StreamExporter(stream, loop=self.loop)
+        self.loop_until_complete(exporter.dump(1, make_flow([1], raw=self.RAW)))
+        self.assertEqual(stream.getvalue(), self.RAW.decode() + '\n')
+
+
+class TestCompression(Test):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def export(self, compress, cids):
+        exporter = FileExporter(self.dir.name, compress=compress, loop=self.loop)
+        exporter.DICT_SAMPLES = 8
+        self.loop_until_complete(exporter._open_connection())
+        for cid in cids:
+            self.loop_until_complete(exporter.dump(cid, make_flow([cid, cid + 1], 500)))
+        self.loop_until_complete(exporter.disconnect())
+
+    def read(self, filename):
+        with open_exported(os.path.join(self.dir.name, filename)) as fin:
+            return fin.read()
+
+    def test_gzip(self):
+        self.export('gzip', [1])
+        with open(os.path.join(self.dir.name, '1.xml.gz'), 'rb') as fin:
+            self.assertEqual(fin.read(2), b'\x1f\x8b')
+        self.assertIn(b'<maxlimit>500</maxlimit>', self.read('1.xml.gz'))
+
+    def test_plain(self):
+        self.export(None, [1])
+        self.assertIn(b'<maxlimit>500</maxlimit>', self.read('1.xml'))
+
+    @unittest.skipIf(zstandard is None, 'zstandard is not installed')
+    def test_zstd(self):
+        self.export('zstd', range(1, 20))
+        self.assertTrue(os.path.exists(os.path.join(self.dir.name, FileExporter.DICTIONARY)))
+        for cid in range(1, 20):
+            expected = XmlSerializer().serialize(make_flow([cid, cid + 1], 500).get_latest())
+            self.assertEqual(self.read('{}.xml.zst'.format(cid)), expected)
+
+    @unittest.skipIf(zstandard is None, 'zstandard is not installed')
+    def test_zstd_write_while_training(self):
+        exporter = FileExporter(self.dir.name, compress='zstd', max_threads=8, loop=self.loop)
+        exporter.DICT_SAMPLES = 8
+        training, trained = threading.Event(), threading.Event()
+        train_dictionary = zstandard.train_dictionary
+
+        def slow_train(*args, **kwargs):
+            training.set()
+            trained.wait(5)
+            return train_dictionary(*args, **kwargs)
+
+        def dump(cid):
+            return asyncio.ensure_future(exporter.dump(cid, make_flow([cid, cid + 1], 500)))
+
+        async def run():
+            samples = [dump(cid) for cid in range(1, 9)]
+            await self.loop.run_in_executor(None, training.wait, 5)
+            # Written during training, which must not go without the dictionary
+            late = [dump(cid) for cid in range(9, 13)]
+            await asyncio.sleep(0.05)
+            trained.set()
+            await asyncio.gather(*(samples + late))
+
+        self.loop_until_complete(exporter._open_connection())
+        with mock.patch.object(zstandard, 'train_dictionary', slow_train):
+            self.loop_until_complete(run())
+        self.loop_until_complete(exporter.disconnect())
+        for cid in range(1, 13):
+            with open(os.path.join(self.dir.name, '{}.xml.zst'.format(cid)), 'rb') as fin:
+                self.assertNotEqual(zstandard.get_frame_parameters(fin.read()).dict_id, 0, cid)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            FileExporter(self.dir.name, compress='lzma', loop=self.loop)
+
+
+class TestLineExporter(Test):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def read(self, filename):
+        with open(os.path.join(self.dir.name, filename), encoding='utf-8') as fin:
+            return fin.read()
+
+    def test_jsonl(self):
+        exporter = JsonLinesExporter(self.dir.name, rotate_size=1, loop=self.loop)
+        self.loop_until_complete(exporter._open_connection())
+        self.loop_until_complete(exporter.dump(7, make_flow([{'id': 1, 'user': 'ab'}, 2])))
+        exporter.flush()
+        self.loop_until_complete(exporter.dump(8, make_flow([3])))
+        self.loop_until_complete(exporter.disconnect())
+        self.assertEqual(sorted(os.listdir(self.dir.name)),
+                         ['comments-00000.jsonl', 'comments-00001.jsonl'], 'file not rotated')
+        records = [json.loads(line) for line in self.read('comments-00000.jsonl').splitlines()]
+        self.assertEqual(records[0], {'cid': 7, 'id': 1, 'date': 1, 'offset': 0.0, 'mode': 0, 'size': 0,
+                                      'color': 0, 'pool': 0, 'user': 'ab', 'text': records[0]['text']})
+        self.assertEqual([record['id'] for record in records], [1, 2])
+        self.assertEqual(json.loads(self.read('comments-00001.jsonl'))['cid'], 8)
+
+        exporter = JsonLinesExporter(self.dir.name, loop=self.loop)
+        self.loop_until_complete(exporter._open_connection())
+        self.loop_until_complete(exporter.disconnect())
+        self.assertIn('comments-00002.jsonl', os.listdir(self.dir.name), 'old file overwritten')
+
+    def test_csv_stdout(self):
+        stdout = io.StringIO()
+        with mock.patch('sys.stdout', stdout):
+            exporter = CsvExporter('-', loop=self.loop)
+            self.loop_until_complete(exporter._open_connection())
+            self.loop_until_complete(exporter.dump(7, make_flow([{'id': 1, 'user': 'ab'}])))
+            self.assertEqual(stdout.getvalue().count('\n'), 1, 'lines not buffered')
+            self.loop_until_complete(exporter.disconnect())
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(lines[0], ','.join(CsvExporter.FIELDS))
+        self.assertTrue(lines[1].startswith('7,1,1,0.0,0,0,0,0,ab,'))
+
+    def test_flush_interval(self):
+        exporter = JsonLinesExporter(self.dir.name, flush_interval=0.01, loop=self.loop)
+        self.loop_until_complete(exporter._open_connection())
+        self.loop_until_complete(exporter.dump(7, make_flow([1])))
+        self.loop_until_complete(asyncio.sleep(0.05))
+        exporter._stream.flush()
+        self.assertEqual(len(self.read('comments-00000.jsonl').splitlines()), 1)
+        self.loop_until_complete(exporter.disconnect())
+
+
+class TestSqliteExporter(Test):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.exporter = SqliteExporter(self.dir.name, loop=self.loop)
+        self.loop_until_complete(self.exporter._open_connection())
+
+    def tearDown(self):
+        self.loop_until_complete(self.exporter.disconnect())
+        self.dir.cleanup()
+
+    def query(self, sql):
+        self.loop_until_complete(self.exporter.disconnect())
+        conn = sqlite3.connect(os.path.join(self.dir.name, 'cmtdb.sqlite'))
+        try:
+            return conn.execute(sql).fetchall()
+        finally:
+            conn.close()
+
+    def test_dump(self):
+        self.gather(*(self.exporter.dump(cid, make_flow([1, 2, {'id': 3, 'pool': 2}], 500))
+                      for cid in range(1, 6)))
+        self.loop_until_complete(self.exporter.dump(6, make_flow([2, 4])))
+        self.assertEqual(self.query('SELECT chat_id, chat_max_limit FROM chatmetadata'),
+                         [(cid, 500) for cid in range(1, 6)] + [(6, 0)])
+        self.assertEqual(self.query('SELECT cmt_id, chat_id FROM comments ORDER BY cmt_id'),
+                         [(1, 1), (2, 1), (4, 6)], 'comments not deduplicated')
+        self.assertEqual(self.query('SELECT cmt_id FROM specialcomments'), [(3,)])
+        self.assertIn('cmt_foreign_cid_idx', [index[1] for index in self.query(
+            'PRAGMA index_list(comments)')], 'index not created')
+
+    def test_dump_batch_failure(self):
+        broken = mock.Mock(get_latest=mock.Mock(side_effect=ValueError('broken')))
+        items = [(1, make_flow([1]), None), (2, broken, None), (3, make_flow([3]), None)]
+        errors = self.loop_until_complete(self.exporter.dump_batch(items))
+        self.assertEqual([cid for cid, _ in errors], [2])
+        with self.assertRaises(ValueError):
+            self.loop_until_complete(self.exporter.dump(2, broken))
+        self.loop_until_complete(self.exporter.dump(4, make_flow([4])))
+        self.assertEqual(self.query('SELECT cmt_id, chat_id FROM comments ORDER BY cmt_id'),
+                         [(1, 1), (3, 3), (4, 4)])
+
+
+class StubMysqlPool:
+    """Stands in for an aiomysql pool, recording the statements executed."""
+
+    def __init__(self, max_packet):
+        self.statements = []
+        self.max_packet = max_packet
+        self.lost = 0
+        self.failing = None
+
+    def acquire(self):
+        return StubMysqlConnection(self)
+
+
+class StubMysqlConnection:
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.result = None
+        self.rowcount = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+    def cursor(self):
+        return self
+
+    async def execute(self, statement):
+        if self.pool.lost:
+            self.pool.lost -= 1
+            raise ConnectionError(2013, 'Lost connection to MySQL server during query')
+        if self.pool.failing is not None and self.pool.failing in statement:
+            raise RuntimeError(1406, 'Data too long')
+        self.pool.statements.append(statement)
+        self.result = [(self.pool.max_packet,)] if 'max_allowed_packet' in statement else []
+        self.rowcount = statement.count('),(') + 1 if 'VALUES' in statement else 0
+
+    async def fetchall(self):
+        return self.result
+
+
+class TestMysqlExporter(Test):
+
+    def setUp(self):
+        self.exporter = MysqlExporter({}, buffer_size=1, max_rows=5, loop=self.loop)
+        self.pool = self.exporter._pool = StubMysqlPool(2000)
+        self.loop_until_complete(self.exporter._setup())
+
+    def inserts(self, table):
+        prefix = 'INSERT IGNORE INTO {} '.format(table)
+        return [statement for statement in self.pool.statements if statement.startswith(prefix)]
+
+    def test_dump(self):
+        self.exporter.buffer_size = 10 ** 6
+        cmts = [{'id': i, 'user': "D'1"} for i in range(1, 40)] + [{'id': 40, 'pool': 2}]
+        self.pool.lost = 1
+        self.loop_until_complete(self.exporter.dump(1, make_flow(cmts)))
+
+        inserts = self.inserts('comments')
+        self.assertGreater(len(inserts), 1, 'rows not split by max_allowed_packet')
+        for statement in inserts:
+            self.assertLessEqual(len(statement.encode()), 2000)
+        self.assertEqual(sum(statement.count('FROM_UNIXTIME') for statement in inserts), 39)
+        self.assertIn("'D\\'1'", inserts[0], 'string not escaped')
+        self.assertEqual(len(self.inserts('specialcomments')), 1)
+
+    def test_rotate(self):
+        for cid in range(1, 4):
+            self.loop_until_complete(self.exporter.dump(cid, make_flow([cid * 10, cid * 10 + 1])))
+        self.assertEqual(self.exporter.table, 'comments_1')
+        self.assertIn('CREATE TABLE IF NOT EXISTS comments_1 LIKE comments', self.pool.statements)
+        self.assertEqual(len(self.inserts('comments_1')), 0)
+
+    def test_dump_batch_failure(self):
+        self.exporter.buffer_size = 10 ** 6
+        self.pool.failing = "(3,'',"
+        items = [(cid, make_flow([cid * 10]), None) for cid in range(1, 4)]
+        errors = self.loop_until_complete(self.exporter.dump_batch(items))
+        self.assertEqual([cid for cid, _ in errors], [1, 2, 3], 'CIDs of a failed flush not reported')
+
+        # Flushed one by one, only the CID failed is reported, and the error is not raised again
+        self.exporter.buffer_size = 1
+        errors = self.loop_until_complete(self.exporter.dump_batch(items))
+        self.assertEqual([cid for cid, _ in errors], [3])
+        self.pool.failing = None
+        self.loop_until_complete(self.exporter.dump(4, make_flow([40])))
@@ -0,0 +1,68 @@
+import unittest
+import logging
+import random
+
+from dscraper.intervals import IntervalSet
+
+logger = logging.getLogger(__name__)
+
+
+class TestIntervalSet(unittest.TestCase):
+
+    def test_sequential(self):
+        iset = IntervalSet(range(1, 1001))
+        self.assertEqual(list(iset.intervals()), [(1, 1000)])
+        self.assertEqual(len(iset), 1000)
+
+    def test_merge(self):
+        iset = IntervalSet([1, 3, 5, 7, 20])
+        iset.add_range(2, 6)
+        self.assertEqual(str(iset), '1-7, 20')
+        iset.add_range(9, 10)
+        iset.add(8)
+        iset.add_range(15, 16)
+        self.assertEqual(str(iset), '1-10, 15-16, 20')
+        iset.add_range(0, 30)
+        self.assertEqual(str(iset), '0-30')
+        self.assertEqual(len(iset), 31)
+
+    def test_discard(self):
+        iset = IntervalSet.from_intervals([(1, 10), (20, 30), (40, 50)])
+        iset.discard_range(5, 25)
+        self.assertEqual(str(iset), '1-4, 26-30, 40-50')
+        iset.discard(45)
+        iset.discard(100)
+        iset.difference_update(IntervalSet([1, 2, 30]))
+        self.assertEqual(str(iset), '3-4, 26-29, 40-44, 46-50')
+        self.assertEqual(len(iset), 2 + 4 + 5 + 5)
+        iset.discard_range(0, 100)
+        self.assertEqual(len(iset), 0)
+        self.assertEqual(list(iset.intervals()), [])
+
+    def test_random(self):
+        rand = random.Random(0)
+        items = [rand.randrange(500) for _ in range(1000)]
+        iset = IntervalSet(items)
+        self.assertEqual(list(iset), sorted(set(items)))
+        self.assertEqual(len(iset), len(set(items)))
+        for item in range(-1, 501):
+            self.assertEqual(item in iset, item in items)
+
+    def test_serialize(self):
+        iset = IntervalSet([5, 1, 2, 3, 9])
+        self.assertEqual(IntervalSet.from_intervals(iset.intervals()), iset)
+        self.assertEqual(str(iset), '1-3, 5, 9')
+        self.assertEqual(str(IntervalSet()), '')
+
+    def test_head(self):
+        iset = IntervalSet([5, 1, 2, 3, 9])
+        self.assertEqual(str(iset.head(4)), '1-3, 5')
+        self.assertEqual(str(iset.head(2)), '1-2')
+        self.assertIs(iset.head(), iset)
+        self.assertIs(iset.head(5), iset)
+
+    def test_to_string(self):
+        iset = IntervalSet([1, 2, 3, 5, 9])
+        self.assertEqual(iset.to_string(2), '1-3, 5, ...')
+        self.assertEqual(iset.to_string(3), '1-3, 5, 9')
+        self.assertEqual(iset.to_string(), str(iset))
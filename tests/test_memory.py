@@ -0,0 +1,67 @@
+import logging
+from dscraper.memory import MemoryTracker
+from dscraper.exceptions import MemoryBudgetExceeded
+
+from .utils import Test
+
+logger = logging.getLogger(__name__)
+
+
+class TestMemoryTracker(Test):
+
+    def setUp(self):
+        self.memory = MemoryTracker()
+
+    def tearDown(self):
+        self.memory.disable()
+
+    def allocate(self, cid, size):
+        with self.memory.section(cid):
+            data = bytearray(size)
+        self.kept.append(data)
+
+    def test_disabled(self):
+        self.kept = []
+        self.allocate(1, 2 ** 20)
+        self.memory.count(1, 1, 10)
+        self.memory.check(1)
+        self.memory.finish(1)
+        self.assertNotIn('Largest', self.memory.stat())
+
+    def test_account(self):
+        self.memory.enable()
+        self.kept = []
+        self.allocate(1, 2 ** 20)
+        self.allocate(2, 3 * 2 ** 20)
+        self.allocate(1, 2 ** 20)
+        self.memory.count(1, 2, 100)
+        self.memory.finish(1)
+        self.memory.finish(2)
+        stats = self.memory.stat().split('\n')
+        self.assertEqual(stats[4].split(':')[0].strip(), '2')
+        self.assertTrue(stats[5].startswith('  1: 2.0MB, 2, 100'), stats[5])
+
+    def test_release(self):
+        self.memory.enable()
+        self.kept = []
+        self.allocate(1, 2 ** 20)
+        with self.memory.section(1):
+            self.kept.clear()
+        self.allocate(1, 2 ** 19)
+        self.memory.finish(1)
+        self.assertIn('  1: 1.0MB', self.memory.stat())
+
+    def test_budget(self):
+        self.memory.enable(2 ** 20)
+        self.kept = []
+        self.allocate(1, 2 * 2 ** 20)
+        with self.assertLogs('dscraper.memory', logging.WARNING):
+            self.memory.check(1)
+        self.memory.check(1)  # warned once
+        self.memory.enable(2 ** 20, abort=True)
+        self.allocate(2, 2 ** 19)
+        self.memory.check(2)
+        self.allocate(2, 2 ** 20)
+        with self.assertRaises(MemoryBudgetExceeded):
+            self.memory.check(2)
+        self.assertIn('CIDs over the budget of 1.0MB: 1', self.memory.stat())
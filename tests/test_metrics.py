@@ -0,0 +1,73 @@
+import logging
+import asyncio
+from dscraper.scraper import Scraper, BlockingDistributor
+from dscraper.exceptions import Scavenger, ReadTimeout
+from dscraper.exporter import StreamExporter
+from dscraper.metrics import MetricsServer
+from dscraper.tracing import tracer
+
+from .utils import Test
+
+logger = logging.getLogger(__name__)
+
+
+class DummyCompany:
+
+    def __init__(self, distributor, scavenger):
+        self.distributor, self.scavenger = distributor, scavenger
+        self.max_workers = 2
+
+    def get_worker_count(self):
+        return self.max_workers
+
+    def is_busy(self):
+        return False
+
+
+class TestMetrics(Test):
+
+    def setUp(self):
+        self.scraper = Scraper(StreamExporter(loop=self.loop), loop=self.loop)
+        distributor = BlockingDistributor(loop=self.loop)
+        distributor.post(range(1, 11))
+        scavenger = Scavenger(retry=distributor.retry)
+        self.scraper.companies.append(DummyCompany(distributor, scavenger))
+        self.loop_until_complete(distributor.claim())
+        scavenger._fail(1, ReadTimeout('timed out'))
+        tracer.enable()
+        tracer.count('requests', 3)
+        tracer.record('parse', 0.01)
+        tracer.record('parse', 0.5)
+
+    def tearDown(self):
+        tracer.disable()
+        tracer.reset()
+
+    def test_render(self):
+        lines = MetricsServer(self.scraper).render().split('\n')
+        self.assertIn('dscraper_requests_total 3', lines)
+        self.assertIn('dscraper_errors_total{class="ReadTimeout"} 1', lines)
+        self.assertIn('dscraper_backlog{company="DummyCompany"} 9', lines)
+        self.assertIn('dscraper_retry_backlog{company="DummyCompany"} 1', lines)
+        self.assertIn('dscraper_export_queue_depth 0', lines)
+        self.assertIn('dscraper_stage_seconds_bucket{stage="parse",le="+Inf"} 2', lines)
+        self.assertIn('dscraper_stage_seconds_count{stage="parse"} 2', lines)
+        buckets = [line for line in lines if line.startswith('dscraper_stage_seconds_bucket')]
+        self.assertEqual([line.rsplit(' ', 1)[1] for line in buckets], ['1', '2', '2'])
+
+    def test_serve(self):
+        server = MetricsServer(self.scraper, port=0)
+
+        async def scrape():
+            await server.start()
+            try:
+                reader, writer = await asyncio.open_connection(server.host, server.port)
+                writer.write(b'GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n')
+                response = await reader.read()
+                writer.close()
+                return response
+            finally:
+                await server.close()
+        head, body = self.loop_until_complete(scrape()).split(b'\r\n\r\n', 1)
+        self.assertTrue(head.startswith(b'HTTP/1.0 200 OK'))
+        self.assertIn(b'dscraper_requests_total 3\n', body)
@@ -0,0 +1,63 @@
+import logging
+import asyncio
+import os
+import tempfile
+import time
+from dscraper.company import BaseWorker
+from dscraper.profiler import SamplingProfiler
+
+from .utils import Test
+
+logger = logging.getLogger(__name__)
+
+
+class BusyWorker(BaseWorker):
+
+    def __init__(self, item):
+        super().__init__(exporter=None, distributor=None, scavenger=None, fetcher=None)
+        self.item = item
+
+    async def _next(self, item):
+        self._digest()
+        await asyncio.sleep(0.1)
+
+    @staticmethod
+    def _digest():
+        end = time.perf_counter() + 0.2
+        while time.perf_counter() < end:
+            pass
+
+
+class TestSamplingProfiler(Test):
+
+    def test_profile(self):
+        with tempfile.TemporaryDirectory() as path:
+            profiler = SamplingProfiler(os.path.join(path, 'profile.txt'), 200, loop=self.loop)
+
+            async def run():
+                profiler.start()
+                try:
+                    await BusyWorker(7)._next(7)
+                finally:
+                    profiler.stop()
+            self.loop_until_complete(run())
+            profiler.write()
+            with open(profiler.path) as fin:
+                lines = fin.read().splitlines()
+
+        counts = {}
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            counts[stack] = int(count)
+        self.assertEqual(sum(counts.values()), profiler.samples)
+        digest = [stack for stack in counts if stack.startswith('digest;')]
+        self.assertEqual(len(digest), 1)
+        self.assertTrue(digest[0].endswith(
+            'test_profiler.py:_next;test_profiler.py:_digest'), digest[0])
+        idle = sum(count for stack, count in counts.items() if stack.startswith('idle;'))
+        self.assertGreater(idle, 0)
+        self.assertGreater(counts[digest[0]], idle / 2)
+        self.assertEqual(list(profiler.cids), [7])
+        stats = profiler.stat()
+        self.assertIn('test_profiler.py:_digest', stats)
+        self.assertIn('Hottest CIDs: 7', stats)
@@ -1,17 +1,55 @@
 import logging
 import asyncio
 import dscraper
-from dscraper.exceptions import Scavenger
+from dscraper.exceptions import Scavenger, ReadTimeout, ContentError, PageNotFound
 
 from .utils import Test
 
 logger = logging.getLogger(__name__)
 
 
+class DummyWorker:
+
+    def __init__(self, item):
+        self.item = item
+
+
 class TestScavenger(Test):
 
     def setUp(self):
-        self.s = Scavenger()
+        self.retried = []
+        self.s = Scavenger(retry=self.retry)
+
+    def retry(self, item):
+        self.retried.append(item)
+        return len(self.retried) < 2
 
     def test_failures(self):
-        pass
+        self.s.failure(DummyWorker(1), ContentError('empty'))
+        self.s.failure(DummyWorker(2), PageNotFound('404'))
+        self.s.failure(DummyWorker(4), ValueError('unexpected'))
+        self.assertEqual(list(self.s.get_failures()), [4])
+        self.assertEqual(str(self.s.get_dead()), '1-2')
+        self.assertEqual(self.s.get_success_count(), 2)
+        self.assertFalse(self.retried, 'permanent failures retried')
+
+    def test_success(self):
+        for item in (1, 2, 4):
+            self.s.success(item)
+        self.s.failure(DummyWorker(3), PageNotFound('404'))
+        self.assertEqual(str(self.s.get_done()), '1-2, 4')
+        self.assertEqual(str(self.s.get_not_found()), '3')
+        self.assertEqual(self.s.get_success_count(), 4)
+
+    def test_retry(self):
+        self.s.failure(DummyWorker(3), ReadTimeout('timeout'))
+        self.assertEqual(list(self.s.get_failures()), [], 'retried item recorded as failure')
+        self.s.failure(DummyWorker(3), ReadTimeout('timeout'))
+        self.assertEqual(list(self.s.get_failures()), [3], 'item out of retries not recorded')
+        self.assertEqual(self.retried, [3, 3])
+
+    def test_export_failure(self):
+        self.s.success(5)
+        self.s.export_failure(5, OSError('disk full'))
+        self.assertEqual(list(self.s.get_done()), [])
+        self.assertEqual(list(self.s.get_failures()), [5])
@@ -0,0 +1,67 @@
+import logging
+import asyncio
+import unittest
+from benchmarks.simulation import VirtualTimeLoop, ModeledHost, SimulatedWorker
+from dscraper.exceptions import NoResponseReadError, PageNotFound
+
+logger = logging.getLogger(__name__)
+
+
+class TestSimulation(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = VirtualTimeLoop(start=1500000000)
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_virtual_time(self):
+        async def sleep():
+            await asyncio.gather(asyncio.sleep(3600), asyncio.sleep(86400))
+        self.loop.run_until_complete(sleep())
+        self.assertEqual(self.loop.time(), 86400)
+        self.assertEqual(self.loop.wall_time(), 1500086400)
+
+    def test_cids(self):
+        host = ModeledHost(missing=0.3, comments=300, loop=self.loop)
+        sizes = [host.get_cid(cid) for cid in range(1, 10001)]
+        self.assertEqual(sizes, [host.get_cid(cid) for cid in range(1, 10001)])
+        missing = sizes.count(None)
+        self.assertTrue(2700 < missing < 3300, missing)
+        comments = sorted(size[0] for size in sizes if size is not None)
+        self.assertTrue(250 < comments[len(comments) // 2] < 350, comments[len(comments) // 2])
+        self.assertEqual(set(size[1] for size in sizes if size is not None), set(host.maxlimits))
+
+    def test_rate_limit(self):
+        host = ModeledHost(error_rate=0, timeout_rate=0, rate_limit=1, burst=5, ban_after=3,
+                           ban_time=100, loop=self.loop)
+
+        async def request():
+            try:
+                await host.request(100)
+            except NoResponseReadError:
+                return False
+            return True
+        results = self.loop.run_until_complete(asyncio.gather(*[request() for _ in range(8)]))
+        self.assertEqual(results, [True] * 5 + [False] * 3)
+        self.assertEqual(host.bans, 1)
+        self.assertTrue(host.is_banned())
+        self.loop.run_until_complete(asyncio.sleep(100))
+        self.assertTrue(self.loop.run_until_complete(request()))
+
+    def test_worker(self):
+        host = ModeledHost(error_rate=0, timeout_rate=0, busy_factor=1, missing=0.3, loop=self.loop)
+        worker = SimulatedWorker(distributor=None, scavenger=None, exporter=None, host=host,
+                                 history=True, cpu_per_comment=1e-3, loop=self.loop)
+        cid = next(cid for cid in range(1, 1000)
+                   if host.get_cid(cid) is not None and host.get_cid(cid)[0] > host.get_cid(cid)[1] * 3)
+        comments, maxlimit = host.get_cid(cid)
+        self.assertEqual(self.loop.run_until_complete(worker._next(cid)), comments)
+        pages = min(-(-comments // maxlimit), host.max_roll_dates + 1)
+        self.assertEqual(host.stats['requests'], pages + 1)
+        self.assertGreaterEqual(self.loop.time(), pages * maxlimit * 1e-3)
+
+        missing = next(cid for cid in range(1, 1000) if host.get_cid(cid) is None)
+        with self.assertRaises(PageNotFound):
+            self.loop.run_until_complete(worker._next(missing))
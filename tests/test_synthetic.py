@@ -0,0 +1,30 @@
+import logging
+from benchmarks.synthetic import SyntheticCid, SyntheticFetcher, NORMAL, PROTECTED, TITLE, CODE
+from dscraper.company import CommentWorker
+
+from .utils import Test
+
+logger = logging.getLogger(__name__)
+
+
+class TestSyntheticCid(Test):
+
+    def test_scrape(self):
+        cid = SyntheticCid(5, comments=3000, maxlimit=300, roll_dates=30, protected=0.02,
+                           title=0.01, code=0.01, invalid=0.1)
+        worker = CommentWorker(distributor=None, scavenger=None, exporter=None, history=True,
+                               loop=self.loop, time_range=(None, None))
+        worker.fetcher = SyntheticFetcher({5: cid})
+        flow = self.loop_until_complete(worker._next(5))
+        self.assertTrue(flow.can_split())
+        self.assertEqual([len(f) for f in flow.flows],
+                         [len(cid.pools[kind]) for kind in (NORMAL, PROTECTED, TITLE, CODE)])
+        ids = [cmt.attrib['id'] for cmt in flow.flows[0]]
+        self.assertEqual(ids, sorted(ids))
+
+    def test_invalid(self):
+        cid = SyntheticCid(comments=100, maxlimit=1000, roll_dates=0, invalid=1)
+        self.assertEqual(cid.pages(), [(0, cid.page())])
+        root, raw = self.loop_until_complete(SyntheticFetcher({1: cid}).get_comments(1))
+        self.assertEqual(len(root.findall('d')), 100)
+        self.assertIsNone(raw, 'invalid characters not escaped')
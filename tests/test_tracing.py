@@ -0,0 +1,68 @@
+import logging
+import json
+import os
+import tempfile
+from dscraper.tracing import Tracer, Histogram
+
+from .utils import Test
+
+logger = logging.getLogger(__name__)
+
+
+class TestHistogram(Test):
+
+    def test_percentile(self):
+        histogram = Histogram()
+        for ms in range(1, 101):
+            histogram.add(ms / 1000)
+        self.assertEqual(histogram.count, 100)
+        self.assertAlmostEqual(histogram.max, 0.1)
+        for q, expected in ((50, 0.05), (95, 0.095), (99, 0.099)):
+            self.assertLessEqual(abs(histogram.percentile(q) - expected) / expected, 0.19)
+        self.assertEqual(histogram.percentile(100), 0.1)
+        self.assertEqual(list(histogram.buckets())[-1][1], 100)
+
+    def test_empty(self):
+        self.assertEqual(Histogram().percentile(50), 0)
+
+
+class TestTracer(Test):
+
+    def setUp(self):
+        self.tracer = Tracer()
+
+    def test_disabled(self):
+        with self.tracer.span('parse'):
+            pass
+        self.tracer.record('ttfb', 1)
+        self.tracer.count('cids')
+        self.assertFalse(self.tracer.histograms)
+        self.assertFalse(self.tracer.counters)
+
+    def test_stat(self):
+        self.tracer.enable()
+        with self.tracer.span('parse'):
+            pass
+        self.tracer.record('ttfb', 0.02)
+        self.tracer.record('custom', 0.5)
+        self.tracer.count('cids', 3)
+        self.tracer.count('bytes_in', 2 ** 20)
+        self.tracer.disable()
+        stats = self.tracer.stat().split('\n')
+        self.assertEqual([line.split(':')[0] for line in stats[2:-1]], ['ttfb', 'parse', 'custom'])
+        self.assertTrue(stats[2].endswith('/ 20.0ms, 1'))
+        self.assertTrue(stats[-1].startswith('Throughput: '))
+
+    def test_trace(self):
+        with tempfile.TemporaryDirectory() as path:
+            trace = os.path.join(path, 'trace.json')
+            self.tracer.enable(trace)
+
+            async def work():
+                with self.tracer.span('scrape'):
+                    pass
+            self.loop_until_complete(work())
+            self.tracer.write_trace()
+            with open(trace) as fin:
+                events = json.load(fin)['traceEvents']
+        self.assertEqual([(event['name'], event['ph']) for event in events], [('scrape', 'X')])
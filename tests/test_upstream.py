@@ -0,0 +1,81 @@
+import logging
+import asyncio
+from benchmarks.synthetic import SyntheticCid, parse
+from benchmarks.upstream import SimulatedHost
+from dscraper.company import CommentWorker
+from dscraper.fetcher import Session
+
+from .utils import Test
+
+logger = logging.getLogger(__name__)
+
+
+class TestSimulatedHost(Test):
+
+    def setUp(self):
+        self.pool = [SyntheticCid(0, comments=50, roll_dates=2), SyntheticCid(1, comments=80, roll_dates=3)]
+
+    def request(self, host, *uris):
+        async def get():
+            reader, writer = await asyncio.open_connection(*host.address)
+            responses = []
+            try:
+                for uri in uris:
+                    writer.write('GET {} HTTP/1.1\r\nHost:localhost\r\n\r\n'.format(uri).encode())
+                    head = await reader.readuntil(b'\r\n\r\n')
+                    if not head:
+                        break
+                    length = int(head.split(b'Content-Length: ')[1].split(b'\r\n')[0])
+                    responses.append((int(head.split()[1]), await reader.readexactly(length)))
+            except asyncio.IncompleteReadError:
+                pass
+            finally:
+                writer.close()
+            return responses
+
+        async def serve():
+            async with host:
+                return await get()
+        return self.loop_until_complete(serve())
+
+    def test_respond(self):
+        host = SimulatedHost(self.pool, rtt=0, loop=self.loop)
+        responses = self.request(host, '/3.xml', '/rolldate,4',
+                                 '/dmroll,{},4'.format(self.pool[0].roll_dates[0]), '/x')
+        self.assertEqual([status for status, _ in responses], [200, 200, 200, 400])
+        root, _ = parse(Session._inflate(responses[0][1]))
+        self.assertEqual(len(root.findall('d')), 80)
+        self.assertIn(str(self.pool[0].roll_dates[-1]).encode(), Session._inflate(responses[1][1]))
+        self.assertEqual(Session._inflate(responses[2][1]), self.pool[0].page(self.pool[0].roll_dates[0]))
+        self.assertEqual(host.stats['requests'], 4)
+        self.assertEqual(host.stats['connections'], 1)
+
+    def test_missing(self):
+        host = SimulatedHost(self.pool, rtt=0, missing=0.3, loop=self.loop)
+        missing = [cid for cid in range(1, 1001) if host.respond('/{}.xml'.format(cid))[0] == 404]
+        self.assertTrue(200 < len(missing) < 400, len(missing))
+        self.assertEqual(missing, [cid for cid in range(1, 1001) if host._is_missing(cid)])
+
+    def test_errors(self):
+        host = SimulatedHost(self.pool, rtt=0, error_rate=1, loop=self.loop)
+        self.assertEqual(self.request(host, '/1.xml'), [])
+        self.assertEqual(host.stats['dropped'], 1)
+
+    def test_rate_limit(self):
+        host = SimulatedHost(self.pool, rtt=0, rate_limit=1, burst=3, loop=self.loop)
+        responses = self.request(host, *['/1.xml'] * 5)
+        self.assertEqual(len(responses), 3)
+        self.assertEqual(host.stats['throttled'], 1)
+
+    def test_bandwidth(self):
+        host = SimulatedHost(self.pool, rtt=0, bandwidth=10 ** 5, loop=self.loop)
+        size = len(host.respond('/1.xml')[1])
+        start = self.loop.time()
+        self.request(host, '/1.xml', '/1.xml')
+        self.assertGreaterEqual(self.loop.time() - start, size * 2 / 10 ** 5)
+
+    def test_address(self):
+        worker = CommentWorker(distributor=None, scavenger=None, exporter=None, history=True,
+                               loop=self.loop, time_range=(None, None), address=('127.0.0.1', 8080))
+        session = worker.fetcher._session
+        self.assertEqual((session.host, session.port), ('127.0.0.1', 8080))
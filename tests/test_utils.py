@@ -1,5 +1,10 @@
 import unittest
 import logging
+import asyncio
+import os
+import gzip
+import tempfile
+import itertools
 import xml.etree.ElementTree as et
 
 import dscraper.utils as utils
@@ -15,3 +20,57 @@ class TestUtils(unittest.TestCase):
     def setUp(self):
         pass
 
+
+class TestTargetFile(unittest.TestCase):
+
+    TEXT = b'3\n\n10-12  # a range\n# comment\nbad\n0\n7\n'
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def make_file(self, name, data):
+        path = os.path.join(self.dir.name, name)
+        with open(path, 'wb') as fout:
+            fout.write(data)
+        return path
+
+    def test_plain(self):
+        targets = utils.TargetFile(self.make_file('targets.txt', self.TEXT))
+        self.assertEqual(list(targets), [3, 10, 11, 12, 7])
+        self.assertEqual(len(targets), 5, 'incorrect estimation')
+
+    def test_count(self):
+        cases = [
+            (b'1\n2\n\n5\nbad\n0\n9\n', 4),
+            (b'1-5\n3-7\n7\n', 7),
+            (b'5\n1\n5\n', 2),
+        ]
+        for data, expected in cases:
+            targets = utils.TargetFile(self.make_file('targets.txt', data))
+            self.assertEqual(len(targets), expected, data)
+            self.assertEqual(len(set(targets)), expected, data)
+
+    def test_async(self):
+        async def collect(targets):
+            return [cid async for cid in targets]
+
+        loop = asyncio.new_event_loop()
+        try:
+            targets = utils.TargetFile(self.make_file('targets.txt', self.TEXT))
+            self.assertEqual(loop.run_until_complete(collect(targets)), [3, 10, 11, 12, 7])
+        finally:
+            loop.close()
+
+    def test_gzip(self):
+        targets = utils.TargetFile(self.make_file('targets.gz', gzip.compress(self.TEXT)))
+        self.assertEqual(list(targets), [3, 10, 11, 12, 7])
+        with self.assertRaises(TypeError):
+            len(targets)
+
+    def test_lazy(self):
+        path = self.make_file('targets.txt', b'\n'.join(str(i).encode() for i in range(1, 1001)))
+        it = iter(utils.TargetFile(path))
+        self.assertEqual(list(itertools.islice(it, 3)), [1, 2, 3])
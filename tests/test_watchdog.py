@@ -0,0 +1,55 @@
+import logging
+import asyncio
+import time
+from dscraper.company import BaseWorker
+from dscraper.watchdog import LagMonitor
+
+from .utils import Test
+
+logger = logging.getLogger(__name__)
+
+
+class BlockingWorker(BaseWorker):
+
+    def __init__(self, item):
+        super().__init__(exporter=None, distributor=None, scavenger=None, fetcher=None)
+        self.item = item
+
+    async def _next(self, item):
+        self.block()
+
+    @staticmethod
+    def block():
+        time.sleep(0.15)
+
+
+class TestLagMonitor(Test):
+
+    def monitor(self, coro):
+        monitor = LagMonitor(0.05, loop=self.loop)
+
+        async def run():
+            monitor.start()
+            try:
+                await asyncio.sleep(0.06)
+                await coro
+                await asyncio.sleep(0.06)
+            finally:
+                monitor.stop()
+        self.loop_until_complete(run())
+        return monitor
+
+    def test_blame(self):
+        monitor = self.monitor(BlockingWorker(42)._next(42))
+        self.assertGreaterEqual(monitor.max_lag, 0.1)
+        stack, (count, total, max_lag, cids) = max(monitor.stalls.items(), key=lambda x: x[1][1])
+        self.assertEqual(cids, [42])
+        self.assertEqual(stack[-1][2], 'block')
+        stats = monitor.stat()
+        self.assertIn('at CID 42', stats)
+        self.assertIn('in block', stats)
+
+    def test_idle(self):
+        monitor = self.monitor(asyncio.sleep(0.1))
+        self.assertFalse(monitor.stalls)
+        self.assertLess(monitor.max_lag, 0.05)